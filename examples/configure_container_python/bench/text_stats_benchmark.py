@@ -0,0 +1,92 @@
+"""
+Compares the row by row character counting that these metrics used to do with the vectorized counts in whylogs_config.text_stats, for
+different batch sizes and text lengths. Then compares a separate metric per character class with the fused text_stats_metric.
+
+    poetry run python -m bench.text_stats_benchmark
+"""
+
+import argparse
+import random
+import statistics
+import string
+import time
+from typing import Callable, List
+
+import pandas as pd
+
+from langkit.core.metric import MetricCreator, SingleMetric, SingleMetricResult
+from whylogs_config.text_stats import CHAR_CLASSES, char_count_metric, text_stats_metric
+
+_alphabet = string.ascii_letters + string.digits + string.punctuation + "     \n" + "éüßñ—“”"
+
+
+def iterrows_upper_case_char_count(input_name: str) -> MetricCreator:
+    """
+    The row by row implementation that the vectorized metric replaced.
+    """
+
+    def udf(text: pd.DataFrame) -> SingleMetricResult:
+        metrics: List[int] = []
+        for _index, row in text.iterrows():
+            capital_letters_count = sum(1 for char in row[input_name] if char.isupper())  # type: ignore
+            metrics.append(capital_letters_count)
+
+        return SingleMetricResult(metrics=metrics)
+
+    return lambda: SingleMetric(name=f"{input_name}.upper_case_char_count", input_names=[input_name], evaluate=udf)
+
+
+def _make_df(rows: int, length: int) -> pd.DataFrame:
+    rng = random.Random(0)
+    return pd.DataFrame({"prompt": ["".join(rng.choices(_alphabet, k=length)) for _ in range(rows)]})
+
+
+def _time(fn: Callable[[], object], repeat: int) -> float:
+    """
+    Returns the median wall time of `fn` in milliseconds.
+    """
+    timings: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1, 32, 512, 4096])
+    parser.add_argument("--lengths", type=int, nargs="+", default=[100, 1_000, 10_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    iterrows = iterrows_upper_case_char_count("prompt")()
+    vectorized = char_count_metric("prompt", "upper_case")()
+
+    print(f"{'rows':>6} {'length':>7} {'iterrows ms':>12} {'vectorized ms':>14} {'speedup':>8}")
+    for length in args.lengths:
+        for rows in args.rows:
+            df = _make_df(rows, length)
+            assert iterrows.evaluate(df).metrics == vectorized.evaluate(df).metrics
+
+            iterrows_ms = _time(lambda: iterrows.evaluate(df), args.repeat)
+            vectorized_ms = _time(lambda: vectorized.evaluate(df), args.repeat)
+            print(f"{rows:>6} {length:>7} {iterrows_ms:>12.2f} {vectorized_ms:>14.2f} {iterrows_ms / vectorized_ms:>7.1f}x")
+
+    separate = [char_count_metric("prompt", char_class)() for char_class in CHAR_CLASSES]
+    fused = text_stats_metric("prompt", char_classes=CHAR_CLASSES)()
+
+    print(f"\nAll {len(CHAR_CLASSES)} character classes")
+    print(f"{'rows':>6} {'length':>7} {'separate ms':>12} {'fused ms':>14} {'speedup':>8}")
+    for length in args.lengths:
+        for rows in args.rows:
+            df = _make_df(rows, length)
+            assert [metric.evaluate(df).metrics for metric in separate] == fused.evaluate(df).metrics
+
+            separate_ms = _time(lambda: [metric.evaluate(df) for metric in separate], args.repeat)
+            fused_ms = _time(lambda: fused.evaluate(df), args.repeat)
+            print(f"{rows:>6} {length:>7} {separate_ms:>12.2f} {fused_ms:>14.2f} {separate_ms / fused_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import re
+from typing import List
+
+import pandas as pd
+import pytest
+
+from whylogs_config.text_stats import CHAR_CLASSES, CharClass, char_class_counts, char_count_metric, char_ratio_metric, text_stats_metric
+
+texts = [
+    "Hello World! 123",
+    "",
+    "ÄÖü ß ñ—“quoted” ٣\t\n",
+    "𝔸𝔹 are outside the BMP, and so is 😀.",
+    "ALL CAPS",
+]
+
+python_checks = {
+    "upper_case": str.isupper,
+    "lower_case": str.islower,
+    "digit": str.isdigit,
+    "whitespace": str.isspace,
+    "non_ascii": lambda char: ord(char) >= 128,
+}
+
+
+@pytest.mark.parametrize("char_class", list(python_checks.keys()))
+def test_counts_match_python(char_class: CharClass):
+    expected = [sum(1 for char in text if python_checks[char_class](char)) for text in texts]
+    assert char_class_counts(pd.Series(texts), [char_class])[char_class].tolist() == expected
+
+
+def test_punctuation_counts():
+    counts = char_class_counts(pd.Series(["a.b,c!", "—“quoted”", "$+<=>", "none"]), ["punctuation"])["punctuation"]
+    assert counts.tolist() == [3, 3, 5, 0]
+
+
+def test_missing_values_are_empty():
+    counts = char_class_counts(pd.Series(["Ab", None, "C"]), CHAR_CLASSES)
+    assert counts["upper_case"].tolist() == [1, 0, 1]
+    assert counts["lower_case"].tolist() == [1, 0, 0]
+
+
+def test_metrics():
+    df = pd.DataFrame({"prompt": ["AAbb", "", "hi"]})
+
+    count = char_count_metric("prompt", "upper_case")()
+    count.init()  # pyright: ignore[reportOptionalCall]
+    assert count.name == "prompt.upper_case_char_count"
+    assert count.evaluate(df).metrics == [2, 0, 0]
+
+    ratio = char_ratio_metric("prompt", "upper_case")()
+    assert ratio.name == "prompt.upper_case_char_ratio"
+    metrics: List[float] = ratio.evaluate(df).metrics
+    assert metrics == [0.5, 0.0, 0.0]
+
+
+def test_fused_metric_matches_separate_metrics():
+    df = pd.DataFrame({"prompt": texts})
+    separate = [char_count_metric("prompt", char_class)() for char_class in CHAR_CLASSES]
+    separate_ratio = char_ratio_metric("prompt", "upper_case")()
+
+    fused = text_stats_metric("prompt", char_classes=CHAR_CLASSES, ratios=["upper_case"], char_count=True)()
+    fused.init()  # pyright: ignore[reportOptionalCall]
+    result = fused.evaluate(df)
+
+    assert fused.names == [
+        *[f"prompt.{char_class}_char_count" for char_class in CHAR_CLASSES],
+        "prompt.upper_case_char_ratio",
+        "prompt.stats.char_count",
+    ]
+    assert result.metrics[: len(CHAR_CLASSES)] == [metric.evaluate(df).metrics for metric in separate]
+    assert result.metrics[len(CHAR_CLASSES)] == separate_ratio.evaluate(df).metrics
+    # langkit's stats.char_count is the length without whitespace
+    assert result.metrics[-1] == [len(re.sub(r"\s", "", text)) for text in texts]
+
+
+def test_fused_metric_empty_input():
+    fused = text_stats_metric("prompt", char_classes=["upper_case"], char_count=True)()
+    assert fused.evaluate(pd.DataFrame({"prompt": pd.Series([], dtype=object)})).metrics == [[], []]
+
+
+def test_fused_metric_token_count():
+    pytest.importorskip("tiktoken")
+    fused = text_stats_metric("prompt", token_count=True)()
+    assert fused.names == ["prompt.stats.token_count"]
+    assert fused.evaluate(pd.DataFrame({"prompt": ["hello world", ""]})).metrics == [[2, 0]]
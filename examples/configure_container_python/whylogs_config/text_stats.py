@@ -0,0 +1,245 @@
+import string
+import unicodedata
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable, Dict, List, Literal, Sequence, Tuple, Union, get_args
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+from langkit.core.metric import MetricCreator, MultiMetric, MultiMetricResult, SingleMetric, SingleMetricResult
+
+if TYPE_CHECKING:
+    from tiktoken import Encoding
+
+CharClass = Literal["upper_case", "lower_case", "digit", "whitespace", "punctuation", "non_ascii"]
+CHAR_CLASSES: Tuple[CharClass, ...] = get_args(CharClass)
+
+
+def _is_punctuation(char: str) -> bool:
+    return char in string.punctuation or unicodedata.category(char).startswith("P")
+
+
+_classifiers: Dict[CharClass, Callable[[str], bool]] = {
+    "upper_case": str.isupper,
+    "lower_case": str.islower,
+    "digit": str.isdigit,
+    "whitespace": str.isspace,
+    "punctuation": _is_punctuation,
+    "non_ascii": lambda char: ord(char) >= 128,
+}
+
+
+# Code points in the Basic Multilingual Plane are classified with a lookup table. The rest are rare enough to classify one by one.
+_TABLE_SIZE = 0x10000
+
+
+@lru_cache(maxsize=None)
+def _lookup_table(char_class: CharClass) -> npt.NDArray[np.bool_]:
+    """
+    Whether each code point in the Basic Multilingual Plane is in the class, for looking up a whole buffer of code points at once.
+    """
+    classifier = _classifiers[char_class]
+    return np.fromiter((classifier(chr(code_point)) for code_point in range(_TABLE_SIZE)), dtype=np.bool_, count=_TABLE_SIZE)
+
+
+def _warm_up(char_classes: Sequence[CharClass]) -> None:
+    """
+    Build the lookup tables when the workflow is initialized instead of during the first request.
+    """
+    _flag_table(tuple(char_classes))
+
+
+@lru_cache(maxsize=None)
+def _flag_table(char_classes: Tuple[CharClass, ...]) -> npt.NDArray[np.uint8]:
+    """
+    One lookup table for several classes, where bit `i` of each entry is set if the code point is in `char_classes[i]`.
+    """
+    table = np.zeros(_TABLE_SIZE, dtype=np.uint8)
+    for bit, char_class in enumerate(char_classes):
+        table |= _lookup_table(char_class).astype(np.uint8) << bit
+    return table
+
+
+def _column_values(texts: "pd.Series[str]") -> List[str]:
+    return ["" if not isinstance(it, str) else it for it in texts.tolist()]
+
+
+def encode_column(texts: "pd.Series[str]") -> Tuple[npt.NDArray[np.uint32], npt.NDArray[np.int64]]:
+    """
+    Encode a column as a single buffer of code points along with the offset of each row in it. Row `i` is
+    `code_points[offsets[i]:offsets[i + 1]]`. Missing values are treated as empty strings.
+    """
+    return _encode_values(_column_values(texts))
+
+
+def _encode_values(values: List[str]) -> Tuple[npt.NDArray[np.uint32], npt.NDArray[np.int64]]:
+    lengths = np.fromiter(map(len, values), dtype=np.int64, count=len(values))
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    code_points = np.frombuffer("".join(values).encode("utf-32-le", errors="surrogatepass"), dtype=np.uint32)
+    return code_points, offsets
+
+
+def char_class_mask(code_points: npt.NDArray[np.uint32], char_class: CharClass) -> npt.NDArray[np.bool_]:
+    """
+    Whether each code point is in the class.
+    """
+    if char_class == "non_ascii":
+        return code_points >= 128
+
+    mask = _lookup_table(char_class)[np.minimum(code_points, _TABLE_SIZE - 1)]
+
+    outside_table = code_points >= _TABLE_SIZE
+    if outside_table.any():
+        distinct, inverse = np.unique(code_points[outside_table], return_inverse=True)
+        classifier = _classifiers[char_class]
+        mask[outside_table] = np.array([classifier(chr(it)) for it in distinct.tolist()], dtype=np.bool_)[inverse]
+
+    return mask
+
+
+def char_class_flags(code_points: npt.NDArray[np.uint32], char_classes: Tuple[CharClass, ...]) -> npt.NDArray[np.uint8]:
+    """
+    Classify each code point into all of the classes with a single lookup. Bit `i` is set if it's in `char_classes[i]`.
+    """
+    if len(char_classes) > 8:
+        raise ValueError(f"Can't classify more than 8 character classes at once, got {char_classes}")
+
+    flags = _flag_table(char_classes)[np.minimum(code_points, _TABLE_SIZE - 1)]
+
+    outside_table = code_points >= _TABLE_SIZE
+    if outside_table.any():
+        distinct, inverse = np.unique(code_points[outside_table], return_inverse=True)
+        distinct_flags = np.array(
+            [sum(int(_classifiers[char_class](chr(it))) << bit for bit, char_class in enumerate(char_classes)) for it in distinct.tolist()],
+            dtype=np.uint8,
+        )
+        flags[outside_table] = distinct_flags[inverse]
+
+    return flags
+
+
+def count_per_row(mask: npt.NDArray[np.bool_], offsets: npt.NDArray[np.int64]) -> npt.NDArray[np.int64]:
+    cumulative = np.zeros(len(mask) + 1, dtype=np.int64)
+    np.cumsum(mask, out=cumulative[1:])
+    return cumulative[offsets[1:]] - cumulative[offsets[:-1]]
+
+
+def _count_flags_per_row(
+    flags: npt.NDArray[np.uint8], lengths: npt.NDArray[np.int64], char_classes: Tuple[CharClass, ...]
+) -> Dict[CharClass, npt.NDArray[np.int64]]:
+    """
+    Count every class per row with a single histogram of (row, flags) pairs instead of a pass over the text per class.
+    """
+    combinations = 1 << len(char_classes)
+    rows = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+    histogram = np.bincount(rows * combinations + flags, minlength=len(lengths) * combinations).reshape(len(lengths), combinations)
+
+    all_flags = np.arange(combinations)
+    return {char_class: histogram[:, (all_flags & (1 << bit)) != 0].sum(axis=1) for bit, char_class in enumerate(char_classes)}
+
+
+def char_class_counts(texts: "pd.Series[str]", char_classes: Sequence[CharClass]) -> Dict[CharClass, npt.NDArray[np.int64]]:
+    """
+    Count the characters of each class in every row of the column.
+    """
+    code_points, offsets = encode_column(texts)
+    return {char_class: count_per_row(char_class_mask(code_points, char_class), offsets) for char_class in char_classes}
+
+
+def _ratio(counts: npt.NDArray[np.int64], lengths: npt.NDArray[np.int64]) -> npt.NDArray[np.float64]:
+    return np.divide(counts, lengths, out=np.zeros(len(counts), dtype=np.float64), where=lengths > 0)
+
+
+def char_count_metric(input_name: str, char_class: CharClass) -> MetricCreator:
+    """
+    Count the characters of a class in each row, e.g. `char_count_metric("prompt", "upper_case")` creates
+    `prompt.upper_case_char_count`. The whole column is counted at once instead of row by row.
+    """
+
+    def udf(text: pd.DataFrame) -> SingleMetricResult:
+        counts = char_class_counts(text[input_name], [char_class])[char_class]
+        return SingleMetricResult(metrics=counts.tolist())
+
+    return lambda: SingleMetric(
+        name=f"{input_name}.{char_class}_char_count", input_names=[input_name], evaluate=udf, init=lambda: _warm_up([char_class])
+    )
+
+
+def char_ratio_metric(input_name: str, char_class: CharClass) -> MetricCreator:
+    """
+    The fraction of characters in each row that are in a class, e.g. `prompt.upper_case_char_ratio`. Empty rows are 0.
+    """
+
+    def udf(text: pd.DataFrame) -> SingleMetricResult:
+        code_points, offsets = encode_column(text[input_name])
+        counts = count_per_row(char_class_mask(code_points, char_class), offsets)
+        return SingleMetricResult(metrics=_ratio(counts, np.diff(offsets)).tolist())
+
+    return lambda: SingleMetric(
+        name=f"{input_name}.{char_class}_char_ratio", input_names=[input_name], evaluate=udf, init=lambda: _warm_up([char_class])
+    )
+
+
+@lru_cache(maxsize=None)
+def _get_encoder(encoding: str) -> "Encoding":
+    import tiktoken
+
+    return tiktoken.get_encoding(encoding)
+
+
+def text_stats_metric(
+    input_name: str,
+    char_classes: Sequence[CharClass] = (),
+    ratios: Sequence[CharClass] = (),
+    char_count: bool = False,
+    token_count: bool = False,
+    token_encoding: str = "cl100k_base",
+) -> MetricCreator:
+    """
+    All of the character and token counts for a column in one metric, so the text is only encoded and classified once
+    instead of once per metric. The metric names are the same as the separate metrics:
+
+    - `{input_name}.{char_class}_char_count` for each of `char_classes`, like `char_count_metric`
+    - `{input_name}.{char_class}_char_ratio` for each of `ratios`, like `char_ratio_metric`
+    - `{input_name}.stats.char_count` if `char_count`, the number of non whitespace characters like langkit's `stats.char_count`
+    - `{input_name}.stats.token_count` if `token_count`, like langkit's `stats.token_count`
+
+    Use it instead of those metrics rather than alongside them, since metric names have to be unique.
+    """
+    classes = tuple(dict.fromkeys([*char_classes, *ratios, *(["whitespace"] if char_count else [])]))
+
+    names = [
+        *[f"{input_name}.{char_class}_char_count" for char_class in char_classes],
+        *[f"{input_name}.{char_class}_char_ratio" for char_class in ratios],
+        *([f"{input_name}.stats.char_count"] if char_count else []),
+        *([f"{input_name}.stats.token_count"] if token_count else []),
+    ]
+
+    if not names:
+        raise ValueError("text_stats_metric needs at least one char class, ratio, char_count or token_count")
+
+    def init() -> None:
+        _flag_table(classes)
+        if token_count:
+            _get_encoder(token_encoding)
+
+    def udf(text: pd.DataFrame) -> MultiMetricResult:
+        values = _column_values(text[input_name])
+        code_points, offsets = _encode_values(values)
+        lengths = np.diff(offsets)
+        counts = _count_flags_per_row(char_class_flags(code_points, classes), lengths, classes)
+
+        metrics: List[Union[List[int], List[float]]] = [
+            *[counts[char_class].tolist() for char_class in char_classes],
+            *[_ratio(counts[char_class], lengths).tolist() for char_class in ratios],
+        ]
+        if char_count:
+            metrics.append((lengths - counts["whitespace"]).tolist())
+        if token_count:
+            metrics.append([len(tokens) for tokens in _get_encoder(token_encoding).encode_batch(values)])
+
+        return MultiMetricResult(metrics=metrics)
+
+    return lambda: MultiMetric(names=names, input_names=[input_name], evaluate=udf, init=init, cache_assets=init)
@@ -0,0 +1,88 @@
+import argparse
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Generator, List
+
+import pytest
+
+from bench.load_test import discover_policies, main_async, percentile
+
+_evaluation_result = {
+    "metrics": [{"prompt.stats.char_count": 1}],
+    "validation_results": {"report": []},
+    "perf_info": None,
+    "action": {"action_type": "pass", "message": ""},
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        status = 500 if body["datasetId"] == "broken" else 200
+        payload = json.dumps(_evaluation_result).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+@pytest.fixture
+def server_url() -> Generator[str, None, None]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_percentile():
+    values: List[float] = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 50) == 0.0
+
+
+def test_discover_policies():
+    policies = discover_policies()
+    assert "model-134" in policies
+    assert "model-150" in policies
+
+
+def _args(url: str, **kwargs: Any) -> argparse.Namespace:
+    defaults = dict(
+        url=url,
+        token="password",
+        policies=["model-134", "broken"],
+        corpus=None,
+        rps=200,
+        concurrency=None,
+        max_in_flight=16,
+        duration=10,
+        requests=20,
+        timeout=5,
+        warmup=False,
+    )
+    return argparse.Namespace(**{**defaults, **kwargs})
+
+
+def test_rate_report(server_url: str):
+    report = asyncio.run(main_async(_args(server_url)))
+
+    assert report["total"]["requests"] == 20
+    assert report["policies"]["model-134"]["errors"] == 0
+    assert report["policies"]["broken"]["errors"] == 10
+    assert report["policies"]["broken"]["status_codes"] == {"500": 10}
+    assert report["total"]["error_rate"] == 0.5
+
+
+def test_concurrency_report(server_url: str):
+    report = asyncio.run(main_async(_args(server_url, concurrency=4, policies=["model-134"])))
+
+    assert report["mode"] == {"concurrency": 4}
+    assert report["total"]["requests"] == 20
+    assert report["total"]["latency_ms"]["p99"] >= report["total"]["latency_ms"]["p50"]
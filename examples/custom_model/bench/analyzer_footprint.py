@@ -0,0 +1,77 @@
+"""
+Measures the latency and resident memory of Presidio's default analyzer against the pruned analyzer that
+custom_presidio_metric builds from its entity list. Each analyzer is measured in its own process so their
+memory doesn't overlap.
+
+    poetry run python -m bench.analyzer_footprint
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from bench.corpus import make_texts
+from whylogs_config.pii import DEFAULT_ENTITIES, LARGE_SPACY_MODEL, analyze_batch, default_spacy_model
+
+
+def _rss_mb() -> float:
+    # The resident set right now rather than its peak, so the baseline is subtracted from a comparable number
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def _measure(analyzer: str, rows: int, repeat: int) -> Dict[str, Any]:
+    entities: Optional[Tuple[str, ...]] = None if analyzer == "default" else DEFAULT_ENTITIES
+    spacy_model = LARGE_SPACY_MODEL if entities is None else default_spacy_model(entities)
+    texts = make_texts(rows)
+
+    baseline_rss = _rss_mb()
+    start = time.perf_counter()
+    analyze_batch(texts[:1], entities, spacy_model)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    timings: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        analyze_batch(texts, entities, spacy_model)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "analyzer": analyzer,
+        "spacy_model": spacy_model,
+        "rows": rows,
+        "load_ms": round(load_ms, 1),
+        "median_ms": round(statistics.median(timings), 1),
+        "rss_mb": round(_rss_mb() - baseline_rss, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=512)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--analyzer", choices=["default", "pruned"], help="Measure a single analyzer in this process")
+    args = parser.parse_args()
+
+    if args.analyzer is not None:
+        print(json.dumps(_measure(args.analyzer, args.rows, args.repeat)))
+        return
+
+    print(f"{'analyzer':>9} {'spacy model':>16} {'load ms':>10} {'median ms':>10} {'rss mb':>8}")
+    for analyzer in ["default", "pruned"]:
+        command = [sys.executable, "-m", "bench.analyzer_footprint", "--analyzer", analyzer]
+        command += ["--rows", str(args.rows), "--repeat", str(args.repeat)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(
+            f"{result['analyzer']:>9} {result['spacy_model']:>16} {result['load_ms']:>10} {result['median_ms']:>10} {result['rss_mb']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
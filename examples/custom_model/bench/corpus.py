@@ -0,0 +1,22 @@
+from typing import List
+
+corpus = [
+    "Hey! Here is my phone number: 555-555-5555, and my email is foo@whylabs.ai. And my friend's email is bar@whylabs.ai",
+    "no pii here",
+    "Can you summarize the attached quarterly report for the leadership team?",
+    "My card is 3704 4673 5765 635, please charge it for the order.",
+    "What is the capital of France and how many people live there?",
+    "Reach me at (206) 555-0199 or jane.doe@example.com after 5pm.",
+]
+
+
+def make_texts(rows: int) -> List[str]:
+    """
+    Repeats the corpus until there are `rows` texts. Each text is suffixed with its row number, spelled with
+    letters so it doesn't look like pii, so that they're all distinct and nothing is served from a cache.
+    """
+    return [f"{corpus[i % len(corpus)]} ({_spell(i)})" for i in range(rows)]
+
+
+def _spell(number: int) -> str:
+    return "".join(chr(ord("a") + int(digit)) for digit in str(number))
@@ -0,0 +1,138 @@
+"""
+Compares the torch, onnx and onnx-int8 backends of the embedding and toxicity models that model-140 pins, by latency,
+resident memory and drift from the torch output. Each backend is measured in a fresh process so their memory doesn't
+overlap. The models are exported and quantized into ONNX_MODEL_CACHE_DIR by a separate process beforehand, so the
+conversion isn't included in the timings or the memory.
+
+    poetry run python -m bench.onnx_benchmark
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, cast
+
+import numpy as np
+import pandas as pd
+
+from bench.corpus import make_texts
+from langkit.core.metric import SingleMetric, SingleMetricResult
+from langkit.transformer import SentenceTransformerTarget, embedding_adapter
+from whylogs_config.onnx_backend import (
+    DEFAULT_TOXICITY_MODEL,
+    DEFAULT_TOXICITY_REVISION,
+    Backend,
+    classifier,
+    embedding_drift,
+    embedding_encoder,
+    toxicity_metric,
+)
+
+# The revisions in configure_container_yaml's model-140-versions.yaml
+EMBEDDING_TARGET = SentenceTransformerTarget(name="all-MiniLM-L6-v2", revision="8b3219a92973c328a8e22fadcfa821b5dc75636a")
+BACKENDS: List[Backend] = ["torch", "onnx", "onnx-int8"]
+
+
+def _rss_mb() -> float:
+    # The current resident set, unlike ru_maxrss which only ever grows. The second field of statm is in pages.
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def _median_ms(fn: Callable[[], object], repeat: int) -> float:
+    timings: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(timings), 1)
+
+
+def _embedding(backend: Backend) -> Callable[[List[str]], object]:
+    encoder = embedding_encoder(EMBEDDING_TARGET, backend)
+    return lambda texts: encoder.encode(tuple(texts))
+
+
+def _toxicity(backend: Backend) -> Callable[[List[str]], List[float]]:
+    metric = cast(SingleMetric, toxicity_metric("prompt", DEFAULT_TOXICITY_MODEL, DEFAULT_TOXICITY_REVISION, backend)())
+    if metric.cache_assets is not None:
+        metric.cache_assets()
+    evaluate = cast(Callable[[pd.DataFrame], SingleMetricResult], metric.evaluate)
+    return lambda texts: list(evaluate(pd.DataFrame({"prompt": texts})).metrics)
+
+
+def _convert(model: str, backend: Backend) -> None:
+    if model == "embedding":
+        embedding_encoder(EMBEDDING_TARGET, backend)
+    else:
+        classifier(DEFAULT_TOXICITY_MODEL, DEFAULT_TOXICITY_REVISION, backend)
+
+
+def _measure(model: str, backend: Backend, rows: int, repeat: int) -> Dict[str, Any]:
+    texts = make_texts(rows)
+
+    baseline_rss = _rss_mb()
+    start = time.perf_counter()
+    run = _embedding(backend) if model == "embedding" else _toxicity(backend)
+    run(texts)
+    load_ms = round((time.perf_counter() - start) * 1000, 1)
+
+    median_ms = _median_ms(lambda: run(texts), repeat)
+    rss_mb = round(_rss_mb() - baseline_rss, 1)
+
+    # The torch reference is only loaded after the memory was measured
+    if model == "embedding":
+        drift = embedding_drift(embedding_adapter(EMBEDDING_TARGET), embedding_encoder(EMBEDDING_TARGET, backend), texts)
+    else:
+        expected = np.array(_toxicity("torch")(texts))
+        actual = np.array(run(texts))
+        drift = {"max_abs_diff": float(np.abs(expected - actual).max()), "label_changes": int(((expected > 0.5) != (actual > 0.5)).sum())}
+
+    return {
+        "model": model,
+        "backend": backend,
+        "rows": rows,
+        "load_ms": load_ms,
+        "median_ms": median_ms,
+        "rss_mb": rss_mb,
+        "drift": {name: round(value, 6) for name, value in drift.items()},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--model", choices=["embedding", "toxicity"], nargs="+", default=["embedding", "toxicity"])
+    parser.add_argument("--backend", choices=BACKENDS, help="Measure a single backend in this process")
+    parser.add_argument("--convert", action="store_true", help="Only export the --backend model to the cache")
+    args = parser.parse_args()
+
+    if args.backend is not None and args.convert:
+        _convert(args.model[0], args.backend)
+        return
+    if args.backend is not None:
+        print(json.dumps(_measure(args.model[0], args.backend, args.rows, args.repeat)))
+        return
+
+    print(f"{'model':>9} {'backend':>10} {'load ms':>10} {'median ms':>10} {'rss mb':>8}  drift")
+    for model in args.model:
+        for backend in BACKENDS:
+            command = [sys.executable, "-m", "bench.onnx_benchmark", "--model", model, "--backend", backend]
+            if backend != "torch":
+                subprocess.run([*command, "--convert"], check=True, capture_output=True)
+            command += ["--rows", str(args.rows), "--repeat", str(args.repeat)]
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(
+                f"{result['model']:>9} {result['backend']:>10} {result['load_ms']:>10} {result['median_ms']:>10} {result['rss_mb']:>8}"
+                f"  {json.dumps(result['drift'])}"
+            )
+
+
+if __name__ == "__main__":
+    main()
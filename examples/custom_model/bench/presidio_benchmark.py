@@ -0,0 +1,61 @@
+"""
+Compares the row by row Presidio analysis against the batched and prefiltered analysis for different batch sizes.
+
+    poetry run python -m bench.presidio_benchmark
+"""
+
+import argparse
+import statistics
+import time
+from typing import Callable, Dict, List
+
+import pandas as pd
+
+from bench.corpus import make_texts
+from langkit.core.metric import MultiMetric
+from whylogs_config.pii import custom_presidio_metric
+
+
+def _make_df(rows: int) -> pd.DataFrame:
+    return pd.DataFrame({"prompt": make_texts(rows)})
+
+
+def _time(fn: Callable[[], object], repeat: int) -> float:
+    """
+    Returns the median wall time of `fn` in milliseconds.
+    """
+    timings: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1, 32, 512])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # The cache is disabled everywhere so every configuration actually analyzes the texts
+    metrics: Dict[str, MultiMetric] = {
+        "loop": custom_presidio_metric("prompt", batched=False, prefilter=False, result_cache=None)(),
+        "batched": custom_presidio_metric("prompt", batched=True, prefilter=False, result_cache=None)(),
+        "prefiltered": custom_presidio_metric("prompt", batched=True, prefilter=True, result_cache=None)(),
+    }
+
+    # Warm up every code path so model loading isn't included in the timings
+    for metric in metrics.values():
+        metric.evaluate(_make_df(1))
+
+    print(f"{'rows':>6}" + "".join(f" {name + ' ms':>16}" for name in metrics))
+    for rows in args.rows:
+        df = _make_df(rows)
+        timings = {name: _time(lambda: metric.evaluate(df), args.repeat) for name, metric in metrics.items()}
+        baseline = timings["loop"]
+        print(f"{rows:>6}" + "".join(f" {f'{ms:.1f} ({baseline / ms:.1f}x)':>16}" for ms in timings.values()))
+
+
+if __name__ == "__main__":
+    main()
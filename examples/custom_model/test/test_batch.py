@@ -0,0 +1,64 @@
+from typing import List
+
+import pandas as pd
+import pytest
+
+from langkit.core.metric import SingleMetric, SingleMetricResult
+from langkit.core.workflow import Workflow
+from langkit.validators.library import lib as validators_lib
+from whylogs_config.batch import BatchRow, evaluate_batch
+
+
+def length_metric(input_name: str, batch_sizes: List[int]) -> SingleMetric:
+    def evaluate(df: pd.DataFrame) -> SingleMetricResult:
+        batch_sizes.append(len(df))
+        return SingleMetricResult(df[input_name].fillna("").str.len().tolist())  # pyright: ignore[reportUnknownMemberType]
+
+    return SingleMetric(name=f"{input_name}.length", input_names=[input_name], evaluate=evaluate)
+
+
+def test_batch_is_one_pass_with_results_per_row():
+    batch_sizes: List[int] = []
+    workflow = Workflow(
+        metrics=[lambda: length_metric("prompt", batch_sizes), lambda: length_metric("response", batch_sizes)],
+        validators=[
+            validators_lib.constraint(target_metric="prompt.length", upper_threshold=10),
+            validators_lib.constraint(target_metric="response.length", upper_threshold=5, failure_level="flag"),
+        ],
+    )
+
+    rows = [
+        BatchRow(id="short", prompt="hi", response="hey"),
+        BatchRow(id="long-prompt", prompt="a much longer prompt", response="ok", additional_data={"turn": 2}),
+        BatchRow(id="long-response", prompt="hello", response="a long response"),
+    ]
+    results = evaluate_batch(workflow, rows)
+
+    # Each metric ran once over all of the rows
+    assert batch_sizes == [3, 3]
+
+    assert [result.id for result in results] == ["short", "long-prompt", "long-response"]
+    assert [result.metrics["prompt.length"] for result in results] == [2, 20, 5]
+    assert [result.action for result in results] == ["pass", "block", "flag"]
+    assert [[failure.metric for failure in result.validation_results] for result in results] == [[], ["prompt.length"], ["response.length"]]
+    assert all(failure.id == result.id for result in results for failure in result.validation_results)
+    assert results[1].additional_data == {"turn": 2}
+
+
+def test_batch_without_responses_skips_response_metrics():
+    batch_sizes: List[int] = []
+    workflow = Workflow(metrics=[lambda: length_metric("prompt", batch_sizes), lambda: length_metric("response", batch_sizes)])
+
+    results = evaluate_batch(workflow, [BatchRow(id="1", prompt="hi"), BatchRow(id="2", prompt="there")])
+
+    assert batch_sizes == [2]
+    assert [result.metrics for result in results] == [{"prompt.length": 2}, {"prompt.length": 5}]
+
+
+def test_batch_ids_must_be_unique():
+    workflow = Workflow(metrics=[lambda: length_metric("prompt", [])])
+
+    with pytest.raises(ValueError):
+        evaluate_batch(workflow, [BatchRow(id="1", prompt="a"), BatchRow(id="1", prompt="b")])
+
+    assert evaluate_batch(workflow, []) == []
@@ -0,0 +1,224 @@
+import gc
+import time
+import weakref
+from typing import Generator, List, Mapping
+
+import pandas as pd
+import pytest
+
+from langkit.core.metric import MetricResult, SingleMetricResult
+from langkit.core.validation import ValidationFailure, ValidationResult
+from langkit.core.workflow import Callback
+from whylogs_config.callbacks import AsyncCallback, BatchedWebhook
+
+from .webhook_server import WebhookServer
+
+
+class SlowCallback(Callback):
+    def __init__(self, delay_sec: float) -> None:
+        self.delay_sec = delay_sec
+        self.calls: List[pd.DataFrame] = []
+        self.metric_results: List[Mapping[str, MetricResult]] = []
+
+    def post_validation(
+        self,
+        df: pd.DataFrame,
+        metric_results: Mapping[str, MetricResult],
+        results: pd.DataFrame,
+        validation_results: List[ValidationResult],
+    ) -> None:
+        time.sleep(self.delay_sec)
+        self.calls.append(df)
+        self.metric_results.append(metric_results)
+
+
+def _call(callback: Callback, prompt: str) -> pd.DataFrame:
+    df = pd.DataFrame({"prompt": [prompt]})
+    callback.post_validation(df, {"prompt.stat": SingleMetricResult([1])}, pd.DataFrame({"prompt.stat": [1]}), [])
+    return df
+
+
+def test_async_callback_off_request_path():
+    slow = SlowCallback(delay_sec=0.2)
+    callback = AsyncCallback(slow)
+
+    start = time.perf_counter()
+    df = _call(callback, "a")
+    assert time.perf_counter() - start < 0.1
+
+    # The callback gets a copy, so changing the input afterwards doesn't affect it
+    df["prompt"] = "changed"
+
+    assert callback.flush(timeout_sec=5)
+    assert slow.calls[0]["prompt"].tolist() == ["a"]
+    assert callback.stats()["delivered"] == 1
+    assert callback.stats()["max_lag_sec"] >= 0
+    callback.shutdown()
+
+
+def test_async_callback_drops_on_overflow():
+    slow = SlowCallback(delay_sec=0.2)
+    callback = AsyncCallback(slow, max_queue_size=1, overflow="drop")
+
+    for prompt in ["a", "b", "c", "d"]:
+        _call(callback, prompt)
+
+    assert callback.flush(timeout_sec=5)
+    stats = callback.stats()
+    assert stats["dropped"] >= 1
+    assert stats["delivered"] + stats["dropped"] == 4
+    callback.shutdown()
+
+
+def test_async_callback_spills_on_overflow(tmp_path: str):
+    slow = SlowCallback(delay_sec=0.05)
+    callback = AsyncCallback(slow, max_queue_size=1, overflow="spill", spill_dir=str(tmp_path))
+
+    for prompt in ["a", "b", "c", "d", "e"]:
+        _call(callback, prompt)
+
+    assert callback.flush(timeout_sec=5)
+    stats = callback.stats()
+    assert stats["spilled"] >= 1
+    assert stats["delivered"] == 5
+    assert sorted(df["prompt"].tolist()[0] for df in slow.calls) == ["a", "b", "c", "d", "e"]
+    callback.shutdown()
+
+
+def test_async_callback_gets_its_own_results():
+    slow = SlowCallback(delay_sec=0.0)
+    callback = AsyncCallback(slow)
+    metrics = SingleMetricResult([1])
+
+    callback.post_validation(pd.DataFrame({"prompt": ["a"]}), {"prompt.stat": metrics}, pd.DataFrame({"prompt.stat": [1]}), [])
+    metrics.metrics.append(2)
+
+    assert callback.flush(timeout_sec=5)
+    assert slow.metric_results == [{"prompt.stat": SingleMetricResult([1])}]
+    callback.shutdown()
+
+
+def test_async_callback_shuts_down_when_collected():
+    callback = AsyncCallback(SlowCallback(delay_sec=0.0))
+    workers = callback._deliveries._workers  # pyright: ignore[reportPrivateUsage]
+    reference = weakref.ref(callback)
+
+    del callback
+    gc.collect()
+
+    assert reference() is None
+    assert not any(worker.is_alive() for worker in workers)
+
+
+def test_async_callback_shutdown_with_a_full_queue_returns():
+    slow = SlowCallback(delay_sec=1.0)
+    callback = AsyncCallback(slow, max_queue_size=1, overflow="drop")
+    for prompt in ["a", "b"]:
+        _call(callback, prompt)
+
+    start = time.perf_counter()
+    callback.shutdown(timeout_sec=0.2)
+    assert time.perf_counter() - start < 0.5
+
+    _call(callback, "c")
+    assert callback.stats()["dropped"] >= 1
+
+
+def _fail(callback: Callback, prompt: str) -> None:
+    df = pd.DataFrame({"prompt": [prompt]})
+    results = pd.DataFrame({"id": ["0"], "prompt.stats.char_count": [len(prompt)]})
+    failure = ValidationResult(
+        report=[
+            ValidationFailure(id="0", metric="prompt.stats.char_count", details="too short", value=len(prompt), lower_threshold=2),
+        ]
+    )
+    callback.post_validation(df, {}, results, [failure])
+
+
+@pytest.fixture
+def webhook_server() -> Generator[WebhookServer, None, None]:
+    server = WebhookServer().start()
+    yield server
+    server.stop()
+
+
+def test_batched_webhook_batches_by_size(webhook_server: WebhookServer):
+    webhook = BatchedWebhook(webhook_server.url, auth_token="password", include_input=True, max_batch_size=3, max_batch_delay_sec=10)
+
+    for prompt in ["a", "b", "c", "d", "e", "f"]:
+        _fail(webhook, prompt)
+
+    assert webhook.flush(timeout_sec=5)
+    assert [len(it["failures"]) for it in webhook_server.requests] == [3, 3]
+    assert webhook_server.requests[0]["failures"][0]["input"] == [{"prompt": "a"}]
+    assert webhook_server.requests[0]["failures"][0]["report"][0]["report"][0]["metric"] == "prompt.stats.char_count"
+    assert webhook_server.headers[0]["Authorization"] == "Bearer password"
+    assert webhook.stats()["failures_sent"] == 6
+    webhook.shutdown()
+
+
+def test_batched_webhook_batches_by_time(webhook_server: WebhookServer):
+    webhook = BatchedWebhook(webhook_server.url, max_batch_size=100, max_batch_delay_sec=0.2, gzip_body=True)
+
+    _fail(webhook, "a")
+    _fail(webhook, "b")
+
+    assert webhook.flush(timeout_sec=5)
+    assert [len(it["failures"]) for it in webhook_server.requests] == [2]
+    assert "input" not in webhook_server.requests[0]["failures"][0]
+    assert webhook_server.headers[0]["Content-Encoding"] == "gzip"
+    webhook.shutdown()
+
+
+def test_batched_webhook_retries(webhook_server: WebhookServer):
+    webhook_server.fail_with = [503, 500]
+    webhook = BatchedWebhook(webhook_server.url, max_batch_delay_sec=0.05, backoff_sec=0.01)
+
+    _fail(webhook, "a")
+
+    assert webhook.flush(timeout_sec=5)
+    assert len(webhook_server.requests) == 1
+    assert webhook.stats()["retries"] == 2
+    assert webhook.stats()["batches_failed"] == 0
+    webhook.shutdown()
+
+
+def test_batched_webhook_gives_up(webhook_server: WebhookServer):
+    webhook_server.fail_with = [500, 500, 500]
+    webhook = BatchedWebhook(webhook_server.url, max_batch_delay_sec=0.05, max_retries=2, backoff_sec=0.01)
+
+    _fail(webhook, "a")
+
+    assert webhook.flush(timeout_sec=5)
+    assert webhook_server.requests == []
+    assert webhook.stats()["batches_failed"] == 1
+    assert webhook.stats()["failures_dropped"] == 1
+    webhook.shutdown()
+
+
+def test_batched_webhook_shuts_down_when_collected(webhook_server: WebhookServer):
+    webhook = BatchedWebhook(webhook_server.url, max_batch_delay_sec=0.05)
+    sender = webhook._sender._thread  # pyright: ignore[reportPrivateUsage]
+    reference = weakref.ref(webhook)
+
+    _fail(webhook, "a")
+    del webhook
+    gc.collect()
+
+    assert reference() is None
+    assert not sender.is_alive()
+    assert [len(it["failures"]) for it in webhook_server.requests] == [1]
+
+
+def test_batched_webhook_shutdown_with_a_full_queue_returns(webhook_server: WebhookServer):
+    webhook_server.fail_with = [500] * 100
+    webhook = BatchedWebhook(webhook_server.url, max_batch_size=1, max_batch_delay_sec=0.0, max_retries=50, backoff_sec=1.0, max_pending=1)
+    for prompt in ["a", "b", "c"]:
+        _fail(webhook, prompt)
+
+    start = time.perf_counter()
+    webhook.shutdown(timeout_sec=0.2)
+    assert time.perf_counter() - start < 0.5
+
+    _fail(webhook, "d")
+    assert webhook.stats()["failures_dropped"] >= 2
@@ -0,0 +1,77 @@
+import io
+import struct
+from typing import List, Tuple
+
+import numpy as np
+import pytest
+import torch
+
+from langkit.metrics.embeddings_types import EmbeddingEncoder
+from whylogs_config.embedding_export import embed_texts, read_raw, read_texts, write_npy, write_raw
+
+
+class CountingEncoder(EmbeddingEncoder):
+    def __init__(self) -> None:
+        self.calls: List[Tuple[str, ...]] = []
+
+    def encode(self, text: Tuple[str, ...]) -> torch.Tensor:
+        self.calls.append(text)
+        return torch.tensor([[float(len(it)), 0.5, -1.0] for it in text])
+
+
+def test_texts_are_embedded_in_batches():
+    encoder = CountingEncoder()
+
+    embeddings = embed_texts(["a", "bb", "ccc", "dddd", "eeeee"], encoder, batch_size=2)
+
+    assert encoder.calls == [("a", "bb"), ("ccc", "dddd"), ("eeeee",)]
+    assert embeddings.dtype == np.float32
+    assert embeddings.shape == (5, 3)
+    assert embeddings[:, 0].tolist() == [1, 2, 3, 4, 5]
+    assert embed_texts([], encoder).shape == (0, 3)
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16"])
+def test_raw_round_trip(dtype: str):
+    embeddings = embed_texts(["hello", "hi"], CountingEncoder())
+    output = io.BytesIO()
+
+    write_raw(embeddings, output, dtype)  # pyright: ignore[reportArgumentType]
+    data = output.getvalue()
+
+    item_size = 4 if dtype == "float32" else 2
+    assert len(data) == 16 + 2 * 3 * item_size
+    assert data[:4] == b"LKEM"
+    assert struct.unpack("<II", data[8:16]) == (2, 3)
+    # Little endian no matter what the host is
+    assert data[16 : 16 + item_size] == np.array([5.0], dtype=f"<f{item_size}").tobytes()
+
+    actual = read_raw(io.BytesIO(data))
+    assert actual.dtype == np.dtype(dtype)
+    np.testing.assert_array_equal(actual, embeddings)
+
+
+def test_npy_loads_with_numpy():
+    embeddings = embed_texts(["hello", "hi"], CountingEncoder())
+    output = io.BytesIO()
+
+    write_npy(embeddings, output, "float16")
+    output.seek(0)
+
+    actual = np.load(output)
+    assert actual.dtype == np.float16
+    np.testing.assert_array_equal(actual, embeddings)
+
+
+def test_truncated_raw_buffers_are_rejected():
+    output = io.BytesIO()
+    write_raw(embed_texts(["hello"], CountingEncoder()), output)
+
+    with pytest.raises(ValueError, match="Truncated"):
+        read_raw(io.BytesIO(output.getvalue()[:-1]))
+    with pytest.raises(ValueError, match="embedding buffer"):
+        read_raw(io.BytesIO(b"NOPE" + output.getvalue()[4:]))
+
+
+def test_every_line_is_a_row():
+    assert read_texts(["first text\r\n", "\n", "second text"]) == ["first text", "", "second text"]
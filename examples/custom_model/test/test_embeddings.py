@@ -0,0 +1,182 @@
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import pandas as pd
+import torch
+
+from langkit.core.context import Context
+from langkit.core.metric import SingleMetric, SingleMetricResult
+from langkit.core.workflow import Workflow
+from langkit.metrics.embeddings_types import EmbeddingEncoder
+from langkit.transformer import EmbeddingContextDependency, SentenceTransformerTarget
+from whylogs_config.embeddings import (
+    EmbeddingCache,
+    EmbeddingStats,
+    EmbeddingStore,
+    SharedEmbeddingDependency,
+    embedding_store,
+    model_key,
+    share_embeddings,
+)
+
+target = SentenceTransformerTarget(name="all-MiniLM-L6-v2", revision="44eb4044493a3c34bc6d7faae1a71ec76665ebc6")
+
+
+class LengthEncoder(EmbeddingEncoder):
+    """
+    Embeds each text as its length, and records what it was asked to encode.
+    """
+
+    def __init__(self) -> None:
+        self.calls: List[Tuple[str, ...]] = []
+
+    def encode(self, text: Tuple[str, ...]) -> torch.Tensor:
+        self.calls.append(text)
+        return torch.tensor([[float(len(it)), 1.0] for it in text])
+
+
+encoder = LengthEncoder()
+
+
+@dataclass(frozen=True)
+class LengthEmbeddingDependency(EmbeddingContextDependency):
+    def _get_encoder(self) -> EmbeddingEncoder:
+        return encoder
+
+
+def embedding_metric(column: str) -> SingleMetric:
+    dependency = LengthEmbeddingDependency(embedding_choice=target, input_column=column)
+
+    def udf(text: pd.DataFrame, context: Context) -> SingleMetricResult:
+        return SingleMetricResult(dependency.get_request_data(context)[:, 0].tolist())
+
+    return SingleMetric(name=f"{column}.embedding_length", input_names=[column], evaluate=udf, context_dependencies=[dependency])
+
+
+def test_store_embeds_each_text_once():
+    store = EmbeddingStore()
+    local = LengthEncoder()
+
+    first = store.encode(("model", "1"), ["a", "bb", "a"], local.encode)
+    second = store.encode(("model", "1"), ["bb", "ccc"], local.encode)
+    third = store.encode(("model", "1"), ["a"], local.encode)
+    other_model = store.encode(("other", "1"), ["a"], local.encode)
+
+    assert local.calls == [("a", "bb"), ("ccc",), ("a",)]
+    assert first[:, 0].tolist() == [1, 2, 1]
+    assert second[:, 0].tolist() == [2, 3]
+    assert third.shape == (1, 2)
+    assert other_model.shape == (1, 2)
+    assert store.stats() == {"texts_requested": 7, "texts_encoded": 4, "texts_saved": 3, "encoder_calls": 3, "encoder_calls_saved": 1}
+
+
+def test_stats_aggregate_each_requests_counts():
+    stats = EmbeddingStats(window=2)
+    local = LengthEncoder()
+    for texts in [["a", "a"], ["b"], ["c", "c", "c"]]:
+        store = EmbeddingStore(stats)
+        store.encode(("model", "1"), texts, local.encode)
+        store.encode(("model", "1"), texts, local.encode)
+
+    # Only the last two requests are in the window
+    aggregate = stats.stats()
+    assert aggregate["requests"] == 2
+    assert aggregate["texts_requested"] == 8
+    assert aggregate["texts_encoded"] == 2
+    assert aggregate["encoder_calls_saved"] == 2
+    assert aggregate["encoder_calls_saved_per_request"] == 1.0
+
+
+def test_default_and_matching_target_share_a_model_key():
+    assert model_key("default") == model_key(target)
+    assert model_key("onnx") != model_key("default")
+
+
+def test_shared_embeddings_across_columns_and_rows():
+    encoder.calls.clear()
+    request_stats: List[Dict[str, int]] = []
+
+    def record_stats(text: pd.DataFrame, context: Context) -> SingleMetricResult:
+        request_stats.append(embedding_store(context).stats())
+        return SingleMetricResult([0] * len(text))
+
+    stats_metric = SingleMetric(name="response.stats", input_names=["response"], evaluate=record_stats)
+
+    wf = Workflow(
+        metrics=[
+            share_embeddings(lambda: embedding_metric("prompt"), None),
+            share_embeddings([lambda: embedding_metric("response")], None),
+            lambda: stats_metric,
+        ]
+    )
+
+    # The original dependencies were swapped for shared ones
+    assert all(isinstance(it, SharedEmbeddingDependency) for it in wf._context_dependencies)  # pyright: ignore[reportPrivateUsage]
+
+    result = wf.run(pd.DataFrame({"prompt": ["hello", "hi", "hello"], "response": ["hi", "hey there", "hello"]}))
+
+    assert result.metrics["prompt.embedding_length"].tolist() == [5, 2, 5]
+    assert result.metrics["response.embedding_length"].tolist() == [2, 9, 5]
+    # Three distinct texts across both columns, embedded in one call for whichever column was populated first
+    assert sorted(text for call in encoder.calls for text in call) == ["hello", "hey there", "hi"]
+
+    # The counts are the request's own, read from its context
+    assert request_stats[0]["texts_requested"] == 6
+    assert request_stats[0]["texts_encoded"] == 3
+    # Whichever column is populated second either needs one more encoder call or none at all
+    assert request_stats[0]["encoder_calls"] + request_stats[0]["encoder_calls_saved"] == 2
+
+
+def test_cache_evicts_least_recently_used_over_budget():
+    model = ("model", "1")
+    # Each entry is a 32 byte key and 4 float32s
+    cache = EmbeddingCache(max_bytes=3 * (32 + 16))
+    for text in ["a", "b", "c"]:
+        cache.put(cache.key(model, text), torch.ones(4))
+
+    assert cache.get(cache.key(model, "a")) is not None
+    cache.put(cache.key(model, "d"), torch.ones(4))
+
+    assert cache.get(cache.key(model, "b")) is None
+    assert cache.get(cache.key(model, "a")) is not None
+    stats = cache.stats()
+    assert stats["size"] == 3
+    assert stats["bytes"] <= stats["max_bytes"]
+    assert stats["evictions"] == 1
+    assert stats["hit_rate"] == 2 / 3
+
+
+def test_cache_expires_and_stores_float16():
+    model = ("model", "1")
+    cache = EmbeddingCache(ttl_seconds=0.05, dtype="float16")
+    cache.put(cache.key(model, "a"), torch.tensor([0.1, 0.2]))
+
+    cached = cache.get(cache.key(model, "a"))
+    assert cached is not None and cached.dtype == torch.float32
+    assert torch.allclose(cached, torch.tensor([0.1, 0.2]), atol=1e-3)
+    assert cache.stats()["bytes"] == 32 + 4
+
+    time.sleep(0.1)
+    assert cache.get(cache.key(model, "a")) is None
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["bytes"] == 0
+
+
+def test_cache_keys_include_the_model():
+    assert EmbeddingCache.key(("model", "1"), "a") != EmbeddingCache.key(("model", "2"), "a")
+    assert EmbeddingCache.key(("model", "1"), "a") == EmbeddingCache.key(("model", "1"), "a")
+
+
+def test_cache_is_shared_across_requests_and_workflows():
+    encoder.calls.clear()
+    cache = EmbeddingCache()
+    prompts = Workflow(metrics=[share_embeddings(lambda: embedding_metric("prompt"), cache)])
+    responses = Workflow(metrics=[share_embeddings(lambda: embedding_metric("response"), cache)])
+
+    prompts.run(pd.DataFrame({"prompt": ["hello", "hi"]}))
+    result = responses.run(pd.DataFrame({"response": ["hi", "hello", "hey"]}))
+
+    assert result.metrics["response.embedding_length"].tolist() == [2, 5, 3]
+    assert encoder.calls == [("hello", "hi"), ("hey",)]
+    assert cache.stats()["hits"] == 2
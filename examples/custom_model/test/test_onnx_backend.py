@@ -0,0 +1,132 @@
+from pathlib import Path
+from typing import Any, List
+
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+from sentence_transformers import SentenceTransformer
+from sentence_transformers.models import Normalize, Pooling, Transformer
+from transformers import BertConfig, BertForSequenceClassification, BertModel, BertTokenizerFast
+
+from langkit.core.context import Context
+from langkit.core.metric import SingleMetric, SingleMetricResult
+from langkit.core.workflow import Workflow
+from langkit.metrics.embeddings_types import TransformerEmbeddingAdapter
+from langkit.transformer import EmbeddingContextDependency, SentenceTransformerTarget
+from whylogs_config.embeddings import share_embeddings
+from whylogs_config.onnx_backend import (
+    BackendEmbeddingDependency,
+    OnnxClassifier,
+    OnnxSentenceEncoder,
+    artifact_dir,
+    embedding_drift,
+    embedding_encoder,
+    export_classifier,
+    export_sentence_transformer,
+    quantize,
+    toxicity_metric,
+    with_backend,
+)
+
+words = "the a hello world how are you today this is some text about cats and dogs".split()
+texts = ["hello world", "how are you today", "this is some text about cats and dogs", "a"]
+
+
+def tiny_bert(directory: Path) -> Any:
+    """
+    A randomly initialized two layer BERT, so the tests don't need to download anything.
+    """
+    directory.mkdir(parents=True)
+    (directory / "vocab.txt").write_text("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", *words]))
+    torch.manual_seed(0)
+    config = BertConfig(vocab_size=len(words) + 5, hidden_size=32, num_hidden_layers=2, num_attention_heads=2, intermediate_size=64)
+    return config, BertTokenizerFast.from_pretrained(str(directory))
+
+
+@pytest.fixture(scope="module")
+def sentence_transformer(tmp_path_factory: pytest.TempPathFactory) -> Any:
+    directory = tmp_path_factory.mktemp("models") / "bert"
+    config, tokenizer = tiny_bert(directory)
+    BertModel(config).save_pretrained(str(directory))
+    tokenizer.save_pretrained(str(directory))
+    modules: List[Any] = [Transformer(str(directory), max_seq_length=32), Pooling(32, "mean"), Normalize()]
+    return SentenceTransformer(modules=modules, device="cpu")
+
+
+@pytest.fixture(scope="module")
+def exported(sentence_transformer: Any, tmp_path_factory: pytest.TempPathFactory) -> Path:
+    directory = tmp_path_factory.mktemp("onnx") / "revision"
+    export_sentence_transformer(sentence_transformer, directory)
+    quantize(directory)
+    return directory
+
+
+def test_onnx_embeddings_match_torch(sentence_transformer: Any, exported: Path):
+    reference = TransformerEmbeddingAdapter(sentence_transformer)
+
+    onnx = embedding_drift(reference, OnnxSentenceEncoder(exported, "onnx"), texts)
+    int8 = embedding_drift(reference, OnnxSentenceEncoder(exported, "onnx-int8"), texts)
+
+    assert onnx["min_cosine"] > 0.9999
+    assert onnx["max_abs_diff"] < 1e-4
+    assert int8["min_cosine"] > 0.99
+    assert (exported / "model.int8.onnx").stat().st_size < (exported / "model.onnx").stat().st_size
+
+
+def test_cached_artifacts_are_loaded_without_the_torch_model(exported: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("ONNX_MODEL_CACHE_DIR", str(tmp_path))
+    target = SentenceTransformerTarget(name="example/tiny-bert", revision="abc123")
+    directory = artifact_dir(target.name, target.revision)
+    assert directory == tmp_path / "example--tiny-bert" / "abc123"
+
+    # Nothing named example/tiny-bert can be downloaded, so this only works if the cached graph is used
+    directory.parent.mkdir(parents=True)
+    directory.symlink_to(exported)
+    encoder = embedding_encoder(target, "onnx-int8")
+
+    assert isinstance(encoder, OnnxSentenceEncoder)
+    assert encoder.encode(tuple(texts)).shape == (4, 32)
+
+
+def test_with_backend_swaps_embedding_dependencies(exported: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("ONNX_MODEL_CACHE_DIR", str(tmp_path))
+    target = SentenceTransformerTarget(name="example/tiny-bert-workflow", revision="abc123")
+    directory = artifact_dir(target.name, target.revision)
+    directory.parent.mkdir(parents=True)
+    directory.symlink_to(exported)
+
+    dependency = EmbeddingContextDependency(embedding_choice=target, input_column="prompt")
+
+    def udf(df: pd.DataFrame, context: Context) -> SingleMetricResult:
+        return SingleMetricResult(dependency.get_request_data(context).norm(dim=1).tolist())
+
+    def metric() -> SingleMetric:
+        return SingleMetric(name="prompt.embedding_norm", input_names=["prompt"], evaluate=udf, context_dependencies=[dependency])
+
+    wf = Workflow(metrics=[share_embeddings(with_backend(metric, "onnx"), None)])
+    shared = wf._context_dependencies[0]  # pyright: ignore[reportPrivateUsage]
+    assert isinstance(getattr(shared, "dependency"), BackendEmbeddingDependency)
+
+    result = wf.run(pd.DataFrame({"prompt": texts}))
+    assert np.allclose(result.metrics["prompt.embedding_norm"].tolist(), 1.0, atol=1e-5)
+
+
+def test_toxicity_metric_on_onnx(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("ONNX_MODEL_CACHE_DIR", str(tmp_path))
+    config, tokenizer = tiny_bert(tmp_path / "vocab")
+    config.id2label = {0: "non-toxic", 1: "toxic"}
+    model = BertForSequenceClassification(config).eval()
+    export_classifier(model, tokenizer, artifact_dir("example/tiny-toxicity", "abc123"))
+
+    with torch.no_grad():
+        inputs = tokenizer(texts, padding=True, return_tensors="pt")
+        expected = torch.softmax(model(**inputs).logits, dim=1)[:, 1].tolist()
+
+    # Passed to the workflow directly, like in the README
+    wf = Workflow(metrics=[toxicity_metric("prompt", "example/tiny-toxicity", "abc123", backend="onnx")])
+    result = wf.run(pd.DataFrame({"prompt": texts}))
+
+    assert np.allclose(result.metrics["prompt.toxicity.toxicity_score"].tolist(), expected, atol=1e-5)
+    classifier = OnnxClassifier(artifact_dir("example/tiny-toxicity", "abc123"), "onnx")
+    assert classifier.labels == ["non-toxic", "toxic"]
@@ -0,0 +1,179 @@
+import re
+from typing import Any, Iterator, List, Optional, Tuple
+
+import pandas as pd
+import pytest
+import spacy
+from presidio_analyzer import BatchAnalyzerEngine, RecognizerResult
+
+import whylogs_config.pii
+from whylogs_config.pii import (
+    DEFAULT_ENTITIES,
+    ChunkingOptions,
+    PiiResult,
+    PiiResultCache,
+    Window,
+    analyze_chunked,
+    analyze_rows,
+    candidate_pattern,
+    custom_presidio_metric,
+    default_spacy_model,
+    split_windows,
+)
+
+
+class StubNlpEngine:
+    def process_batch(self, texts: List[str], language: str) -> Iterator[Tuple[str, None]]:
+        return ((text, None) for text in texts)
+
+
+class StubAnalyzer:
+    """
+    Finds phone numbers and emails with a regex instead of spaCy and Presidio's recognizers, and records what it was
+    asked to analyze.
+    """
+
+    patterns = {"PHONE_NUMBER": r"\d{3}-\d{3}-\d{4}", "EMAIL_ADDRESS": r"\w+@\w+\.\w+"}
+
+    def __init__(self) -> None:
+        self.nlp_engine = StubNlpEngine()
+        self.texts: List[str] = []
+
+    def analyze(self, text: str, language: str, entities: Optional[List[str]] = None, **kwargs: Any) -> List[RecognizerResult]:
+        self.texts.append(text)
+        return [
+            RecognizerResult(entity_type=entity, start=match.start(), end=match.end(), score=1.0)
+            for entity, pattern in self.patterns.items()
+            if entities is None or entity in entities
+            for match in re.finditer(pattern, text)
+        ]
+
+
+@pytest.fixture
+def stub_analyzer(monkeypatch: pytest.MonkeyPatch) -> StubAnalyzer:
+    analyzer = StubAnalyzer()
+    monkeypatch.setattr(whylogs_config.pii, "get_analyzer", lambda entities=None, spacy_model=None: analyzer)
+    monkeypatch.setattr(
+        whylogs_config.pii, "get_batch_analyzer", lambda entities=None, spacy_model=None: BatchAnalyzerEngine(analyzer_engine=analyzer)
+    )
+    return analyzer
+
+
+def test_batched_analysis_matches_per_row(stub_analyzer: StubAnalyzer):
+    df = pd.DataFrame(
+        {"prompt": ["call 555-555-5555", "no pii", "foo@whylabs.ai or 555-555-1234", "call 555-555-5555", "mail bar@whylabs.ai"]}
+    )
+    batched = custom_presidio_metric("prompt", result_cache=None, prefilter=False)()
+    per_row = custom_presidio_metric("prompt", batched=False, result_cache=None, prefilter=False)()
+
+    batched_result = batched.evaluate(df)
+    # Identical texts are only analyzed once
+    assert stub_analyzer.texts == ["call 555-555-5555", "no pii", "foo@whylabs.ai or 555-555-1234", "mail bar@whylabs.ai"]
+
+    assert batched_result == per_row.evaluate(df)
+    assert batched_result.metrics[0] == [1, 0, 1, 1, 0]
+    assert batched_result.metrics[1] == [0, 0, 1, 0, 1]
+    assert batched_result.metrics[3][1] is None
+
+
+def test_prefilter_skips_rows_without_candidates(stub_analyzer: StubAnalyzer):
+    df = pd.DataFrame({"prompt": ["no pii here", "call 555-555-5555", None, "nothing", float("nan"), "foo@whylabs.ai"]})
+    metric = custom_presidio_metric("prompt", result_cache=PiiResultCache())()
+
+    result = metric.evaluate(df)
+
+    # Only the rows with digits or an @ go through the analyzer, and missing values never do
+    assert stub_analyzer.texts == ["call 555-555-5555", "foo@whylabs.ai"]
+    assert result.metrics[0] == [0, 1, 0, 0, 0, 0]
+    assert result.metrics[1] == [0, 0, 0, 0, 0, 1]
+    assert result.metrics[2] == [0, 0, 0, 0, 0, 0]
+    assert [row is None for row in result.metrics[3]] == [True, False, True, True, True, False]
+
+
+def test_result_cache_evicts_least_recently_used():
+    cache = PiiResultCache(max_size=2, ttl_seconds=None)
+    result = PiiResult(counts=(0, 0, 0), anonymized=None)
+
+    cache.put("a", result)
+    cache.put("b", result)
+    assert cache.get("a") == result  # a is now the most recently used
+    cache.put("c", result)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == result
+    assert cache.get("c") == result
+    assert cache.stats() == {"size": 2, "hits": 3, "misses": 1, "evictions": 1, "expirations": 0}
+
+
+def test_result_cache_expires_entries():
+    cache = PiiResultCache(max_size=2, ttl_seconds=0)
+    cache.put("a", PiiResult(counts=(1, 0, 0), anonymized="<PHONE_NUMBER>"))
+
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_result_cache_key_includes_analyzer_config():
+    key = PiiResultCache.key("my text", DEFAULT_ENTITIES, "en_core_web_sm")
+
+    assert key == PiiResultCache.key("my text", DEFAULT_ENTITIES, "en_core_web_sm")
+    assert key != PiiResultCache.key("my text", DEFAULT_ENTITIES, "en_core_web_lg")
+    assert key != PiiResultCache.key("my text", ("PHONE_NUMBER",), "en_core_web_sm")
+    assert key != PiiResultCache.key("other text", DEFAULT_ENTITIES, "en_core_web_sm")
+
+
+def test_candidate_pattern():
+    pattern = candidate_pattern(DEFAULT_ENTITIES)
+    assert pattern is not None
+
+    assert re.search(pattern, "call me at 555-555-5555")
+    assert re.search(pattern, "foo@whylabs.ai")
+    assert not re.search(pattern, "no pii here")
+
+    # NER based entities can't be prefiltered
+    assert candidate_pattern([*DEFAULT_ENTITIES, "PERSON"]) is None
+
+
+def test_split_windows_cover_text():
+    windows = split_windows(length=1000, window=300, overlap=100)
+
+    assert [(w.start, w.end) for w in windows] == [(0, 300), (200, 500), (400, 700), (600, 900), (800, 1000)]
+    # The owned ranges partition the text
+    assert windows[0].owned_start == 0
+    assert windows[-1].owned_end == 1000
+    for previous, current in zip(windows, windows[1:]):
+        assert previous.owned_end == current.owned_start
+        assert current.start < current.owned_start < previous.end
+
+
+def test_split_windows_short_text():
+    assert split_windows(length=10, window=300, overlap=100) == [Window(start=0, end=10, owned_start=0, owned_end=10)]
+
+
+@pytest.mark.skipif(not spacy.util.is_package(default_spacy_model(DEFAULT_ENTITIES)), reason="Needs the spaCy model installed")
+def test_chunked_analysis_matches_single_pass():
+    filler = "This sentence is only here to make the prompt longer. "
+    pii = [
+        "Call me at 555-555-5555 tomorrow. ",
+        "My email is foo@whylabs.ai, write anytime. ",
+        "The card is 3704 4673 5765 635 for the order. ",
+    ]
+    # Spread the pii throughout the text so that some of it lands on window boundaries
+    text = "".join(filler * (i % 4) + pii[i % len(pii)] for i in range(60))
+    chunking = ChunkingOptions(threshold=500, window=400, overlap=120)
+    spacy_model = default_spacy_model(DEFAULT_ENTITIES)
+
+    single_pass = analyze_rows([text], DEFAULT_ENTITIES, spacy_model)[0]
+    chunked = analyze_chunked(text, chunking, DEFAULT_ENTITIES, spacy_model)
+
+    def key(result: RecognizerResult):
+        return (result.start, result.end, result.entity_type)
+
+    assert len(split_windows(len(text), chunking.window, chunking.overlap)) > 10
+    assert sorted(map(key, chunked)) == sorted(map(key, single_pass))
+
+    df = pd.DataFrame({"prompt": [text]})
+    unchunked_metric = custom_presidio_metric("prompt", spacy_model=spacy_model, result_cache=None)()
+    chunked_metric = custom_presidio_metric("prompt", spacy_model=spacy_model, result_cache=None, chunking=chunking)()
+
+    assert chunked_metric.evaluate(df) == unchunked_metric.evaluate(df)
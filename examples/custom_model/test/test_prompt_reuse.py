@@ -0,0 +1,128 @@
+import time
+from typing import List
+
+import pandas as pd
+from whylogs_container_types import LangkitOptions
+
+from langkit.core.metric import MultiMetric, MultiMetricResult, SingleMetric, SingleMetricResult
+from langkit.core.workflow import Workflow
+from whylogs_config.prompt_reuse import PromptMetricCache, reuse_prompt_metrics
+
+
+def counting_metrics(evaluated: List[str]) -> LangkitOptions:
+    def prompt_length(df: pd.DataFrame) -> SingleMetricResult:
+        evaluated.append("prompt.length")
+        return SingleMetricResult(df["prompt"].str.len().tolist())  # pyright: ignore[reportUnknownMemberType, reportUnknownArgumentType]
+
+    def prompt_stats(df: pd.DataFrame) -> MultiMetricResult:
+        evaluated.append("prompt.stats")
+        words = df["prompt"].str.split().str.len().tolist()  # pyright: ignore[reportUnknownMemberType]
+        return MultiMetricResult([words, [it * 2 for it in words]])  # pyright: ignore[reportUnknownArgumentType]
+
+    def response_length(df: pd.DataFrame) -> SingleMetricResult:
+        evaluated.append("response.length")
+        return SingleMetricResult(df["response"].str.len().tolist())  # pyright: ignore[reportUnknownMemberType, reportUnknownArgumentType]
+
+    return LangkitOptions(
+        metrics=[
+            lambda: SingleMetric(name="prompt.length", input_names=["prompt"], evaluate=prompt_length),
+            lambda: MultiMetric(names=["prompt.words", "prompt.double_words"], input_names=["prompt"], evaluate=prompt_stats),
+            lambda: SingleMetric(name="response.length", input_names=["response"], evaluate=response_length),
+        ]
+    )
+
+
+def workflow(options: LangkitOptions) -> Workflow:
+    return Workflow(metrics=options.metrics)
+
+
+def test_response_request_reuses_prompt_metrics():
+    evaluated: List[str] = []
+    cache = PromptMetricCache()
+    wf = workflow(reuse_prompt_metrics({"model-1": counting_metrics(evaluated)}, cache)["model-1"])
+
+    wf.run(pd.DataFrame({"id": ["a"], "prompt": ["hi there"]}))
+    assert evaluated == ["prompt.length", "prompt.stats"]
+
+    evaluated.clear()
+    result = wf.run(pd.DataFrame({"id": ["a"], "prompt": ["hi there"], "response": ["hello"]}))
+
+    assert evaluated == ["response.length"]
+    assert result.metrics["prompt.length"].tolist() == [8]
+    assert result.metrics["prompt.words"].tolist() == [2]
+    assert result.metrics["prompt.double_words"].tolist() == [4]
+    assert result.metrics["response.length"].tolist() == [5]
+    assert cache.stats()["hits"] == 2
+
+
+def test_different_prompt_dataset_or_missing_id_recompute():
+    evaluated: List[str] = []
+    cache = PromptMetricCache()
+    config = reuse_prompt_metrics({"model-1": counting_metrics(evaluated), "model-2": counting_metrics(evaluated)}, cache)
+    first, second = workflow(config["model-1"]), workflow(config["model-2"])
+
+    first.run(pd.DataFrame({"id": ["a"], "prompt": ["hi"]}))
+    evaluated.clear()
+
+    result = first.run(pd.DataFrame({"id": ["a"], "prompt": ["changed"], "response": ["hello"]}))
+    assert result.metrics["prompt.length"].tolist() == [7]
+    second.run(pd.DataFrame({"id": ["a"], "prompt": ["hi"]}))
+    first.run(pd.DataFrame({"prompt": ["hi"]}))
+
+    assert evaluated.count("prompt.length") == 3
+
+
+def test_batches_only_reuse_when_every_row_matches():
+    evaluated: List[str] = []
+    wf = workflow(reuse_prompt_metrics({"model-1": counting_metrics(evaluated)}, PromptMetricCache())["model-1"])
+
+    wf.run(pd.DataFrame({"id": ["a", "b"], "prompt": ["one", "two words"]}))
+    evaluated.clear()
+
+    result = wf.run(pd.DataFrame({"id": ["b", "a"], "prompt": ["two words", "one"], "response": ["x", "y"]}))
+    assert result.metrics["prompt.length"].tolist() == [9, 3]
+    assert "prompt.length" not in evaluated
+
+    wf.run(pd.DataFrame({"id": ["a", "c"], "prompt": ["one", "three"]}))
+    assert "prompt.length" in evaluated
+
+
+def test_cache_expires_and_evicts():
+    cache = PromptMetricCache(max_size=2, ttl_seconds=0.05)
+    keys = [cache.key("model-1", request_id, "hi", ("prompt.length",)) for request_id in ["a", "b", "c"]]
+    for key in keys:
+        cache.put(key, (2,))
+
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) == (2,)
+    time.sleep(0.1)
+    assert cache.get(keys[1]) is None
+    assert cache.stats() == {
+        "size": 1,
+        "bytes": PromptMetricCache._size(keys[2], (2,)),  # pyright: ignore[reportPrivateUsage]
+        "hits": 1,
+        "misses": 2,
+        "evictions": 1,
+        "expirations": 1,
+    }
+
+
+def test_cache_evicts_over_byte_budget():
+    keys = [PromptMetricCache.key("model-1", request_id, "hi", ("prompt.pii.anonymized",)) for request_id in ["a", "b", "c"]]
+    anonymized = ("x" * 1000,)
+    entry_bytes = PromptMetricCache._size(keys[0], anonymized)  # pyright: ignore[reportPrivateUsage]
+    cache = PromptMetricCache(max_bytes=2 * entry_bytes)
+    for key in keys:
+        cache.put(key, anonymized)
+
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) == anonymized
+    assert cache.stats()["bytes"] == 2 * entry_bytes
+    assert cache.stats()["evictions"] == 1
+
+    # Replacing an entry doesn't count it twice
+    cache.put(keys[2], (1,))
+    assert cache.stats()["bytes"] < 2 * entry_bytes
+
+    cache.clear()
+    assert cache.stats()["bytes"] == 0
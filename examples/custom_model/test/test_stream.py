@@ -0,0 +1,94 @@
+import json
+from typing import Iterator, List
+
+import pandas as pd
+
+from langkit.core.metric import SingleMetric, SingleMetricResult
+from langkit.core.workflow import Workflow
+from langkit.validators.library import lib as validators_lib
+from whylogs_config.stream import ProfileLogger, evaluate_stream, parse_record
+
+
+def prompt_length() -> SingleMetric:
+    return SingleMetric(
+        name="prompt.length",
+        input_names=["prompt"],
+        evaluate=lambda df: SingleMetricResult(df["prompt"].str.len().tolist()),  # pyright: ignore[reportUnknownMemberType, reportUnknownLambdaType, reportUnknownArgumentType]
+    )
+
+
+def workflow() -> Workflow:
+    return Workflow(metrics=[prompt_length], validators=[validators_lib.constraint(target_metric="prompt.length", upper_threshold=5)])
+
+
+def test_results_stream_in_order_with_errors_inline():
+    lines = [
+        json.dumps({"prompt": "hi", "id": "a"}),
+        "not json",
+        "",
+        json.dumps({"prompt": "a long prompt"}),
+        json.dumps({"prompt": "dup", "id": "a"}),
+    ]
+
+    results = [json.loads(line) for line in evaluate_stream(workflow(), lines, batch_size=10)]
+
+    assert [result.get("id") for result in results] == ["a", None, "4", "a"]
+    assert results[0]["action"] == "pass"
+    assert results[0]["metrics"] == {"prompt.length": 2}
+    assert results[1]["line"] == 2 and "error" in results[1]
+    assert results[2]["action"] == "block"
+    assert results[2]["validation_results"][0]["metric"] == "prompt.length"
+    assert results[3]["error"] == "Duplicate id"
+
+
+def test_stream_is_read_one_micro_batch_at_a_time():
+    read: List[int] = []
+
+    def lines() -> Iterator[str]:
+        for i in range(1_000):
+            read.append(i)
+            yield json.dumps({"prompt": "hello", "id": str(i)})
+
+    stream = evaluate_stream(workflow(), lines(), batch_size=8)
+    first = json.loads(next(stream))
+
+    # The first result is ready after the first micro-batch, without reading the rest of the stream
+    assert first["id"] == "0"
+    assert len(read) == 8
+
+    assert sum(1 for _ in stream) == 999
+    assert len(read) == 1_000
+
+
+def test_log_mode_only_returns_metrics():
+    logged: List[pd.DataFrame] = []
+    lines = [json.dumps({"prompt": "hi", "additional_data": {"turn": i}}) for i in range(5)]
+
+    results = [json.loads(line) for line in evaluate_stream(workflow(), lines, batch_size=2, mode="log", log=logged.append)]
+
+    assert results[0] == {"id": "1", "metrics": {"prompt.length": 2}}
+    assert len(results) == 5
+    assert [len(df) for df in logged] == [2, 2, 1]
+    assert logged[0].columns.tolist() == ["id", "prompt", "turn", "prompt.length"]
+
+
+def test_falsy_ids_are_kept_and_bad_additional_data_is_an_error():
+    assert parse_record(3, json.dumps({"prompt": "hi", "id": 0})).id == "0"
+    assert parse_record(3, json.dumps({"prompt": "hi", "id": ""})).id == ""
+    assert parse_record(3, json.dumps({"prompt": "hi", "id": None})).id == "3"
+
+    lines = [json.dumps({"prompt": "hi", "additional_data": ["turn"]}), json.dumps({"prompt": "hi"})]
+    results = [json.loads(line) for line in evaluate_stream(workflow(), lines)]
+
+    assert results[0] == {"line": 1, "error": "Expected additional_data to be a json object"}
+    assert results[1]["id"] == "2"
+
+
+def test_profile_logger_merges_micro_batches():
+    log = ProfileLogger()
+
+    log(pd.DataFrame({"prompt.length": [1, 2]}))
+    log(pd.DataFrame({"prompt.length": [3]}))
+
+    assert log.view is not None
+    assert log.view.to_pandas().loc["prompt.length", "counts/n"] == 3  # pyright: ignore[reportUnknownMemberType]
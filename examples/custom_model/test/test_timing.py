@@ -0,0 +1,113 @@
+import time
+from typing import Any, Dict, List
+
+import pandas as pd
+import pytest
+from whylogs_container_types import LangkitOptions
+
+from langkit.core.context import Context
+from langkit.core.metric import MultiMetric, MultiMetricResult, SingleMetric, SingleMetricResult
+from langkit.core.workflow import Workflow
+from langkit.validators.library import lib as validators_lib
+from whylogs_config.timing import inference, timed_options, timing_stats
+
+
+def slow_metric() -> SingleMetric:
+    def evaluate(df: pd.DataFrame) -> SingleMetricResult:
+        with inference():
+            time.sleep(0.02)
+        return SingleMetricResult([1] * len(df))
+
+    return SingleMetric(name="prompt.slow", input_names=["prompt"], evaluate=evaluate)
+
+
+def context_metric() -> MultiMetric:
+    def evaluate(df: pd.DataFrame, context: Context) -> MultiMetricResult:
+        return MultiMetricResult(metrics=[[0] * len(df), [2] * len(df)])
+
+    return MultiMetric(names=["prompt.a", "prompt.b"], input_names=["prompt"], evaluate=evaluate)
+
+
+def workflow(sample_rate: float, records: List[Dict[str, Any]]) -> Workflow:
+    options = timed_options(
+        LangkitOptions(
+            metrics=[slow_metric, [context_metric]],
+            validators=[validators_lib.constraint(target_metric="prompt.slow", upper_threshold=0)],
+        ),
+        sample_rate=sample_rate,
+        sink=records.append,
+    )
+    return Workflow(metrics=options.metrics, validators=options.validators, callbacks=options.callbacks)
+
+
+def test_timed_requests_record_every_metric_and_validator():
+    records: List[Dict[str, Any]] = []
+    result = workflow(1.0, records).run({"prompt": "hi"})
+
+    # Timing doesn't change the results
+    assert result.metrics["prompt.slow"].tolist() == [1]
+    assert result.metrics["prompt.b"].tolist() == [2]
+    assert len(result.validation_results.report) == 1
+
+    assert len(records) == 1
+    record = records[0]
+    assert record["rows"] == 1
+    assert list(record["metrics"].keys()) == ["prompt.slow", "prompt.a,prompt.b"]
+    assert list(record["validators"].keys()) == ["prompt.slow"]
+
+    slow = record["metrics"]["prompt.slow"]
+    assert set(slow.keys()) == {"wall_sec", "cpu_sec", "inference_sec", "processing_sec"}
+    assert slow["inference_sec"] >= 0.02
+    assert slow["wall_sec"] >= slow["inference_sec"]
+    # Sleeping doesn't use CPU
+    assert slow["cpu_sec"] < slow["inference_sec"]
+    assert record["metrics"]["prompt.a,prompt.b"]["inference_sec"] == 0
+    assert record["total"]["wall_sec"] >= slow["wall_sec"]
+
+    assert timing_stats()["metrics"]["prompt.slow"]["count"] >= 1
+
+
+def test_unsampled_requests_are_not_timed():
+    records: List[Dict[str, Any]] = []
+    wf = workflow(0.0, records)
+    for _ in range(3):
+        wf.run({"prompt": "hi"})
+
+    assert records == []
+
+
+def test_each_request_gets_its_own_record():
+    records: List[Dict[str, Any]] = []
+    wf = workflow(1.0, records)
+    wf.run({"prompt": "hi"})
+    wf.run(pd.DataFrame({"prompt": ["a", "b", "c"]}))
+
+    assert [record["rows"] for record in records] == [1, 3]
+    assert all(len(record["metrics"]) == 2 for record in records)
+
+
+def test_a_failed_request_does_not_leak_into_the_next():
+    def evaluate(df: pd.DataFrame) -> SingleMetricResult:
+        if "boom" in df["prompt"].tolist():
+            raise ValueError("boom")
+        return SingleMetricResult([0] * len(df))
+
+    records: List[Dict[str, Any]] = []
+    options = timed_options(
+        LangkitOptions(
+            metrics=[lambda: SingleMetric(name="prompt.failing", input_names=["prompt"], evaluate=evaluate)],
+            validators=[validators_lib.constraint(target_metric="prompt.failing", upper_threshold=0)],
+        ),
+        sample_rate=1.0,
+        sink=records.append,
+    )
+    wf = Workflow(metrics=options.metrics, validators=options.validators, callbacks=options.callbacks)
+
+    # The callbacks never run for the failed request, so its record is never finished
+    with pytest.raises(ValueError):
+        wf.run(pd.DataFrame({"prompt": ["a", "boom"]}))
+    wf.run(pd.DataFrame({"prompt": ["a", "b", "c"]}))
+
+    assert len(records) == 1
+    assert records[0]["rows"] == 3
+    assert list(records[0]["validators"].keys()) == ["prompt.failing"]
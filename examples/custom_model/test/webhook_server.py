@@ -0,0 +1,62 @@
+"""
+A stand-in for a webhook receiver. Run it with `python -m test.webhook_server` to receive the validation failures that the container
+sends to http://host.docker.internal:8001/failures, or start it from a test with `WebhookServer`.
+"""
+
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+
+class WebhookServer(ThreadingHTTPServer):
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        super().__init__((host, port), _Handler)
+        self.requests: List[Dict[str, Any]] = []
+        self.headers: List[Dict[str, str]] = []
+        # Status codes to respond with before succeeding, for testing retries
+        self.fail_with: List[int] = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host!s}:{port}/failures"
+
+    def start(self) -> "WebhookServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: WebhookServer
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+
+        with self.server.lock:
+            status = self.server.fail_with.pop(0) if self.server.fail_with else 200
+            if status == 200:
+                self.server.requests.append(json.loads(body))
+                self.server.headers.append(dict(self.headers))
+
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+if __name__ == "__main__":
+    server = WebhookServer("0.0.0.0", 8001)
+    _Handler.log_message = BaseHTTPRequestHandler.log_message  # type: ignore[method-assign]
+    print(f"Listening on {server.url}")
+    server.serve_forever()
@@ -0,0 +1,101 @@
+import math
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Literal, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from langkit.core.validation import ValidationFailure
+from langkit.core.workflow import InputContext, Workflow
+
+ActionType = Literal["pass", "flag", "block"]
+
+
+@dataclass(frozen=True)
+class BatchRow:
+    id: str
+    prompt: Optional[str] = None
+    response: Optional[str] = None
+    context: Optional[InputContext] = None
+    additional_data: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class RowResult:
+    id: str
+    metrics: Dict[str, Any]
+    validation_results: List[ValidationFailure]
+    action: ActionType
+    additional_data: Dict[str, Any] = field(default_factory=dict)
+
+
+def _action(failures: List[ValidationFailure]) -> ActionType:
+    if any(failure.failure_level == "block" for failure in failures):
+        return "block"
+    if failures:
+        return "flag"
+    return "pass"
+
+
+def _value(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        value = value.item()
+    # Metrics that don't apply to a row are nan in the combined frame
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def to_frame(rows: Sequence[BatchRow]) -> pd.DataFrame:
+    """
+    One DataFrame for the whole batch. Columns that no row has are left out, so metrics that need them are skipped just
+    like they are for a single request without them. Each row's additional data becomes columns as well.
+    """
+    ids = [row.id for row in rows]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Every row in a batch needs a unique id")
+
+    columns: Dict[str, List[Any]] = {"id": ids}
+    for name in ["prompt", "response", "context"]:
+        values = [getattr(row, name) for row in rows]
+        if any(value is not None for value in values):
+            columns[name] = values
+
+    for key in dict.fromkeys(key for row in rows for key in row.additional_data):
+        if key not in columns:
+            columns[key] = [row.additional_data.get(key) for row in rows]
+
+    return pd.DataFrame(columns)
+
+
+def evaluate_batch(workflow: Workflow, rows: Sequence[BatchRow], log: Optional[Callable[[pd.DataFrame], None]] = None) -> List[RowResult]:
+    """
+    Evaluate every row in a single workflow pass, instead of one pass per row. Metrics see the whole batch at once, so the
+    ones backed by models run their model over the batch together. Results, validation failures and the resulting action
+    are split back out by row id and returned in the same order as `rows`.
+
+    `log`, if given, gets the batch's inputs along with their metrics, e.g. to profile them like `/log_llm` does.
+    """
+    if not rows:
+        return []
+
+    df = to_frame(rows)
+    result = workflow.run(df)
+    if log is not None:
+        log(df.join(result.metrics.drop(columns="id")))  # pyright: ignore[reportUnknownMemberType]
+
+    failures: Dict[str, List[ValidationFailure]] = {row.id: [] for row in rows}
+    for failure in result.validation_results.report:
+        failures[failure.id].append(failure)
+
+    metrics = result.metrics.set_index("id")  # pyright: ignore[reportUnknownMemberType]
+    return [
+        RowResult(
+            id=row.id,
+            metrics={name: _value(value) for name, value in metrics.loc[row.id].items()},  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType, reportUnknownArgumentType]
+            validation_results=failures[row.id],
+            action=_action(failures[row.id]),
+            additional_data=row.additional_data,
+        )
+        for row in rows
+    ]
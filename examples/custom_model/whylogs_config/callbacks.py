@@ -0,0 +1,482 @@
+import copy
+import gzip
+import json
+import logging
+import os
+import pickle
+import queue
+import tempfile
+import threading
+import time
+import weakref
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Any, Deque, Dict, List, Literal, Mapping, Optional
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from langkit.core.metric import MetricResult
+from langkit.core.validation import ValidationResult
+from langkit.core.workflow import Callback
+
+logger = logging.getLogger(__name__)
+
+OverflowBehavior = Literal["drop", "block", "spill"]
+
+
+@dataclass
+class _Delivery:
+    df: pd.DataFrame
+    metric_results: Dict[str, MetricResult]
+    results: pd.DataFrame
+    validation_results: List[ValidationResult]
+    enqueued_at: float = field(default_factory=time.time)
+
+
+class _DeliveryQueue:
+    """
+    The queue, spill files and worker threads behind an AsyncCallback. They're kept apart from the AsyncCallback so the
+    workers don't keep it alive, which lets it be shut down when it's garbage collected.
+    """
+
+    def __init__(
+        self,
+        callback: Callback,
+        max_queue_size: int,
+        workers: int,
+        overflow: OverflowBehavior,
+        block_timeout_sec: Optional[float],
+        spill_dir: Optional[str],
+    ) -> None:
+        self.callback = callback
+        self.overflow = overflow
+        self.block_timeout_sec = block_timeout_sec
+        self._queue: "queue.Queue[Optional[_Delivery]]" = queue.Queue(maxsize=max_queue_size)
+        self._spill_dir = spill_dir or tempfile.mkdtemp(prefix="langkit-callback-spill-")
+        self._spilled: Deque[str] = deque()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        # Spilled deliveries that have been read back but not finished yet. Queued ones are tracked by the queue.
+        self._unspilled_in_flight = 0
+        self._stats: Dict[str, float] = {
+            "delivered": 0,
+            "failed": 0,
+            "dropped": 0,
+            "spilled": 0,
+            "last_lag_sec": 0.0,
+            "max_lag_sec": 0.0,
+        }
+
+        self._workers = [threading.Thread(target=self._run, name=f"async-callback-{i}", daemon=True) for i in range(max(1, workers))]
+        for worker in self._workers:
+            worker.start()
+
+    def put(self, delivery: _Delivery) -> None:
+        if self._stopping.is_set():
+            self._increment("dropped")
+            return
+
+        try:
+            if self.overflow == "block":
+                self._queue.put(delivery, timeout=self.block_timeout_sec)
+            else:
+                self._queue.put_nowait(delivery)
+        except queue.Full:
+            if self.overflow == "spill":
+                self._spill(delivery)
+            else:
+                self._increment("dropped")
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                **self._stats,
+                "queue_depth": self._queue.qsize(),
+                "spill_depth": len(self._spilled),
+            }
+
+    def flush(self, timeout_sec: Optional[float] = None) -> bool:
+        deadline = None if timeout_sec is None else time.monotonic() + timeout_sec
+        while True:
+            with self._lock:
+                if self._queue.unfinished_tasks == 0 and not self._spilled and self._unspilled_in_flight == 0:
+                    return True
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+
+    def shutdown(self, timeout_sec: Optional[float] = 30) -> None:
+        deadline = None if timeout_sec is None else time.monotonic() + timeout_sec
+        if not self.flush(timeout_sec):
+            logger.warning(f"Shutting down {self.callback} with undelivered callbacks: {self.stats()}")
+
+        # Workers stop after their current delivery. The wake up calls are best effort, since a full queue means the
+        # flush timed out and the workers will see the event on their next poll anyway.
+        self._stopping.set()
+        for _ in self._workers:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+        for worker in self._workers:
+            worker.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def _spill(self, delivery: _Delivery) -> None:
+        fd, path = tempfile.mkstemp(dir=self._spill_dir, suffix=".pkl")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(delivery, f)
+        with self._lock:
+            self._spilled.append(path)
+            self._stats["spilled"] += 1
+
+    def _pop_spilled(self) -> Optional[str]:
+        with self._lock:
+            if not self._spilled:
+                return None
+            self._unspilled_in_flight += 1
+            return self._spilled.popleft()
+
+    def _unspill(self, path: str) -> _Delivery:
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        finally:
+            os.remove(path)
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                delivery = self._queue.get(timeout=0.1)
+                if delivery is not None:  # None only wakes the worker up to stop
+                    self._deliver(delivery)
+                self._queue.task_done()
+            except queue.Empty:
+                # Spilled deliveries are only picked up once the queue has drained
+                path = self._pop_spilled()
+                if path is None:
+                    continue
+                try:
+                    self._deliver(self._unspill(path))
+                except Exception as e:
+                    logger.exception(f"Failed to read spilled callback for {self.callback}: {e}")
+                    self._increment("failed")
+                finally:
+                    with self._lock:
+                        self._unspilled_in_flight -= 1
+
+    def _deliver(self, delivery: _Delivery) -> None:
+        lag = time.time() - delivery.enqueued_at
+        with self._lock:
+            self._stats["last_lag_sec"] = lag
+            self._stats["max_lag_sec"] = max(self._stats["max_lag_sec"], lag)
+
+        try:
+            self.callback.post_validation(delivery.df, delivery.metric_results, delivery.results, delivery.validation_results)
+            self._increment("delivered")
+        except Exception as e:
+            logger.exception(f"Callback {self.callback} failed with exception {e}")
+            self._increment("failed")
+
+    def _increment(self, stat: str) -> None:
+        with self._lock:
+            self._stats[stat] += 1
+
+
+class AsyncCallback(Callback):
+    """
+    Wraps a callback so that post_validation runs on worker threads instead of inside the request. Each call is
+    deep copied and put on a bounded queue, so the wrapped callback can't mutate the request's data, including the
+    metric and validation results, and the request doesn't wait for it.
+
+    When the queue is full the call is either dropped, blocks the request until there is room (up to
+    `block_timeout_sec`, after which it's dropped), or is spilled to disk and delivered once the queue drains.
+    Anything still queued is delivered on shutdown(), which runs when the AsyncCallback is garbage collected or
+    the process exits, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        callback: Callback,
+        max_queue_size: int = 1000,
+        workers: int = 1,
+        overflow: OverflowBehavior = "drop",
+        block_timeout_sec: Optional[float] = None,
+        spill_dir: Optional[str] = None,
+    ) -> None:
+        self.callback = callback
+        self.overflow = overflow
+        self._deliveries = _DeliveryQueue(callback, max_queue_size, workers, overflow, block_timeout_sec, spill_dir)
+        # Unlike atexit.register(self.shutdown), this doesn't keep the AsyncCallback alive until the process exits
+        self._finalizer = weakref.finalize(self, self._deliveries.shutdown)
+
+    def post_validation(
+        self,
+        df: pd.DataFrame,
+        metric_results: Mapping[str, MetricResult],
+        results: pd.DataFrame,
+        validation_results: List[ValidationResult],
+    ) -> None:
+        delivery = _Delivery(
+            df=df.copy(deep=True),
+            metric_results=copy.deepcopy(dict(metric_results)),
+            results=results.copy(deep=True),
+            validation_results=copy.deepcopy(list(validation_results)),
+        )
+        self._deliveries.put(delivery)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Queue depth, delivery counts and the lag between a request finishing and its callback starting.
+        """
+        return self._deliveries.stats()
+
+    def flush(self, timeout_sec: Optional[float] = None) -> bool:
+        """
+        Wait until everything that has been queued or spilled so far is delivered. Returns False on timeout.
+        """
+        return self._deliveries.flush(timeout_sec)
+
+    def shutdown(self, timeout_sec: Optional[float] = 30) -> None:
+        """
+        Deliver what's queued, waiting up to `timeout_sec`, and stop the workers. Later calls are dropped.
+        """
+        if self._finalizer.detach() is not None:
+            self._deliveries.shutdown(timeout_sec)
+
+    def __repr__(self) -> str:
+        return f"AsyncCallback({self.callback!r}, overflow={self.overflow})"
+
+
+class _WebhookSender:
+    """
+    The queue, session and sender thread behind a BatchedWebhook, kept apart from it so the thread doesn't keep it alive,
+    like _DeliveryQueue.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        session: requests.Session,
+        max_batch_size: int,
+        max_batch_delay_sec: float,
+        max_retries: int,
+        backoff_sec: float,
+        gzip_body: bool,
+        timeout_sec: float,
+        max_pending: int,
+    ) -> None:
+        self.url = url
+        self.max_batch_size = max_batch_size
+        self.max_batch_delay_sec = max_batch_delay_sec
+        self.max_retries = max_retries
+        self.backoff_sec = backoff_sec
+        self.gzip_body = gzip_body
+        self.timeout_sec = timeout_sec
+        self._session = session
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._stats: Dict[str, int] = {
+            "batches_sent": 0,
+            "failures_sent": 0,
+            "batches_failed": 0,
+            "failures_dropped": 0,
+            "retries": 0,
+        }
+
+        self._thread = threading.Thread(target=self._run, name="batched-webhook", daemon=True)
+        self._thread.start()
+
+    def put(self, failure: Dict[str, Any]) -> None:
+        if self._stopping.is_set():
+            self._increment("failures_dropped")
+            return
+
+        try:
+            self._queue.put_nowait(failure)
+        except queue.Full:
+            self._increment("failures_dropped")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "pending": self._queue.qsize()}
+
+    def flush(self, timeout_sec: Optional[float] = None) -> bool:
+        deadline = None if timeout_sec is None else time.monotonic() + timeout_sec
+        while self._queue.unfinished_tasks > 0:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def shutdown(self, timeout_sec: Optional[float] = 30) -> None:
+        deadline = None if timeout_sec is None else time.monotonic() + timeout_sec
+        if not self.flush(timeout_sec):
+            logger.warning(f"Shutting down the webhook to {self.url} with unsent failures: {self.stats()}")
+
+        # The sender stops retrying and exits after its current request. Waking it up is best effort, since a full
+        # queue means the flush timed out and the sender will see the event on its next poll anyway.
+        self._stopping.set()
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self._thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        self._session.close()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if first is None:  # None only wakes the sender up to stop
+                self._queue.task_done()
+                continue
+
+            batch = [first]
+            wake_ups = 0
+            deadline = time.monotonic() + self.max_batch_delay_sec
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    failure = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if failure is None:
+                    # Send what we have before stopping
+                    wake_ups += 1
+                    break
+                batch.append(failure)
+
+            self._send(batch)
+            for _ in range(len(batch) + wake_ups):
+                self._queue.task_done()
+
+    def _send(self, batch: List[Dict[str, Any]]) -> None:
+        body = json.dumps({"failures": batch}, default=str).encode("utf-8")
+        if self.gzip_body:
+            body = gzip.compress(body)
+
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                self._increment("retries")
+                # Shutting down cuts the backoff short and gives up on the batch
+                if self._stopping.wait(self.backoff_sec * 2 ** (attempt - 1)):
+                    break
+
+            try:
+                response = self._session.post(self.url, data=body, timeout=self.timeout_sec)
+            except requests.RequestException as e:
+                logger.warning(f"Webhook {self.url} failed on attempt {attempt + 1}: {e}")
+                continue
+
+            if response.status_code < 500 and response.status_code != 429:
+                if response.ok:
+                    with self._lock:
+                        self._stats["batches_sent"] += 1
+                        self._stats["failures_sent"] += len(batch)
+                    return
+                # Other 4xx responses won't succeed on a retry
+                logger.error(f"Webhook {self.url} rejected a batch of {len(batch)} failures: {response.status_code} {response.text}")
+                break
+
+            logger.warning(f"Webhook {self.url} returned {response.status_code} on attempt {attempt + 1}")
+
+        with self._lock:
+            self._stats["batches_failed"] += 1
+            self._stats["failures_dropped"] += len(batch)
+
+    def _increment(self, stat: str) -> None:
+        with self._lock:
+            self._stats[stat] += 1
+
+
+class BatchedWebhook(Callback):
+    """
+    Sends validation failures to a webhook in batches, like `webhook.static_bearer_auth_validation_failure` but without
+    doing any I/O inside the request. Failures are queued and a sender thread posts them as
+    `{"failures": [...]}` once `max_batch_size` have accumulated or `max_batch_delay_sec` has passed since the
+    first one, whichever comes first. Each failure has the same `metrics`, `report` and optional `input` fields
+    that the single-failure webhook sends.
+
+    Requests share a keep-alive connection pool. Connection errors and 5xx/429 responses are retried up to
+    `max_retries` times with exponential backoff before the batch is given up on. Anything still queued is sent on
+    shutdown(), which runs when the BatchedWebhook is garbage collected or the process exits, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        auth_token: str = "",
+        auth_header: str = "Authorization",
+        bearer_prefix: str = "Bearer",
+        include_input: bool = False,
+        max_batch_size: int = 100,
+        max_batch_delay_sec: float = 1.0,
+        max_retries: int = 3,
+        backoff_sec: float = 0.5,
+        gzip_body: bool = False,
+        timeout_sec: float = 10.0,
+        max_pending: int = 10_000,
+        pool_size: int = 4,
+    ) -> None:
+        self.url = url
+        self.include_input = include_input
+
+        prefix = f"{bearer_prefix} " if bearer_prefix else ""
+        session = requests.Session()
+        session.headers.update({auth_header: f"{prefix}{auth_token}", "Content-Type": "application/json"})
+        if gzip_body:
+            session.headers["Content-Encoding"] = "gzip"
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        self._sender = _WebhookSender(
+            url, session, max_batch_size, max_batch_delay_sec, max_retries, backoff_sec, gzip_body, timeout_sec, max_pending
+        )
+        self._finalizer = weakref.finalize(self, self._sender.shutdown)
+
+    def post_validation(
+        self,
+        df: pd.DataFrame,
+        metric_results: Mapping[str, MetricResult],
+        results: pd.DataFrame,
+        validation_results: List[ValidationResult],
+    ) -> None:
+        if not validation_results:
+            return
+
+        failure: Dict[str, Any] = {
+            "metrics": results.to_dict(orient="records"),  # pyright: ignore[reportUnknownMemberType]
+            "report": [asdict(it) for it in validation_results],
+        }
+
+        if self.include_input:
+            failure["input"] = df.to_dict(orient="records")  # pyright: ignore[reportUnknownMemberType]
+
+        self._sender.put(failure)
+
+    def stats(self) -> Dict[str, int]:
+        return self._sender.stats()
+
+    def flush(self, timeout_sec: Optional[float] = None) -> bool:
+        """
+        Wait until every failure queued so far has been sent or given up on. Returns False on timeout.
+        """
+        return self._sender.flush(timeout_sec)
+
+    def shutdown(self, timeout_sec: Optional[float] = 30) -> None:
+        """
+        Send what's queued, waiting up to `timeout_sec`, and stop the sender. Later failures are dropped.
+        """
+        if self._finalizer.detach() is not None:
+            self._sender.shutdown(timeout_sec)
+
+    def __repr__(self) -> str:
+        return f"BatchedWebhook({self.url})"
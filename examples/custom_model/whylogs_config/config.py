@@ -1,92 +1,18 @@
-from functools import cache
-from typing import Any, Dict, List, Mapping, Optional
+from typing import Dict, List, Mapping
 
 import pandas as pd
-import spacy
-from presidio_analyzer import AnalyzerEngine, RecognizerResult
-from presidio_anonymizer import AnonymizerEngine
 from whylogs_container_types import ContainerConfiguration, LangkitOptions
 
-from langkit.core.metric import MetricCreator, MetricResult, MultiMetric, MultiMetricResult
+from langkit.core.metric import MetricResult
 from langkit.core.validation import ValidationResult
 from langkit.core.workflow import Callback, Workflow
 from langkit.metrics.library import lib
 from langkit.validators.library import lib as validators_lib
 
-
-@cache
-def get_analyzer() -> AnalyzerEngine:
-    return AnalyzerEngine()
-
-
-@cache
-def get_anonymizer() -> AnonymizerEngine:
-    return AnonymizerEngine()
-
-
-def custom_presidio_metric(input_name: str) -> MetricCreator:
-    def cache_assets():
-        spacy.load("en_core_web_lg")
-
-    def init():
-        get_analyzer()
-        get_anonymizer()
-
-    def udf(text: pd.DataFrame) -> MultiMetricResult:
-        analyzer = get_analyzer()
-        anonymizer = get_anonymizer()
-        entity_types = {
-            "PHONE_NUMBER": f"{input_name}.pii.phone_number",
-            "EMAIL_ADDRESS": f"{input_name}.pii.email_address",
-            "CREDIT_CARD": f"{input_name}.pii.credit_card",
-        }
-
-        # The order here matters
-        metrics: Dict[str, List[int]] = {
-            f"{input_name}.pii.phone_number": [],
-            f"{input_name}.pii.email_address": [],
-            f"{input_name}.pii.credit_card": [],
-        }
-
-        anonymized_metrics: Dict[str, List[Optional[str]]] = {
-            f"{input_name}.pii.anonymized": [],
-        }
-
-        for _index, row in text.iterrows():
-            value: Any = row[input_name]
-            results: List[RecognizerResult] = analyzer.analyze(text=value, language="en")
-
-            grouped: Dict[str, int] = {
-                "PHONE_NUMBER": 0,
-                "EMAIL_ADDRESS": 0,
-                "CREDIT_CARD": 0,
-            }
-            for result in results:
-                if result.entity_type in entity_types:
-                    grouped[result.entity_type] += 1
-
-            for entity_type, metric_name in grouped.items():
-                metrics[entity_types[entity_type]].append(metric_name)
-
-            # Only compute the anonymized text if pii was found
-            anonymized_result = anonymizer.anonymize(text=value, analyzer_results=results).text if results else None  # type: ignore
-            anonymized_metrics[f"{input_name}.pii.anonymized"].append(anonymized_result)
-
-        all_metrics = [
-            *metrics.values(),
-            *anonymized_metrics.values(),
-        ]
-
-        return MultiMetricResult(metrics=all_metrics)
-
-    # Matches the order we get in the udf above
-    metric_names = [
-        f"{input_name}.pii.phone_number",
-        f"{input_name}.pii.email_address",
-        f"{input_name}.pii.credit_card",
-        f"{input_name}.pii.anonymized",
-    ]
-    return lambda: MultiMetric(names=metric_names, input_names=[input_name], evaluate=udf, init=init, cache_assets=cache_assets)
+from .callbacks import AsyncCallback
+from .pii import custom_presidio_metric
+from .prompt_reuse import reuse_prompt_metrics
+from .timing import inference, timed_options
 
 
 class MyCallback(Callback):
@@ -108,25 +34,32 @@ class MyCallback(Callback):
         print(results.transpose())  # pyright: ignore[reportUnknownMemberType]
 
 
-options = LangkitOptions(
-    metrics=[
-        lib.prompt.sentiment.sentiment_score(),
-        lib.response.sentiment.sentiment_score(),
-        custom_presidio_metric("prompt"),
-    ],
-    validators=[
-        validators_lib.constraint(target_metric="prompt.pii.phone_number", upper_threshold=0),
-        validators_lib.constraint(target_metric="prompt.pii.email_address", upper_threshold=0),
-        validators_lib.constraint(target_metric="prompt.pii.credit_card", upper_threshold=0),
-    ],
-    callbacks=[MyCallback()],
+# A METRIC_TIMING_SAMPLE_RATE fraction of requests log the wall and CPU time of each metric and validator
+options = timed_options(
+    LangkitOptions(
+        metrics=[
+            lib.prompt.sentiment.sentiment_score(),
+            lib.response.sentiment.sentiment_score(),
+            custom_presidio_metric("prompt", inference=inference),
+        ],
+        validators=[
+            validators_lib.constraint(target_metric="prompt.pii.phone_number", upper_threshold=0),
+            validators_lib.constraint(target_metric="prompt.pii.email_address", upper_threshold=0),
+            validators_lib.constraint(target_metric="prompt.pii.credit_card", upper_threshold=0),
+        ],
+        # Printing the results is slow, so it's done off of the request path
+        callbacks=[AsyncCallback(MyCallback(), max_queue_size=100, overflow="drop")],
+    )
 )
 
 
-langkit_config: Dict[str, LangkitOptions] = {
-    "model-131": options,
-    "model-180": options,
-}
+# A request with the same id and prompt as an earlier one reuses the earlier prompt metrics instead of computing them again
+langkit_config: Dict[str, LangkitOptions] = reuse_prompt_metrics(
+    {
+        "model-131": options,
+        "model-180": options,
+    }
+)
 
 
 def get_config() -> ContainerConfiguration:
@@ -0,0 +1,136 @@
+"""
+Embed a corpus with the same embedding model that the container's metrics use, in batched forward passes, and write the
+embeddings as one binary buffer instead of json float lists. Run it in the container image to get its exact model.
+
+    poetry run python -m whylogs_config.embedding_export --format npy < corpus.txt > corpus.npy
+    poetry run python -m whylogs_config.embedding_export --format raw --dtype float16 --input corpus.txt --output corpus.bin
+
+Each input line is one text, including blank lines, so the rows line up with the input. The npy format loads with
+`numpy.load`. The raw format is a 16 byte header, the magic bytes `LKEM`, a format version byte, a dtype byte (0 for
+float32, 1 for float16), two padding bytes and the row and column counts as little endian uint32s, followed by the row
+major little endian values. `read_raw` reads it back.
+"""
+
+import argparse
+import struct
+import sys
+from typing import BinaryIO, Dict, Iterable, List, Literal, Sequence, Tuple
+
+import numpy as np
+import numpy.typing as npt
+import torch
+
+from langkit.metrics.embeddings_types import EmbeddingEncoder
+from langkit.transformer import EmbeddingChoiceArg, SentenceTransformerTarget, embedding_adapter
+
+EmbeddingDtype = Literal["float32", "float16"]
+
+_magic = b"LKEM"
+_version = 1
+_header = struct.Struct("<4sBBxxII")
+_dtype_codes: Dict[EmbeddingDtype, int] = {"float32": 0, "float16": 1}
+_little_endian: Dict[EmbeddingDtype, str] = {"float32": "<f4", "float16": "<f2"}
+
+
+def embed_texts(texts: Sequence[str], encoder: EmbeddingEncoder, batch_size: int = 256) -> npt.NDArray[np.float32]:
+    """
+    The embeddings of `texts`, one row per text. Each `batch_size` texts go through the model in a single forward pass.
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be at least 1, got {batch_size}")
+
+    batches: List[npt.NDArray[np.float32]] = []
+    for start in range(0, len(texts), batch_size):
+        encoded = torch.as_tensor(encoder.encode(tuple(texts[start : start + batch_size])))
+        batches.append(encoded.detach().cpu().numpy().astype(np.float32))
+
+    if not batches:
+        # Still the model's width, so an empty corpus can be concatenated with other exports
+        width = torch.as_tensor(encoder.encode(("",))).shape[-1]
+        return np.zeros((0, width), dtype=np.float32)
+    return np.concatenate(batches)
+
+
+def write_raw(embeddings: npt.NDArray[np.floating], output: BinaryIO, dtype: EmbeddingDtype = "float32") -> None:
+    """
+    Write a 2d array of embeddings as the raw header and one contiguous little endian buffer.
+    """
+    if embeddings.ndim != 2:
+        raise ValueError(f"Expected a 2d array of embeddings, got shape {embeddings.shape}")
+
+    rows, columns = embeddings.shape
+    output.write(_header.pack(_magic, _version, _dtype_codes[dtype], rows, columns))
+    output.write(np.ascontiguousarray(embeddings, dtype=_little_endian[dtype]).tobytes())
+
+
+def read_raw(stream: BinaryIO) -> npt.NDArray[np.floating]:
+    """
+    Read back what `write_raw` wrote, in the dtype it was written in.
+    """
+    header = stream.read(_header.size)
+    if len(header) != _header.size:
+        raise ValueError("Truncated embedding header")
+
+    magic, version, dtype_code, rows, columns = _header.unpack(header)
+    if magic != _magic or version != _version:
+        raise ValueError(f"Not a version {_version} embedding buffer")
+
+    dtype = next((name for name, code in _dtype_codes.items() if code == dtype_code), None)
+    if dtype is None:
+        raise ValueError(f"Unknown dtype code {dtype_code}")
+
+    size = rows * columns * np.dtype(_little_endian[dtype]).itemsize
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError(f"Truncated embeddings, expected {size} bytes and got {len(data)}")
+    return np.frombuffer(data, dtype=_little_endian[dtype]).reshape(rows, columns)
+
+
+def write_npy(embeddings: npt.NDArray[np.floating], output: BinaryIO, dtype: EmbeddingDtype = "float32") -> None:
+    np.save(output, np.ascontiguousarray(embeddings, dtype=_little_endian[dtype]), allow_pickle=False)
+
+
+def read_texts(lines: Iterable[str]) -> List[str]:
+    """
+    One text per line, blank lines included, so row `i` of the embeddings is always line `i + 1` of the input.
+    """
+    return [line.rstrip("\r\n") for line in lines]
+
+
+def _choice(model: str, revision: str) -> EmbeddingChoiceArg:
+    if model in ("default", "onnx"):
+        return model  # pyright: ignore[reportReturnType]
+    return SentenceTransformerTarget(name=model, revision=revision)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="default", help="default, onnx or a sentence transformers model name")
+    parser.add_argument("--revision", default="main", help="The revision of a sentence transformers model")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--format", choices=["raw", "npy"], default="npy")
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--input", help="Defaults to stdin")
+    parser.add_argument("--output", help="Defaults to stdout")
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input) as f:
+            texts = read_texts(f)
+    else:
+        texts = read_texts(sys.stdin)
+
+    embeddings = embed_texts(texts, embedding_adapter(_choice(args.model, args.revision)), args.batch_size)
+    write = write_raw if args.format == "raw" else write_npy
+    if args.output:
+        with open(args.output, "wb") as f:
+            write(embeddings, f, args.dtype)
+    else:
+        write(embeddings, sys.stdout.buffer, args.dtype)
+
+    shape: Tuple[int, ...] = embeddings.shape
+    print(f"Wrote {shape[0]} embeddings of size {shape[1]} as {args.dtype} {args.format}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
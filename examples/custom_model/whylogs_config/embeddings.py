@@ -0,0 +1,346 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Deque, Dict, List, Literal, Optional, Sequence, Tuple
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+import torch
+
+from langkit.core.context import Context, ContextDependency
+from langkit.core.metric import Metric, MetricCreator, MultiMetric, SingleMetric
+from langkit.onnx_encoder import TransformerModel
+from langkit.transformer import DefaultChoice, EmbeddingChoiceArg, EmbeddingContextDependency
+
+from .onnx_backend import BackendEmbeddingDependency
+
+# The model name and revision
+ModelKey = Tuple[str, str]
+
+
+def model_key(choice: EmbeddingChoiceArg) -> ModelKey:
+    """
+    The model behind an embedding choice. `"default"` and a SentenceTransformerTarget for the same model and revision
+    produce the same embeddings, so they share a key.
+    """
+    if choice == "default":
+        default = DefaultChoice()
+        return default.name, default.revision
+    if choice == "onnx":
+        name, revision = TransformerModel.AllMiniLM.value
+        return f"onnx/{name}", revision
+    return choice.name, choice.revision
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of embeddings across requests, keyed by a hash of the model name, revision and text. Embeddings
+    are stored as compact float32 or float16 arrays, and the least recently used ones are evicted once they take up more
+    than `max_bytes`. Entries older than `ttl_seconds` are treated as misses. Safe to share between workflows and request
+    threads.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl_seconds: Optional[float] = None,
+        dtype: Literal["float32", "float16"] = "float32",
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.dtype = np.dtype(dtype)
+        self._entries: OrderedDict[bytes, Tuple[float, npt.NDArray[Any]]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def key(model: ModelKey, text: str) -> bytes:
+        digest = hashlib.sha256()
+        digest.update(f"{model[0]}\0{model[1]}\0".encode())
+        digest.update(text.encode())
+        return digest.digest()
+
+    @staticmethod
+    def _size(key: bytes, embedding: npt.NDArray[Any]) -> int:
+        return len(key) + embedding.nbytes
+
+    def get(self, key: bytes) -> Optional[torch.Tensor]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            created, embedding = entry
+            if self.ttl_seconds is not None and time.monotonic() - created > self.ttl_seconds:
+                del self._entries[key]
+                self._bytes -= self._size(key, embedding)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        # Metrics always get float32, whatever the storage type
+        return torch.from_numpy(embedding.astype(np.float32))
+
+    def put(self, key: bytes, embedding: torch.Tensor) -> None:
+        stored = embedding.detach().cpu().numpy().astype(self.dtype)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= self._size(key, previous[1])
+
+            self._entries[key] = (time.monotonic(), stored)
+            self._bytes += self._size(key, stored)
+            while self._bytes > self.max_bytes and self._entries:
+                evicted_key, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= self._size(evicted_key, evicted)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+# The default cache for share_embeddings, so every dataset that uses the same model shares its embeddings
+embedding_cache = EmbeddingCache()
+
+
+@dataclass
+class RequestEmbeddingStats:
+    """
+    What sharing embeddings saved in a single request. `encoder_calls_saved` counts the lookups that didn't need a
+    forward pass at all, because every text was already in the request's store or the cache.
+    """
+
+    texts_requested: int = 0
+    texts_encoded: int = 0
+    encoder_calls: int = 0
+    encoder_calls_saved: int = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        return {
+            "texts_requested": self.texts_requested,
+            "texts_encoded": self.texts_encoded,
+            "texts_saved": self.texts_requested - self.texts_encoded,
+            "encoder_calls": self.encoder_calls,
+            "encoder_calls_saved": self.encoder_calls_saved,
+        }
+
+
+class EmbeddingStats:
+    """
+    Aggregates the RequestEmbeddingStats of the last `window` requests, so the averages follow the current traffic
+    rather than everything since startup.
+    """
+
+    def __init__(self, window: int = 1000) -> None:
+        self._requests: Deque[RequestEmbeddingStats] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, request: RequestEmbeddingStats) -> None:
+        with self._lock:
+            self._requests.append(request)
+
+    def record(self, request: RequestEmbeddingStats, texts: int, encoded: int) -> None:
+        # Under the same lock as stats(), so it never sees half of an update
+        with self._lock:
+            request.texts_requested += texts
+            request.texts_encoded += encoded
+            if encoded:
+                request.encoder_calls += 1
+            else:
+                request.encoder_calls_saved += 1
+
+    def snapshot(self, request: RequestEmbeddingStats) -> Dict[str, int]:
+        with self._lock:
+            return request.to_dict()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            requests = [replace(it) for it in self._requests]
+        saved = [it.encoder_calls_saved for it in requests]
+        texts_requested = sum(it.texts_requested for it in requests)
+        texts_encoded = sum(it.texts_encoded for it in requests)
+        return {
+            "requests": len(requests),
+            "texts_requested": texts_requested,
+            "texts_encoded": texts_encoded,
+            "texts_saved": texts_requested - texts_encoded,
+            "encoder_calls": sum(it.encoder_calls for it in requests),
+            "encoder_calls_saved": sum(saved),
+            "encoder_calls_saved_per_request": sum(saved) / len(requests) if requests else 0.0,
+            "max_encoder_calls_saved_per_request": max(saved, default=0),
+        }
+
+
+# The default aggregate for EmbeddingStores, which every request's store adds itself to
+embedding_stats = EmbeddingStats()
+
+
+class EmbeddingStore:
+    """
+    Embeddings computed during a single request, keyed by model and text. Every embedding backed metric in the request
+    reads from and writes to the same store, so each distinct text is only embedded once per model, even when it's in
+    more than one column or in more than one row. What that saved is kept in `request_stats`, and added to
+    `aggregate` unless it's None.
+    """
+
+    def __init__(self, aggregate: Optional[EmbeddingStats] = embedding_stats) -> None:
+        self._embeddings: Dict[Tuple[ModelKey, str], torch.Tensor] = {}
+        self._lock = threading.Lock()
+        # Without an aggregate, the store still needs somewhere to lock its counts
+        self._aggregate = aggregate or EmbeddingStats(window=1)
+        self.request_stats = RequestEmbeddingStats()
+        self._aggregate.add(self.request_stats)
+
+    def encode(
+        self,
+        model: ModelKey,
+        texts: Sequence[str],
+        encode: Callable[[Tuple[str, ...]], torch.Tensor],
+        cache: Optional[EmbeddingCache] = None,
+    ) -> torch.Tensor:
+        """
+        The embeddings of `texts`, one row per text, only calling `encode` for the distinct texts that haven't been
+        embedded with this model yet, in this request or, if there's a `cache`, in an earlier one.
+        """
+        with self._lock:
+            missing = list(dict.fromkeys(text for text in texts if (model, text) not in self._embeddings))
+
+        if cache is not None and missing:
+            uncached: List[str] = []
+            for text in missing:
+                cached = cache.get(cache.key(model, text))
+                if cached is None:
+                    uncached.append(text)
+                else:
+                    with self._lock:
+                        self._embeddings[(model, text)] = cached
+            missing = uncached
+
+        if missing:
+            # Kept on the CPU, like the cached embeddings they get stacked with
+            encoded = torch.as_tensor(encode(tuple(missing))).cpu()
+            with self._lock:
+                for text, embedding in zip(missing, encoded):
+                    self._embeddings[(model, text)] = embedding
+            if cache is not None:
+                for text, embedding in zip(missing, encoded):
+                    cache.put(cache.key(model, text), embedding)
+
+        self._aggregate.record(self.request_stats, len(texts), len(missing))
+
+        with self._lock:
+            return torch.stack([self._embeddings[(model, text)] for text in texts])
+
+    def stats(self) -> Dict[str, int]:
+        """
+        This request's counts. `texts_saved` is the number of texts that didn't have to go through the model, and
+        `encoder_calls_saved` the number of forward passes that were skipped entirely.
+        """
+        return self._aggregate.snapshot(self.request_stats)
+
+
+_store_key = "embeddings.store"
+
+
+def embedding_store(context: Context) -> EmbeddingStore:
+    """
+    The request's EmbeddingStore, created by whichever dependency needs it first. The workflow doesn't populate its
+    dependencies in a set order, so the store can't be a dependency of its own.
+    """
+    if _store_key not in context.request_data:
+        context.request_data[_store_key] = EmbeddingStore()
+    return context.request_data[_store_key]
+
+
+@dataclass(frozen=True)
+class SharedEmbeddingDependency(ContextDependency[torch.Tensor]):
+    """
+    Wraps an EmbeddingContextDependency so it gets its embeddings from the request's EmbeddingStore. It has the same
+    name, so metrics that read from the dependency it wraps get the same embeddings.
+    """
+
+    dependency: EmbeddingContextDependency
+    cache: Optional[EmbeddingCache] = embedding_cache
+
+    def name(self) -> str:
+        return self.dependency.name()
+
+    def cache_assets(self) -> None:
+        self.dependency.cache_assets()
+
+    def init(self) -> None:
+        self.dependency.init()
+
+    def populate_request(self, context: Context, data: pd.DataFrame) -> None:
+        column = self.dependency.input_column
+        if column not in data.columns or self.name() in context.request_data:
+            return
+
+        texts: List[str] = data[column].tolist()  # pyright: ignore[reportUnknownMemberType]
+        encoder = self.dependency._get_encoder()  # pyright: ignore[reportPrivateUsage]
+        model = model_key(self.dependency.embedding_choice)
+        if isinstance(self.dependency, BackendEmbeddingDependency) and self.dependency.backend != "torch":
+            # Each backend's embeddings are slightly different, so they're stored and cached separately
+            model = (f"{model[0]}@{self.dependency.backend}", model[1])
+        context.request_data[self.name()] = embedding_store(context).encode(model, texts, encoder.encode, self.cache)
+
+    def get_request_data(self, context: Context) -> torch.Tensor:
+        return self.dependency.get_request_data(context)
+
+
+def _shared_dependency(dependency: ContextDependency[Any], cache: Optional[EmbeddingCache]) -> ContextDependency[Any]:
+    if isinstance(dependency, EmbeddingContextDependency):
+        return SharedEmbeddingDependency(dependency, cache)
+    return dependency
+
+
+def _shared_metric(metric: Metric, cache: Optional[EmbeddingCache]) -> Metric:
+    if not metric.context_dependencies:
+        return metric
+    return replace(metric, context_dependencies=[_shared_dependency(it, cache) for it in metric.context_dependencies])
+
+
+def _shared_created(created: Any, cache: Optional[EmbeddingCache]) -> Any:
+    if isinstance(created, (SingleMetric, MultiMetric)):
+        return _shared_metric(created, cache)
+    if isinstance(created, list):
+        return [_shared_created(it, cache) for it in created]  # pyright: ignore[reportUnknownVariableType]
+    return share_embeddings(created, cache)
+
+
+def share_embeddings(creator: MetricCreator, cache: Optional[EmbeddingCache] = embedding_cache) -> MetricCreator:
+    """
+    Make the metrics from `creator`, like langkit's similarity and topic metrics, get their embeddings from the request's
+    EmbeddingStore instead of each embedding their column on their own. Embeddings are also looked up in and added to
+    `cache`, which is shared by every dataset by default. Pass None to only share them within a request.
+    """
+    if isinstance(creator, list):
+        return [share_embeddings(it, cache) for it in creator]
+    return lambda: _shared_created(creator(), cache)
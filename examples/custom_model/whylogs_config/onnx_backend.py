@@ -0,0 +1,373 @@
+"""
+ONNX Runtime backends for langkit's transformer metrics. The pinned Hugging Face revision of a model is exported to an
+ONNX graph the first time it's needed, optionally quantized to int8 weights, and cached on disk under
+ONNX_MODEL_CACHE_DIR, so later processes load the converted graph directly.
+
+- `torch` is langkit's own PyTorch model, unchanged.
+- `onnx` is the same model exported to a float32 ONNX graph.
+- `onnx-int8` is the float32 graph with dynamically quantized int8 weights, which is smaller and faster on CPUs at some cost
+  in accuracy. Use `embedding_drift` to check that cost for a model before switching to it.
+
+Quantization needs the `onnx` package, which onnxruntime only uses for its quantization tools.
+"""
+
+import inspect
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import nullcontext
+from dataclasses import dataclass, replace
+from functools import cache
+from pathlib import Path
+from typing import Any, Callable, ContextManager, Dict, List, Literal, Optional, Sequence, Tuple, cast
+
+import numpy as np
+import numpy.typing as npt
+import onnxruntime as ort  # pyright: ignore[reportMissingTypeStubs]
+import pandas as pd
+import torch
+from transformers import AutoModelForSequenceClassification, AutoTokenizer, PreTrainedTokenizerBase
+
+from langkit.core.metric import Metric, MetricCreator, MultiMetric, SingleMetric, SingleMetricResult, UdfInput
+from langkit.metrics.embeddings_types import EmbeddingEncoder
+from langkit.metrics.toxicity import toxicity_metric as langkit_toxicity_metric
+from langkit.transformer import DefaultChoice, EmbeddingChoiceArg, EmbeddingContextDependency, SentenceTransformerTarget, embedding_adapter
+
+logger = logging.getLogger(__name__)
+
+Backend = Literal["torch", "onnx", "onnx-int8"]
+
+CACHE_DIR_ENV = "ONNX_MODEL_CACHE_DIR"
+
+DEFAULT_TOXICITY_MODEL = "martin-ha/toxic-comment-model"
+DEFAULT_TOXICITY_REVISION = "9842c08b35a4687e7b211187d676986c8c96256d"
+
+_model_file = "model.onnx"
+_quantized_model_file = "model.int8.onnx"
+_metadata_file = "onnx.json"
+
+# Exports and quantization write several files, so only one thread converts a model at a time
+_convert_lock = threading.Lock()
+
+
+def cache_dir() -> Path:
+    return Path(os.environ.get(CACHE_DIR_ENV, Path.home() / ".cache" / "whylogs_config" / "onnx"))
+
+
+def artifact_dir(model: str, revision: str) -> Path:
+    """
+    Where the converted graphs of a model revision are cached. Every revision gets its own directory, so changing a pinned
+    revision never loads a graph that was exported from another one.
+    """
+    return cache_dir() / model.replace("/", "--") / revision
+
+
+def _graph_path(directory: Path, backend: Backend) -> Path:
+    if backend == "torch":
+        raise ValueError("The torch backend doesn't use an ONNX graph")
+    return directory / (_quantized_model_file if backend == "onnx-int8" else _model_file)
+
+
+def _is_converted(directory: Path, backend: Backend) -> bool:
+    return (directory / _metadata_file).exists() and _graph_path(directory, backend).exists()
+
+
+class _SingleOutput(torch.nn.Module):
+    """
+    Only returns one of the outputs of a Hugging Face model, so the exported graph has a single named output.
+    """
+
+    def __init__(self, model: torch.nn.Module, inputs: List[str], output: str) -> None:
+        super().__init__()
+        self.model = model
+        self.inputs = inputs
+        self.output = output
+
+    def forward(self, *inputs: torch.Tensor) -> torch.Tensor:
+        return getattr(self.model(**dict(zip(self.inputs, inputs))), self.output)
+
+
+def _export(model: torch.nn.Module, tokenizer: PreTrainedTokenizerBase, output: str, directory: Path, metadata: Dict[str, Any]) -> None:
+    """
+    Export `model` to a float32 graph with a dynamic batch size and sequence length, along with its tokenizer and the
+    metadata that inference needs. Everything is written to a temporary directory that is moved into place at the end, so
+    a process that dies halfway through never leaves a partial artifact behind.
+    """
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(dir=directory.parent, prefix=f".{directory.name}-"))
+    try:
+        # Padded, so the attention mask is part of the traced graph rather than skipped as all ones
+        sample = tokenizer(["an example input", "example"], padding=True, return_tensors="pt")
+        # Whatever the tokenizer produces, like BERT's token_type_ids, so the graph gets the same inputs as the torch model
+        inputs = [name for name in tokenizer.model_input_names if name in sample]
+        # Newer versions of torch default to the dynamo exporter, which needs onnxscript
+        options: Dict[str, Any] = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+        with torch.no_grad():
+            torch.onnx.export(
+                # The exporter restores the wrapper's training mode afterwards, and with it the model's
+                _SingleOutput(model, inputs, output).eval(),
+                tuple(sample[name] for name in inputs),
+                str(staging / _model_file),
+                input_names=inputs,
+                output_names=[output],
+                dynamic_axes={**{name: {0: "batch", 1: "sequence"} for name in inputs}, output: {0: "batch"}},
+                opset_version=17,
+                **options,
+            )
+        tokenizer.save_pretrained(str(staging))
+        (staging / _metadata_file).write_text(json.dumps({"inputs": inputs, "output": output, **metadata}))
+        os.replace(staging, directory)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+        # Another process exported the same revision first
+        if not _is_converted(directory, "onnx"):
+            raise
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+def quantize(directory: Path) -> Path:
+    """
+    Write an int8 copy of the float32 graph in `directory`, with dynamically quantized weights.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic  # pyright: ignore[reportMissingTypeStubs]
+
+    quantized = directory / _quantized_model_file
+    staging = directory / f"{_quantized_model_file}.tmp"
+    quantize_dynamic(str(directory / _model_file), str(staging), weight_type=QuantType.QInt8)
+    os.replace(staging, quantized)
+    return quantized
+
+
+def _is_mean_pooling(pooling: Any) -> bool:
+    config: Dict[str, Any] = pooling.get_config_dict()
+    if "pooling_mode" in config:
+        return config["pooling_mode"] == "mean"
+    # Older versions of sentence transformers have a flag per pooling mode
+    modes = {key for key, value in config.items() if key.startswith("pooling_mode_") and value is True}
+    return modes == {"pooling_mode_mean_tokens"}
+
+
+def export_sentence_transformer(transformer: Any, directory: Path) -> None:
+    """
+    Export a SentenceTransformer made of a transformer, mean pooling and optionally normalization, like all-MiniLM-L6-v2.
+    Pooling and normalization happen outside of the graph, in OnnxSentenceEncoder.
+    """
+    from sentence_transformers.models import Normalize, Pooling
+
+    pooling = [module for module in transformer if isinstance(module, Pooling)]
+    if len(pooling) != 1 or not _is_mean_pooling(pooling[0]):
+        raise ValueError("Only sentence transformers with mean pooling can be exported")
+
+    metadata = {"max_length": transformer.max_seq_length, "normalize": any(isinstance(module, Normalize) for module in transformer)}
+    _export(transformer[0].auto_model, transformer.tokenizer, "last_hidden_state", directory, metadata)
+
+
+def export_classifier(model: torch.nn.Module, tokenizer: PreTrainedTokenizerBase, directory: Path) -> None:
+    config: Any = getattr(model, "config")
+    labels = [config.id2label[i] for i in range(len(config.id2label))]
+    # Tokenizers without a configured limit report a huge model_max_length
+    max_length = min(tokenizer.model_max_length, config.max_position_embeddings)
+    _export(model, tokenizer, "logits", directory, {"max_length": max_length, "labels": labels})
+
+
+class _OnnxModel:
+    def __init__(self, directory: Path, backend: Backend) -> None:
+        self.metadata: Dict[str, Any] = json.loads((directory / _metadata_file).read_text())
+        self.tokenizer = AutoTokenizer.from_pretrained(str(directory))
+        self.session = ort.InferenceSession(str(_graph_path(directory, backend)), providers=["CPUExecutionProvider"])
+
+    def run(self, texts: Sequence[str]) -> Tuple[npt.NDArray[np.float32], npt.NDArray[np.int64]]:
+        inputs = self.tokenizer(list(texts), padding=True, truncation=True, max_length=self.metadata["max_length"], return_tensors="np")
+        feed = {name: np.asarray(inputs[name], dtype=np.int64) for name in self.metadata["inputs"]}
+        (output,) = self.session.run([self.metadata["output"]], feed)
+        return cast(npt.NDArray[np.float32], output), feed["attention_mask"]
+
+
+class OnnxSentenceEncoder(EmbeddingEncoder):
+    """
+    Embeds texts with an exported sentence transformer graph, doing its mean pooling and normalization in numpy.
+    """
+
+    def __init__(self, directory: Path, backend: Backend) -> None:
+        self._model = _OnnxModel(directory, backend)
+
+    def encode(self, text: Tuple[str, ...]) -> torch.Tensor:
+        if not text:
+            return torch.zeros((0, 0))
+
+        tokens, mask = self._model.run(text)
+        weights = mask[:, :, None].astype(np.float32)
+        embeddings = (tokens * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        if self._model.metadata["normalize"]:
+            embeddings = embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return torch.from_numpy(embeddings.astype(np.float32))
+
+
+class OnnxClassifier:
+    """
+    Scores texts with an exported sequence classification graph.
+    """
+
+    def __init__(self, directory: Path, backend: Backend) -> None:
+        self._model = _OnnxModel(directory, backend)
+        self.labels: List[str] = self._model.metadata["labels"]
+
+    def scores(self, texts: Sequence[str]) -> npt.NDArray[np.float32]:
+        """
+        The probability of each label, one row per text.
+        """
+        if not texts:
+            return np.zeros((0, len(self.labels)), dtype=np.float32)
+
+        logits, _ = self._model.run(texts)
+        exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+
+
+def _sentence_target(choice: EmbeddingChoiceArg) -> Optional[SentenceTransformerTarget]:
+    if choice == "default":
+        default = DefaultChoice()
+        return SentenceTransformerTarget(name=default.name, revision=default.revision)
+    if choice == "onnx":
+        return None
+    return choice
+
+
+@cache
+def embedding_encoder(choice: EmbeddingChoiceArg, backend: Backend) -> EmbeddingEncoder:
+    """
+    The encoder for an embedding choice on a backend, exporting and quantizing the pinned revision on first use. The
+    `"onnx"` choice is already langkit's own ONNX model, so it ignores the backend.
+    """
+    target = _sentence_target(choice)
+    if backend == "torch" or target is None:
+        return embedding_adapter(choice)
+
+    directory = artifact_dir(target.name, target.revision)
+    with _convert_lock:
+        if not _is_converted(directory, "onnx"):
+            from sentence_transformers import SentenceTransformer
+
+            logger.info(f"Exporting {target.name}@{target.revision} to {directory}")
+            export_sentence_transformer(SentenceTransformer(target.name, revision=target.revision, device="cpu"), directory)
+        if backend == "onnx-int8" and not _is_converted(directory, backend):
+            logger.info(f"Quantizing {target.name}@{target.revision}")
+            quantize(directory)
+    return OnnxSentenceEncoder(directory, backend)
+
+
+@cache
+def classifier(model: str, revision: str, backend: Backend) -> OnnxClassifier:
+    if backend == "torch":
+        raise ValueError("The torch backend uses langkit's own pipeline")
+
+    directory = artifact_dir(model, revision)
+    with _convert_lock:
+        if not _is_converted(directory, "onnx"):
+            logger.info(f"Exporting {model}@{revision} to {directory}")
+            export_classifier(
+                AutoModelForSequenceClassification.from_pretrained(model, revision=revision),
+                AutoTokenizer.from_pretrained(model, revision=revision),
+                directory,
+            )
+        if backend == "onnx-int8" and not _is_converted(directory, backend):
+            logger.info(f"Quantizing {model}@{revision}")
+            quantize(directory)
+    return OnnxClassifier(directory, backend)
+
+
+@dataclass(frozen=True)
+class BackendEmbeddingDependency(EmbeddingContextDependency):
+    """
+    An EmbeddingContextDependency that embeds with `backend`. It keeps the name of the dependency it replaces, so the
+    metrics that read from that dependency get these embeddings instead.
+    """
+
+    backend: Backend = "torch"
+
+    def _get_encoder(self) -> EmbeddingEncoder:
+        return embedding_encoder(self.embedding_choice, self.backend)
+
+
+def _backend_metric(metric: Metric, backend: Backend) -> Metric:
+    if not metric.context_dependencies:
+        return metric
+
+    dependencies = [
+        BackendEmbeddingDependency(it.embedding_choice, it.input_column, backend) if isinstance(it, EmbeddingContextDependency) else it
+        for it in metric.context_dependencies
+    ]
+    return replace(metric, context_dependencies=dependencies)
+
+
+def _backend_created(created: Any, backend: Backend) -> Any:
+    if isinstance(created, (SingleMetric, MultiMetric)):
+        return _backend_metric(created, backend)
+    if isinstance(created, list):
+        return [_backend_created(it, backend) for it in created]  # pyright: ignore[reportUnknownVariableType]
+    return with_backend(created, backend)
+
+
+def with_backend(creator: MetricCreator, backend: Backend) -> MetricCreator:
+    """
+    Make the embedding based metrics from `creator`, like langkit's similarity metrics, embed with `backend`. Every
+    metric in a workflow that embeds the same column with the same model has to use the same backend. Apply it before
+    `share_embeddings`.
+    """
+    if backend == "torch":
+        return creator
+    if isinstance(creator, list):
+        return [with_backend(it, backend) for it in creator]
+    return lambda: _backend_created(creator(), backend)
+
+
+def toxicity_metric(
+    column_name: str,
+    hf_model: Optional[str] = None,
+    hf_model_revision: Optional[str] = None,
+    backend: Backend = "torch",
+    inference: Callable[[], ContextManager[Any]] = nullcontext,
+) -> Callable[[], Metric]:
+    """
+    A creator for langkit's toxicity metric on `backend`, with the same name and the same score, the probability of the
+    toxic label. On the ONNX backends each model call runs inside `inference()`, like timing.inference.
+    """
+    if backend == "torch":
+        return lambda: langkit_toxicity_metric(column_name, hf_model, hf_model_revision)
+
+    model = hf_model or DEFAULT_TOXICITY_MODEL
+    revision = hf_model_revision or DEFAULT_TOXICITY_REVISION
+
+    def init() -> None:
+        classifier(model, revision, backend)
+
+    def udf(text: pd.DataFrame) -> SingleMetricResult:
+        scorer = classifier(model, revision, backend)
+        texts = list(UdfInput(text).iter_column_rows(column_name))
+        with inference():
+            scores = scorer.scores(texts)
+        return SingleMetricResult(scores[:, scorer.labels.index("toxic")].tolist())
+
+    return lambda: SingleMetric(
+        name=f"{column_name}.toxicity.toxicity_score", input_names=[column_name], evaluate=udf, init=init, cache_assets=init
+    )
+
+
+def embedding_drift(reference: EmbeddingEncoder, candidate: EmbeddingEncoder, texts: Sequence[str]) -> Dict[str, float]:
+    """
+    How far the candidate's embeddings are from the reference's for the same texts, typically a quantized backend against
+    torch. Similarity metrics compare embeddings by cosine similarity, so that's what matters most.
+    """
+    expected = torch.as_tensor(reference.encode(tuple(texts))).cpu().float()
+    actual = torch.as_tensor(candidate.encode(tuple(texts))).cpu().float()
+    cosine = torch.nn.functional.cosine_similarity(expected, actual, dim=1)
+    return {
+        "min_cosine": float(cosine.min()),
+        "mean_cosine": float(cosine.mean()),
+        "max_abs_diff": float((expected - actual).abs().max()),
+    }
@@ -0,0 +1,388 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from dataclasses import dataclass
+from functools import cache
+from typing import Any, Callable, ContextManager, Dict, List, Optional, Sequence, Tuple, cast
+
+import pandas as pd
+import spacy
+from presidio_analyzer import AnalyzerEngine, BatchAnalyzerEngine, EntityRecognizer, RecognizerRegistry, RecognizerResult
+from presidio_analyzer.nlp_engine import SpacyNlpEngine
+from presidio_anonymizer import AnonymizerEngine
+
+from langkit.core.metric import MetricCreator, MultiMetric, MultiMetricResult
+
+DEFAULT_ENTITIES = ("PHONE_NUMBER", "EMAIL_ADDRESS", "CREDIT_CARD")
+
+# Entities that are detected by spaCy's named entity recognizer rather than by a pattern recognizer.
+NER_ENTITIES = frozenset({"PERSON", "LOCATION", "NRP", "DATE_TIME", "ORGANIZATION"})
+
+LARGE_SPACY_MODEL = "en_core_web_lg"
+SMALL_SPACY_MODEL = "en_core_web_sm"
+
+# Patterns that text has to match for the entity's recognizer to possibly find anything. These are far cheaper
+# than running the analyzer so they're used to skip rows that can't contain pii at all.
+ENTITY_CANDIDATE_PATTERNS: Dict[str, str] = {
+    "PHONE_NUMBER": r"\d",
+    "EMAIL_ADDRESS": "@",
+    "CREDIT_CARD": r"\d",
+    "US_SSN": r"\d",
+    "US_BANK_NUMBER": r"\d",
+    "US_PASSPORT": r"\d",
+    "US_DRIVER_LICENSE": r"\d",
+    "IP_ADDRESS": r"\d|:",
+    "IBAN_CODE": r"\d",
+}
+
+# Pipeline components that only feed the NER recognizers. Tokens and lemmas are still needed for the
+# context enhancement that the pattern recognizers do.
+_NER_ONLY_PIPES = ("parser", "ner")
+
+
+def default_spacy_model(entities: Sequence[str]) -> str:
+    """
+    The small spaCy model is enough when none of the entities depend on NER.
+    """
+    return LARGE_SPACY_MODEL if any(entity in NER_ENTITIES for entity in entities) else SMALL_SPACY_MODEL
+
+
+def candidate_pattern(entities: Sequence[str]) -> Optional[str]:
+    """
+    A regex that matches any text that might contain one of the entities, or None if there is an entity
+    that can't be prefiltered, like the NER based ones.
+    """
+    if not all(entity in ENTITY_CANDIDATE_PATTERNS for entity in entities):
+        return None
+    return "|".join(sorted({ENTITY_CANDIDATE_PATTERNS[entity] for entity in entities}))
+
+
+def require_spacy_model(spacy_model: str) -> None:
+    """
+    spaCy models aren't downloaded at runtime. The base image ships with the large model and the Dockerfile installs the
+    small one, so any other model has to be installed when the image is built.
+    """
+    if not spacy.util.is_package(spacy_model):
+        raise RuntimeError(
+            f"The spaCy model {spacy_model} isn't installed. Install it in the image with `python -m spacy download {spacy_model}`."
+        )
+
+
+@cache
+def get_analyzer(entities: Optional[Tuple[str, ...]] = None, spacy_model: str = LARGE_SPACY_MODEL) -> AnalyzerEngine:
+    """
+    Without any entities this is Presidio's default analyzer, which runs every recognizer and the full spaCy
+    pipeline. With entities, the analyzer only has the recognizers for those entities and the spaCy components
+    that only NER uses are disabled when none of the entities need NER.
+    """
+    if entities is None:
+        return AnalyzerEngine()
+
+    nlp_engine = SpacyNlpEngine(models=[{"lang_code": "en", "model_name": spacy_model}])
+    nlp_engine.load()
+    if not any(entity in NER_ENTITIES for entity in entities):
+        nlp = nlp_engine.nlp["en"]
+        nlp.select_pipes(disable=[pipe for pipe in _NER_ONLY_PIPES if pipe in nlp.pipe_names])
+
+    registry = RecognizerRegistry()
+    registry.load_predefined_recognizers(nlp_engine=nlp_engine, languages=["en"])
+    recognizers = registry.get_recognizers(language="en", entities=list(entities))
+
+    return AnalyzerEngine(registry=RecognizerRegistry(recognizers=recognizers), nlp_engine=nlp_engine, supported_languages=["en"])
+
+
+@cache
+def get_batch_analyzer(entities: Optional[Tuple[str, ...]] = None, spacy_model: str = LARGE_SPACY_MODEL) -> BatchAnalyzerEngine:
+    return BatchAnalyzerEngine(analyzer_engine=get_analyzer(entities, spacy_model))
+
+
+@cache
+def get_anonymizer() -> AnonymizerEngine:
+    return AnonymizerEngine()
+
+
+def analyze_rows(
+    texts: List[str], entities: Optional[Tuple[str, ...]] = None, spacy_model: str = LARGE_SPACY_MODEL
+) -> List[List[RecognizerResult]]:
+    """
+    Analyze each text on its own, which means one spaCy pass per row.
+    """
+    analyzer = get_analyzer(entities, spacy_model)
+    entity_list = list(entities) if entities is not None else None
+    return [analyzer.analyze(text=text, language="en", entities=entity_list) for text in texts]
+
+
+def analyze_batch(
+    texts: List[str], entities: Optional[Tuple[str, ...]] = None, spacy_model: str = LARGE_SPACY_MODEL
+) -> List[List[RecognizerResult]]:
+    """
+    Analyze all of the texts at once. The texts go through spaCy's `nlp.pipe` together so the pipeline
+    overhead is paid once per batch instead of once per row.
+    """
+    entity_list = list(entities) if entities is not None else None
+    batch_analyzer = get_batch_analyzer(entities, spacy_model)
+    return batch_analyzer.analyze_iterator(texts, language="en", entities=entity_list)  # pyright: ignore[reportUnknownMemberType]
+
+
+@dataclass(frozen=True)
+class ChunkingOptions:
+    """
+    Texts longer than `threshold` characters are split into overlapping windows of `window` characters, which bounds
+    the size of each spaCy doc. The windows are analyzed one after another, since spaCy holds the GIL and threads
+    wouldn't run them any faster. Entities are only kept from the window that owns the middle of each overlap, so
+    `overlap` has to be at least twice as long as the longest entity that should be detected.
+    """
+
+    threshold: int = 20_000
+    window: int = 5_000
+    overlap: int = 200
+
+
+@dataclass(frozen=True)
+class Window:
+    start: int
+    end: int
+    # Entities are only kept from this window if they start in [owned_start, owned_end)
+    owned_start: int
+    owned_end: int
+
+
+def split_windows(length: int, window: int, overlap: int) -> List[Window]:
+    if overlap >= window:
+        raise ValueError(f"Chunk overlap ({overlap}) must be smaller than the window ({window})")
+
+    stride = window - overlap
+    starts = [0]
+    while starts[-1] + window < length:
+        starts.append(starts[-1] + stride)
+
+    windows: List[Window] = []
+    for i, start in enumerate(starts):
+        owned_start = 0 if i == 0 else start + overlap // 2
+        owned_end = length if i == len(starts) - 1 else starts[i + 1] + overlap // 2
+        windows.append(Window(start=start, end=min(start + window, length), owned_start=owned_start, owned_end=owned_end))
+    return windows
+
+
+def analyze_chunked(
+    text: str, chunking: ChunkingOptions, entities: Optional[Tuple[str, ...]] = None, spacy_model: str = LARGE_SPACY_MODEL
+) -> List[RecognizerResult]:
+    """
+    Analyze a long text as overlapping windows and merge the results back into offsets of the original text. The
+    merged results are the same as analyzing the whole text at once.
+    """
+    windows = split_windows(len(text), chunking.window, chunking.overlap)
+    window_results = analyze_rows([text[window.start : window.end] for window in windows], entities, spacy_model)
+
+    merged: Dict[Tuple[str, int, int], RecognizerResult] = {}
+    for window, results in zip(windows, window_results):
+        for result in results:
+            result.start += window.start
+            result.end += window.start
+            if not window.owned_start <= result.start < window.owned_end:
+                continue
+
+            key = (result.entity_type, result.start, result.end)
+            if key not in merged or merged[key].score < result.score:
+                merged[key] = result
+
+    # The same clean up that the analyzer does for a single pass
+    deduped = EntityRecognizer.remove_duplicates(list(merged.values()))
+    return sorted(deduped, key=lambda result: (result.start, result.end))
+
+
+@dataclass(frozen=True)
+class PiiResult:
+    """
+    The per row output of custom_presidio_metric. `counts` is in the same order as the metric's entities.
+    """
+
+    counts: Tuple[int, ...]
+    anonymized: Optional[str]
+
+
+class PiiResultCache:
+    """
+    Bounded LRU cache of PiiResults keyed by a hash of the text and the analyzer configuration. Entries older
+    than `ttl_seconds` are treated as misses. Safe to share between workflows and request threads.
+    """
+
+    def __init__(self, max_size: int = 10_000, ttl_seconds: Optional[float] = 60 * 60) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, Tuple[float, PiiResult]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def key(text: str, entities: Tuple[str, ...], spacy_model: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(f"{spacy_model}\0{','.join(entities)}\0".encode())
+        digest.update(text.encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[PiiResult]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            created, result = entry
+            if self.ttl_seconds is not None and time.monotonic() - created > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: str, result: PiiResult) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+# Shared by every custom_presidio_metric by default, so all of the datasets that use the metric share results.
+pii_result_cache = PiiResultCache()
+
+
+def custom_presidio_metric(
+    input_name: str,
+    entities: Sequence[str] = DEFAULT_ENTITIES,
+    batched: bool = True,
+    spacy_model: Optional[str] = None,
+    result_cache: Optional[PiiResultCache] = pii_result_cache,
+    prefilter: bool = True,
+    chunking: Optional[ChunkingOptions] = None,
+    inference: Callable[[], ContextManager[Any]] = nullcontext,
+) -> MetricCreator:
+    """
+    Custom metric that counts the given Presidio entities (phone numbers, email addresses and credit cards by
+    default) and also generates an anonymized version of the input when any of them are found. Each entity
+    becomes a metric named after it, like `prompt.pii.phone_number`.
+
+    The analyzer only runs the recognizers for `entities`. Unless `spacy_model` is set, the small spaCy model is
+    used when none of the entities need NER.
+
+    When `batched` is True the entire column is analyzed in a single spaCy pass, otherwise each row is
+    analyzed individually.
+
+    Results are looked up in `result_cache` first and the analyzer and anonymizer only run for texts that
+    aren't cached. Identical texts within a batch are only analyzed once. Pass None to disable the cache.
+
+    When `prefilter` is True the whole column is first scanned for the characters that the entities need (digits
+    for phone numbers, `@` for emails, etc.). Rows without any of them get zero counts and no anonymized text
+    without going through Presidio. This is skipped if any of the entities can't be prefiltered. Missing values are
+    never analyzed and always get zero counts.
+
+    When `chunking` is set, texts longer than its threshold are analyzed as overlapping windows instead of in
+    a single pass. See ChunkingOptions.
+
+    Each analyzer call runs inside `inference()`, like timing.inference, which splits the metric's timing into
+    inference and processing.
+    """
+    entity_types = tuple(entities)
+    model = spacy_model or default_spacy_model(entity_types)
+    pattern = candidate_pattern(entity_types) if prefilter else None
+    no_pii = PiiResult(counts=(0,) * len(entity_types), anonymized=None)
+
+    def cache_assets():
+        require_spacy_model(model)
+
+    def init():
+        require_spacy_model(model)
+        get_batch_analyzer(entity_types, model)
+        get_anonymizer()
+
+    metric_names = [f"{input_name}.pii.{entity_type.lower()}" for entity_type in entity_types]
+
+    def summarize(value: str, results: List[RecognizerResult]) -> PiiResult:
+        grouped: Dict[str, int] = {entity_type: 0 for entity_type in entity_types}
+        for result in results:
+            if result.entity_type in grouped:
+                grouped[result.entity_type] += 1
+
+        # Only compute the anonymized text if pii was found
+        anonymized = get_anonymizer().anonymize(text=value, analyzer_results=results).text if results else None  # type: ignore
+        return PiiResult(counts=tuple(grouped.values()), anonymized=anonymized)
+
+    def udf(text: pd.DataFrame) -> MultiMetricResult:
+        values: List[str] = text[input_name].tolist()  # pyright: ignore[reportUnknownMemberType]
+        rows: List[Optional[PiiResult]] = [None] * len(values)
+
+        if pattern is not None:
+            candidates: List[bool] = text[input_name].str.contains(pattern, regex=True, na=True).tolist()  # pyright: ignore[reportUnknownMemberType]
+        else:
+            candidates = [True] * len(values)
+
+        # Texts that still need to be analyzed, mapped to the rows they belong to
+        pending: Dict[str, List[int]] = {}
+        for i, value in enumerate(values):
+            # Missing values match the prefilter, but there's nothing to hash or analyze
+            if not candidates[i] or not isinstance(value, str):
+                rows[i] = no_pii
+                continue
+
+            cached = result_cache.get(result_cache.key(value, entity_types, model)) if result_cache is not None else None
+            if cached is not None:
+                rows[i] = cached
+            else:
+                pending.setdefault(value, []).append(i)
+
+        if pending:
+            texts = [value for value in pending if chunking is None or len(value) <= chunking.threshold]
+            analyze = analyze_batch if batched else analyze_rows
+            with inference():
+                all_results = dict(zip(texts, analyze(texts, entity_types, model)))
+                if chunking is not None:
+                    for value in pending:
+                        if len(value) > chunking.threshold:
+                            all_results[value] = analyze_chunked(value, chunking, entity_types, model)
+
+            for value, results in all_results.items():
+                pii_result = summarize(value, results)
+                if result_cache is not None:
+                    result_cache.put(result_cache.key(value, entity_types, model), pii_result)
+                for i in pending[value]:
+                    rows[i] = pii_result
+
+        # Every row is either prefiltered, cached or analyzed, and dropping one would misalign the metrics with the inputs
+        missing = [i for i, row in enumerate(rows) if row is None]
+        if missing:
+            raise RuntimeError(f"No PII result for rows {missing}")
+        pii_results = cast(List[PiiResult], rows)
+        all_metrics = [
+            *[[row.counts[j] for row in pii_results] for j in range(len(entity_types))],
+            [row.anonymized for row in pii_results],
+        ]
+
+        return MultiMetricResult(metrics=all_metrics)
+
+    # Matches the order we get in the udf above
+    names = [*metric_names, f"{input_name}.pii.anonymized"]
+    return lambda: MultiMetric(names=names, input_names=[input_name], evaluate=udf, init=init, cache_assets=cache_assets)
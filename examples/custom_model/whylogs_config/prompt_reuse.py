@@ -0,0 +1,211 @@
+import hashlib
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import replace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+from whylogs_container_types import LangkitOptions
+
+from langkit.core.context import Context
+from langkit.core.metric import Metric, MetricCreator, MultiMetric, MultiMetricResult, SingleMetric, SingleMetricResult
+
+logger = logging.getLogger(__name__)
+
+MAX_SIZE_ENV = "PROMPT_METRIC_CACHE_MAX_SIZE"
+MAX_BYTES_ENV = "PROMPT_METRIC_CACHE_MAX_BYTES"
+TTL_SECONDS_ENV = "PROMPT_METRIC_CACHE_TTL_SECONDS"
+
+# One value per metric name, for a single row
+RowValues = Tuple[Any, ...]
+
+
+class PromptMetricCache:
+    """
+    Bounded LRU cache of the results of prompt only metrics, keyed by a hash of the dataset id, request id, prompt and
+    metric names. The least recently used entries are evicted once there are more than `max_size` of them or they take
+    up more than `max_bytes`, since a row's values can be as small as a few numbers or as big as an anonymized copy of
+    the prompt. Entries older than `ttl_seconds` are treated as misses. Safe to share between workflows and request
+    threads.
+    """
+
+    def __init__(self, max_size: int = 10_000, ttl_seconds: Optional[float] = 5 * 60, max_bytes: int = 64 * 1024 * 1024) -> None:
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, Tuple[float, RowValues]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def key(dataset_id: str, request_id: str, prompt: str, names: Tuple[str, ...]) -> str:
+        digest = hashlib.sha256()
+        digest.update(f"{dataset_id}\0{request_id}\0{','.join(names)}\0".encode())
+        digest.update(prompt.encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _size(key: str, values: RowValues) -> int:
+        # An estimate: the values' own sizes, without anything that lists or dicts among them point to
+        return sys.getsizeof(key) + sys.getsizeof(values) + sum(sys.getsizeof(value) for value in values)
+
+    def get(self, key: str) -> Optional[RowValues]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            created, values = entry
+            if self.ttl_seconds is not None and time.monotonic() - created > self.ttl_seconds:
+                del self._entries[key]
+                self._bytes -= self._size(key, values)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return values
+
+    def put(self, key: str, values: RowValues) -> None:
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= self._size(key, previous[1])
+
+            self._entries[key] = (time.monotonic(), values)
+            self._bytes += self._size(key, values)
+            while (len(self._entries) > self.max_size or self._bytes > self.max_bytes) and self._entries:
+                evicted_key, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= self._size(evicted_key, evicted)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+def _cache_from_env() -> PromptMetricCache:
+    ttl_seconds = os.environ.get(TTL_SECONDS_ENV)
+    return PromptMetricCache(
+        max_size=int(os.environ.get(MAX_SIZE_ENV, "10000")),
+        max_bytes=int(os.environ.get(MAX_BYTES_ENV, str(64 * 1024 * 1024))),
+        ttl_seconds=float(ttl_seconds) if ttl_seconds else 5 * 60,
+    )
+
+
+# Sized by PROMPT_METRIC_CACHE_MAX_SIZE, PROMPT_METRIC_CACHE_MAX_BYTES and PROMPT_METRIC_CACHE_TTL_SECONDS, and shared by every
+# dataset by default
+prompt_metric_cache = _cache_from_env()
+
+
+def _row_keys(df: pd.DataFrame, dataset_id: str, names: Tuple[str, ...], cache: PromptMetricCache) -> Optional[List[str]]:
+    """
+    The cache key of each row, or None if any row is missing its id or prompt, since then there's nothing to match a
+    later request against.
+    """
+    if "id" not in df.columns or "prompt" not in df.columns:
+        return None
+
+    keys: List[str] = []
+    for request_id, prompt in zip(df["id"], df["prompt"]):
+        if not isinstance(request_id, str) or not request_id or not isinstance(prompt, str):
+            return None
+        keys.append(cache.key(dataset_id, request_id, prompt, names))
+    return keys
+
+
+def _reusing_metric(metric: Metric, dataset_id: str, cache: PromptMetricCache) -> Metric:
+    if list(metric.input_names) != ["prompt"]:
+        return metric
+
+    single = isinstance(metric, SingleMetric)
+    names = (metric.name,) if isinstance(metric, SingleMetric) else tuple(metric.names)
+    evaluate: Callable[..., Any] = metric.evaluate
+
+    def run(df: pd.DataFrame, *args: Any) -> Any:
+        keys = _row_keys(df, dataset_id, names, cache)
+        if keys is not None:
+            cached = [cache.get(key) for key in keys]
+            if all(values is not None for values in cached):
+                # Every row was already evaluated by an earlier request with the same id and prompt
+                columns = [[values[i] for values in cached if values is not None] for i in range(len(names))]
+                return SingleMetricResult(columns[0]) if single else MultiMetricResult(columns)
+
+        result = evaluate(df, *args)
+        if keys is not None:
+            columns = [result.metrics] if single else result.metrics
+            for row, key in enumerate(keys):
+                cache.put(key, tuple(column[row] for column in columns))
+        return result
+
+    # The workflow only passes the context to evaluate functions that take two arguments
+    if len(inspect.signature(evaluate).parameters) == 2:
+
+        def evaluate_with_context(df: pd.DataFrame, context: Context) -> Any:
+            return run(df, context)
+
+        return replace(metric, evaluate=evaluate_with_context)
+    else:
+
+        def evaluate_without_context(df: pd.DataFrame) -> Any:
+            return run(df)
+
+        return replace(metric, evaluate=evaluate_without_context)
+
+
+def _reusing_created(created: Any, dataset_id: str, cache: PromptMetricCache) -> Any:
+    if isinstance(created, (SingleMetric, MultiMetric)):
+        return _reusing_metric(created, dataset_id, cache)
+    if isinstance(created, list):
+        return [_reusing_created(it, dataset_id, cache) for it in created]  # pyright: ignore[reportUnknownVariableType]
+    return _reusing_creator(created, dataset_id, cache)
+
+
+def _reusing_creator(creator: MetricCreator, dataset_id: str, cache: PromptMetricCache) -> MetricCreator:
+    if isinstance(creator, list):
+        return [_reusing_creator(it, dataset_id, cache) for it in creator]
+    return lambda: _reusing_created(creator(), dataset_id, cache)
+
+
+def reuse_prompt_metrics(
+    langkit_config: Dict[str, LangkitOptions], cache: PromptMetricCache = prompt_metric_cache
+) -> Dict[str, LangkitOptions]:
+    """
+    Make every dataset's prompt only metrics reuse their results for a request that has the same id and prompt as an
+    earlier one, like the prompt and response request that follows a prompt only request. Clients don't have to filter
+    out the prompt metrics themselves. Metrics that need the response always run.
+    """
+    reusing_config: Dict[str, LangkitOptions] = {}
+    for dataset_id, options in langkit_config.items():
+        reusing_config[dataset_id] = LangkitOptions(
+            metrics=[_reusing_creator(it, dataset_id, cache) for it in options.metrics],
+            validators=options.validators,
+            callbacks=options.callbacks,
+        )
+
+    limits = f"{cache.max_size} entries, {cache.max_bytes} bytes, {cache.ttl_seconds}s"
+    logger.info(f"Reusing prompt metric results for {list(reusing_config.keys())}, cache: {limits}")
+    return reusing_config
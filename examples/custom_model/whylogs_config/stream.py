@@ -0,0 +1,149 @@
+"""
+Evaluate a newline delimited json stream of LLMValidateRequest records, writing a json result line for each one as soon as
+its micro-batch is done.
+
+    poetry run python -m whylogs_config.stream --dataset-id model-131 < requests.ndjson > results.ndjson
+    poetry run python -m whylogs_config.stream --dataset-id model-131 --mode log --profile profile.bin < requests.ndjson
+"""
+
+import argparse
+import json
+import sys
+from dataclasses import asdict
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, Literal, Optional, Set, Tuple, Union
+
+import pandas as pd
+
+import whylogs as why
+from langkit.core.workflow import Workflow
+from whylogs.core.view.dataset_profile_view import DatasetProfileView
+
+from .batch import BatchRow, RowResult, evaluate_batch
+
+StreamMode = Literal["evaluate", "log"]
+
+
+def parse_record(line_number: int, line: str) -> BatchRow:
+    """
+    A BatchRow from one LLMValidateRequest record. Records without an id get their line number as one.
+    """
+    record: Dict[str, Any] = json.loads(line)
+    if not isinstance(record, dict):  # pyright: ignore[reportUnnecessaryIsInstance]
+        raise ValueError("Expected a json object")
+
+    additional_data = record.get("additional_data")
+    if additional_data is not None and not isinstance(additional_data, dict):
+        raise ValueError("Expected additional_data to be a json object")
+
+    return BatchRow(
+        # Falsy ids like 0 and "" are still ids
+        id=str(record["id"] if record.get("id") is not None else line_number),
+        prompt=record.get("prompt"),
+        response=record.get("response"),
+        context=record.get("context"),
+        additional_data=additional_data or {},
+    )
+
+
+def _parsed(lines: Iterable[Union[str, bytes]]) -> Iterator[Tuple[int, Union[BatchRow, Dict[str, Any]]]]:
+    for line_number, line in enumerate(lines, start=1):
+        text = line.decode() if isinstance(line, bytes) else line
+        if not text.strip():
+            continue
+        try:
+            yield line_number, parse_record(line_number, text)
+        except ValueError as e:
+            # json.JSONDecodeError is a ValueError too
+            yield line_number, {"line": line_number, "error": str(e)}
+
+
+def _result_line(result: RowResult, mode: StreamMode) -> Dict[str, Any]:
+    if mode == "log":
+        return {"id": result.id, "metrics": result.metrics}
+    return asdict(result)
+
+
+def evaluate_stream(
+    workflow: Workflow,
+    lines: Iterable[Union[str, bytes]],
+    batch_size: int = 64,
+    mode: StreamMode = "evaluate",
+    log: Optional[Callable[[pd.DataFrame], None]] = None,
+) -> Iterator[str]:
+    """
+    Evaluate a stream of json lines in micro-batches of `batch_size` records, yielding a json line for each record in the
+    order they were read.
+
+    Only one micro-batch is held at a time, so memory doesn't grow with the size of the stream. `lines` is only read as
+    fast as the results are consumed, so a slow consumer slows the reader down instead of results piling up, and the
+    first results are ready as soon as the first micro-batch has been read.
+
+    In `evaluate` mode each line has the row's metrics, validation failures and action, like `/evaluate`. In `log` mode,
+    like `/log_llm`, each line only has the row's metrics, and every micro-batch's metrics are also passed to `log`, for
+    example to profile them with whylogs. Lines that can't be parsed get an error line and don't stop the stream.
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be at least 1, got {batch_size}")
+
+    records = _parsed(lines)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return
+
+        # Failures are matched to rows by id, so ids have to be unique within a micro-batch
+        ids: Set[str] = set()
+        for i, (line_number, record) in enumerate(batch):
+            if isinstance(record, BatchRow):
+                if record.id in ids:
+                    batch[i] = (line_number, {"line": line_number, "id": record.id, "error": "Duplicate id"})
+                ids.add(record.id)
+
+        rows = [record for _, record in batch if isinstance(record, BatchRow)]
+        results = iter(evaluate_batch(workflow, rows, log=log if mode == "log" else None))
+
+        for _, record in batch:
+            if isinstance(record, BatchRow):
+                yield json.dumps(_result_line(next(results), mode), default=str)
+            else:
+                yield json.dumps(record)
+
+
+class ProfileLogger:
+    """
+    A `log` for evaluate_stream that profiles each micro-batch with whylogs and merges them into one profile, the way the
+    container merges the profiles of `/log_llm` requests.
+    """
+
+    def __init__(self) -> None:
+        self.view: Optional[DatasetProfileView] = None
+
+    def __call__(self, df: pd.DataFrame) -> None:
+        view = why.log(df).view()  # pyright: ignore[reportUnknownMemberType]
+        self.view = view if self.view is None else self.view.merge(view)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset-id", required=True)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--mode", choices=["evaluate", "log"], default="evaluate")
+    parser.add_argument("--profile", default="profile.bin", help="Where the merged whylogs profile is written in log mode")
+    args = parser.parse_args()
+
+    from .config import langkit_config
+
+    options = langkit_config[args.dataset_id]
+    workflow = Workflow(metrics=options.metrics, validators=options.validators, callbacks=options.callbacks)
+
+    log = ProfileLogger() if args.mode == "log" else None
+    for line in evaluate_stream(workflow, sys.stdin, batch_size=args.batch_size, mode=args.mode, log=log):
+        print(line, flush=True)
+
+    if log is not None and log.view is not None:
+        log.view.write(args.profile)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import inspect
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Union
+
+import pandas as pd
+from whylogs_container_types import LangkitOptions
+
+from langkit.core.context import Context, ContextDependency
+from langkit.core.metric import Metric, MetricCreator, MetricResult, MultiMetric, SingleMetric
+from langkit.core.validation import ValidationResult, Validator
+from langkit.core.workflow import Callback
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE_ENV = "METRIC_TIMING_SAMPLE_RATE"
+
+TimingSink = Callable[[Dict[str, Any]], None]
+
+
+@dataclass
+class Timing:
+    wall_sec: float = 0.0
+    cpu_sec: float = 0.0
+    # Only metrics that mark their model calls with `inference()` have an inference time. The rest of their time is processing.
+    inference_sec: float = 0.0
+
+    @property
+    def processing_sec(self) -> float:
+        return max(0.0, self.wall_sec - self.inference_sec)
+
+    def add(self, other: "Timing") -> None:
+        self.wall_sec += other.wall_sec
+        self.cpu_sec += other.cpu_sec
+        self.inference_sec += other.inference_sec
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "wall_sec": round(self.wall_sec, 6),
+            "cpu_sec": round(self.cpu_sec, 6),
+            "inference_sec": round(self.inference_sec, 6),
+            "processing_sec": round(self.processing_sec, 6),
+        }
+
+
+@dataclass
+class _Record:
+    rows: int
+    metrics: Dict[str, Timing] = field(default_factory=dict)
+    validators: Dict[str, Timing] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        total = Timing()
+        for timing in [*self.metrics.values(), *self.validators.values()]:
+            total.add(timing)
+        return {
+            "rows": self.rows,
+            "metrics": {name: timing.to_dict() for name, timing in self.metrics.items()},
+            "validators": {name: timing.to_dict() for name, timing in self.validators.items()},
+            "total": total.to_dict(),
+        }
+
+
+class _State(threading.local):
+    # The workflow runs a request's dependencies, metrics, validators and callbacks one after the other on the same
+    # thread. `record` is the timed request that's running on this thread, if any, and is replaced at the start of
+    # every request. `timing` is only set while a metric or validator is being timed.
+    record: Optional[_Record] = None
+    timing: Optional[Timing] = None
+
+
+_state = _State()
+
+
+def _sample_rate_from_env() -> float:
+    return float(os.environ.get(SAMPLE_RATE_ENV, "0"))
+
+
+@dataclass(frozen=True)
+class TimingDependency(ContextDependency[Optional[_Record]]):
+    """
+    Decides whether each request is timed, once, before any of its metrics run. The record lives in the request's
+    context, and is also made the thread's current record so the validators, which don't get the context, use it
+    rather than whatever an earlier request left behind.
+    """
+
+    sample_rate: float
+
+    def name(self) -> str:
+        return "timing.record"
+
+    def cache_assets(self) -> None:
+        pass
+
+    def init(self) -> None:
+        pass
+
+    def populate_request(self, context: Context, data: pd.DataFrame) -> None:
+        if self.name() in context.request_data:
+            return
+        record = _Record(rows=len(data)) if random.random() < self.sample_rate else None
+        context.request_data[self.name()] = record
+        _state.record = record
+
+    def get_request_data(self, context: Context) -> Optional[_Record]:
+        return context.request_data.get(self.name())
+
+
+@contextmanager
+def _timed(timings: Dict[str, Timing], name: str) -> Iterator[None]:
+    timing = Timing()
+    _state.timing = timing
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield
+    finally:
+        _state.timing = None
+        timing.wall_sec = time.perf_counter() - wall_start
+        timing.cpu_sec = time.thread_time() - cpu_start
+        timings.setdefault(name, Timing()).add(timing)
+
+
+@contextmanager
+def inference() -> Iterator[None]:
+    """
+    Mark the model call inside a metric, so its timing is split into inference and pre/post processing. Does nothing
+    outside of a metric that's being timed.
+    """
+    timing = _state.timing
+    if timing is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.inference_sec += time.perf_counter() - start
+
+
+def _timed_metric(metric: Metric, sample_rate: float) -> Metric:
+    name = metric.name if isinstance(metric, SingleMetric) else ",".join(metric.names)
+    evaluate: Callable[..., Any] = metric.evaluate
+    # The workflow only passes the context to evaluate functions that take two arguments
+    takes_context = len(inspect.signature(evaluate).parameters) == 2
+    dependency = TimingDependency(sample_rate)
+
+    # Always takes the context, since that's where the request's record is
+    def timed_evaluate(df: pd.DataFrame, context: Context) -> Any:
+        args = (df, context) if takes_context else (df,)
+        record = dependency.get_request_data(context)
+        if record is None:
+            return evaluate(*args)
+        with _timed(record.metrics, name):
+            return evaluate(*args)
+
+    return replace(metric, evaluate=timed_evaluate, context_dependencies=[*(metric.context_dependencies or []), dependency])
+
+
+def _timed_created(created: Any, sample_rate: float) -> Any:
+    if isinstance(created, (SingleMetric, MultiMetric)):
+        return _timed_metric(created, sample_rate)
+    if isinstance(created, list):
+        return [_timed_created(it, sample_rate) for it in created]  # pyright: ignore[reportUnknownVariableType]
+    return timed_metrics(created, sample_rate)
+
+
+def timed_metrics(creator: MetricCreator, sample_rate: Optional[float] = None) -> MetricCreator:
+    """
+    Wrap a metric creator so that a `sample_rate` fraction of requests record the wall and CPU time of each of its
+    metrics. Defaults to the METRIC_TIMING_SAMPLE_RATE env variable, or 0 if it isn't set.
+    """
+    rate = _sample_rate_from_env() if sample_rate is None else sample_rate
+    if isinstance(creator, list):
+        return [timed_metrics(it, rate) for it in creator]
+    return lambda: _timed_created(creator(), rate)
+
+
+class TimedValidator(Validator):
+    """
+    Records the time that a validator takes for the requests whose metrics are being timed.
+    """
+
+    def __init__(self, validator: Validator) -> None:
+        self.validator = validator
+        self.name = ",".join(validator.get_target_metric_names())
+
+    def get_target_metric_names(self) -> List[str]:
+        return self.validator.get_target_metric_names()
+
+    def validate_result(self, df: pd.DataFrame) -> Optional[ValidationResult]:
+        # Set by the TimingDependency at the start of this request, so it's never an earlier request's record
+        record = _state.record
+        if record is None:
+            return self.validator.validate_result(df)
+        with _timed(record.validators, self.name):
+            return self.validator.validate_result(df)
+
+
+@dataclass
+class _Aggregate:
+    count: int = 0
+    wall_sec: float = 0.0
+    cpu_sec: float = 0.0
+    inference_sec: float = 0.0
+    max_wall_sec: float = 0.0
+
+    def add(self, timing: Timing) -> None:
+        self.count += 1
+        self.wall_sec += timing.wall_sec
+        self.cpu_sec += timing.cpu_sec
+        self.inference_sec += timing.inference_sec
+        self.max_wall_sec = max(self.max_wall_sec, timing.wall_sec)
+
+    def to_dict(self) -> Dict[str, Union[int, float]]:
+        return {
+            "count": self.count,
+            "mean_wall_sec": self.wall_sec / self.count,
+            "mean_cpu_sec": self.cpu_sec / self.count,
+            "mean_inference_sec": self.inference_sec / self.count,
+            "max_wall_sec": self.max_wall_sec,
+        }
+
+
+_aggregates: Dict[str, Dict[str, _Aggregate]] = {"metrics": {}, "validators": {}}
+_aggregates_lock = threading.Lock()
+
+
+class TimingCallback(Callback):
+    """
+    Finishes the timing record of each timed request. The record is passed to `sink`, which logs it as json by
+    default, and added to the totals that `timing_stats()` reports.
+    """
+
+    def __init__(self, sink: Optional[TimingSink] = None) -> None:
+        self.sink = sink or (lambda record: logger.info(f"Metric timing: {json.dumps(record)}"))
+
+    def post_validation(
+        self,
+        df: pd.DataFrame,
+        metric_results: Mapping[str, MetricResult],
+        results: pd.DataFrame,
+        validation_results: List[ValidationResult],
+    ) -> None:
+        record = _state.record
+        _state.record = None
+        if record is None:
+            return
+
+        with _aggregates_lock:
+            for kind, timings in [("metrics", record.metrics), ("validators", record.validators)]:
+                for name, timing in timings.items():
+                    _aggregates[kind].setdefault(name, _Aggregate()).add(timing)
+
+        self.sink(record.to_dict())
+
+
+def timing_stats() -> Dict[str, Dict[str, Dict[str, Union[int, float]]]]:
+    """
+    The number of timed runs and the mean wall, CPU and inference time of every metric and validator, by name.
+    """
+    with _aggregates_lock:
+        return {kind: {name: aggregate.to_dict() for name, aggregate in by_name.items()} for kind, by_name in _aggregates.items()}
+
+
+def timed_options(options: LangkitOptions, sample_rate: Optional[float] = None, sink: Optional[TimingSink] = None) -> LangkitOptions:
+    """
+    Time the metrics and validators of `options` for a `sample_rate` fraction of requests. Requests that aren't sampled
+    only pay for an extra function call per metric.
+    """
+    rate = _sample_rate_from_env() if sample_rate is None else sample_rate
+    return LangkitOptions(
+        metrics=[timed_metrics(it, rate) for it in options.metrics],
+        validators=[TimedValidator(it) for it in options.validators],
+        # First, so the record is finished before any slow callback runs
+        callbacks=[TimingCallback(sink), *options.callbacks],
+    )
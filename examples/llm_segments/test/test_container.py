@@ -61,6 +61,7 @@ def test_segmented_request_170(client: AuthenticatedClient):
             "prompt.similarity.injection_neighbor_ids",
             "response.similarity.refusal",
             "version",
+            "version.limited",
         ]
 
 
@@ -120,6 +121,7 @@ def test_segmented_request_async_171(client: AuthenticatedClient):
             "response.sentiment.sentiment_score",
             "response.similarity.refusal",
             "version",
+            "version.limited",
         ]
 
 
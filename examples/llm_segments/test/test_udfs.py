@@ -0,0 +1,133 @@
+from typing import Any, Dict, List
+
+import pandas as pd
+import pytest
+from whylogs_container_types import DatasetUploadCadence, DatasetUploadCadenceGranularity
+
+from whylogs.experimental.core.udf_schema import UdfSchema
+from whylogs_config.udfs import (
+    SegmentKeyLimiter,
+    bucketize,
+    round_to_int,
+    segment_key_stats,
+    threshold_to_bool,
+    vectorized,
+    vectorized_udf_spec,
+)
+
+
+def test_round_to_int_matches_python_round():
+    scores = [0.1, 0.5, 0.51, 1.5, 2.5, 0.99]
+    udf = vectorized(round_to_int("score"), ["score"])
+
+    assert udf(pd.DataFrame({"score": scores})).tolist() == [int(round(it)) for it in scores]
+    assert udf({"score": [0.7]}) == [1]
+
+
+def test_missing_values_stay_missing():
+    udf = vectorized(round_to_int("score"), ["score"])
+    assert udf({"score": [None]}) == [None]
+    assert udf(pd.DataFrame({"score": [0.9, None]})).tolist() == [1, None]
+
+
+def test_threshold_to_bool():
+    udf = vectorized(threshold_to_bool("score", 0.5), ["score"])
+    assert udf(pd.DataFrame({"score": [0.2, 0.5, 0.8]})).tolist() == [False, True, True]
+
+    exclusive = vectorized(threshold_to_bool("score", 0.5, inclusive=False), ["score"])
+    assert exclusive({"score": [0.5]}) == [False]
+
+
+def test_bucketize():
+    values = pd.DataFrame({"score": [-1, 0, 0.2, 0.5, 0.9, 1.0]})
+
+    assert vectorized(bucketize("score", [0, 0.5, 1]), ["score"])(values).tolist() == [0, 1, 1, 2, 2, 3]
+
+    labelled = vectorized(bucketize("score", [0.5], labels=["low", "high"]), ["score"])
+    assert labelled(values).tolist() == ["low", "low", "low", "high", "high", "high"]
+
+    with pytest.raises(ValueError):
+        bucketize("score", [1, 0])
+    with pytest.raises(ValueError):
+        bucketize("score", [0.5], labels=["only one"])
+
+
+def test_udf_schema_keeps_rows_aligned():
+    schema = UdfSchema(udf_specs=[vectorized_udf_spec(column_names=["score"], udfs={"score.rounded": round_to_int("score")})])
+
+    df = pd.DataFrame({"score": [0.2, 0.8, 0.6]}, index=[10, 11, 12])
+    new_df, _ = schema.apply_udfs(pandas=df)
+    assert new_df is not None
+    assert new_df["score.rounded"].tolist() == [0, 1, 1]
+
+    row: Dict[str, Any] = {"score": 0.8}
+    _, new_row = schema.apply_udfs(row=row)
+    assert new_row is not None
+    assert new_row["score.rounded"] == 1
+
+
+def test_multiple_columns():
+    def ratio(columns: Dict[str, Any]) -> Any:
+        return columns["a"] / columns["b"]
+
+    udf = vectorized(ratio, ["a", "b"])
+    rows: Dict[str, List[Any]] = {"a": [1], "b": [4]}
+    assert udf(rows) == [0.25]
+    assert udf(pd.DataFrame({"a": [1, 3], "b": [2, 4]})).tolist() == [0.5, 0.75]
+
+
+def test_segment_key_limiter_folds_overflow():
+    now = [0.0]
+    cadence = DatasetUploadCadence(interval=1, granularity=DatasetUploadCadenceGranularity.MINUTE)
+    limiter = SegmentKeyLimiter("model-fold", "version", max_keys=2, upload_cadence=cadence, segment_bytes=1000, clock=lambda: now[0])
+    udf = vectorized(limiter, ["version"])
+
+    result = udf(pd.DataFrame({"version": ["a", "b", "a", "c", None]}))
+    assert result[:4].tolist() == ["a", "b", "a", "__other__"]
+    assert pd.isna(result[4])
+    assert udf({"version": ["d"]}) == ["__other__"]
+    assert udf({"version": ["b"]}) == ["b"]
+    assert segment_key_stats()["model-fold"] == {
+        "column": "version",
+        "max_keys": 2,
+        "live_segments": 3,
+        "peak_live_segments": 3,
+        "estimated_bytes": 3000,
+        "overflowed_rows": 2,
+    }
+
+    # Segments are dropped after each upload, so the keys reset with the upload window
+    now[0] = 61
+    assert udf(pd.DataFrame({"version": ["c", "d", "a"]})).tolist() == ["c", "d", "__other__"]
+    assert limiter.stats()["overflowed_rows"] == 1
+
+
+def test_segment_key_limiter_windows_start_with_the_limiter():
+    now = [1000.0]
+    cadence = DatasetUploadCadence(interval=5, granularity=DatasetUploadCadenceGranularity.MINUTE)
+    limiter = SegmentKeyLimiter("model-window", "version", max_keys=1, upload_cadence=cadence, clock=lambda: now[0])
+    udf = vectorized(limiter, ["version"])
+
+    assert udf(pd.DataFrame({"version": ["a", "b", "c"]})).tolist() == ["a", "__other__", "__other__"]
+    assert limiter.stats()["live_segments"] == 2
+    assert limiter.stats()["estimated_bytes"] is None
+
+    # Not on multiples of the cadence
+    now[0] = 1000.0 + 299
+    assert udf({"version": ["b"]}) == ["__other__"]
+    now[0] = 1000.0 + 300
+    assert udf({"version": ["b"]}) == ["b"]
+    assert limiter.stats()["live_segments"] == 1
+    assert limiter.stats()["peak_live_segments"] == 2
+
+
+def test_segment_key_limiter_replaces_one_with_the_same_name():
+    cadence = DatasetUploadCadence(interval=5, granularity=DatasetUploadCadenceGranularity.MINUTE)
+    SegmentKeyLimiter("model-reloaded", "version", max_keys=1, upload_cadence=cadence)
+
+    # Like reloading the config
+    limiter = SegmentKeyLimiter("model-reloaded", "version", max_keys=2, upload_cadence=cadence)
+
+    assert segment_key_stats()["model-reloaded"]["max_keys"] == 2
+    vectorized(limiter, ["version"])({"version": ["a"]})
+    assert segment_key_stats()["model-reloaded"]["live_segments"] == 1
@@ -1,6 +1,6 @@
-from typing import Any, Dict, List, Union
+import os
+from typing import Dict
 
-import pandas as pd
 from whylogs_container_types import (
     ContainerConfiguration,
     DatasetCadence,
@@ -10,35 +10,33 @@ from whylogs_container_types import (
 )
 
 from whylogs.core.metrics import StandardMetric
-from whylogs.core.resolvers import DeclarativeResolver, ResolverSpec
-from whylogs.core.schema import DatasetSchema, MetricSpec
+from whylogs.core.resolvers import ResolverSpec
+from whylogs.core.schema import MetricSpec
 from whylogs.core.segmentation_partition import ColumnMapperFunction, SegmentationPartition
-from whylogs.experimental.core.udf_schema import NO_FI_RESOLVER, UdfSchema, UdfSpec
+from whylogs.experimental.core.udf_schema import NO_FI_RESOLVER, UdfSchema
+
+from .udfs import SegmentKeyLimiter, round_to_int, vectorized_udf_spec
 
 VERSION_COLUMN = "version"
+LIMITED_VERSION_COLUMN = "version.limited"
 REFUSAL_METRIC_COLUMN = "response.similarity.refusal"
 MAPPED_REFUSAL_METRIC_COLUMN = "response.refusal.is_refusal"
 
-model_170_segment_def = SegmentationPartition(name=VERSION_COLUMN, mapper=ColumnMapperFunction(col_names=[VERSION_COLUMN]))
-model_171_segment_def = SegmentationPartition(
-    name=f"{VERSION_COLUMN},{MAPPED_REFUSAL_METRIC_COLUMN}",
-    mapper=ColumnMapperFunction(col_names=[VERSION_COLUMN, MAPPED_REFUSAL_METRIC_COLUMN]),
-)
+UPLOAD_CADENCE = DatasetUploadCadence(interval=5, granularity=DatasetUploadCadenceGranularity.MINUTE)
 
+# Clients pick the version values, so the number of version segments is capped at SEGMENT_MAX_KEYS per upload window. The
+# versions past the cap are merged into one "__other__" segment.
+SEGMENT_MAX_KEYS_ENV = "SEGMENT_MAX_KEYS"
+segment_max_keys = int(os.environ.get(SEGMENT_MAX_KEYS_ENV, "100"))
 
-def _convert_score_to_int(score: float) -> int:
-    """
-    round the score to 0 or 1
-    """
-    return int(round(score))
+model_170_version_limiter = SegmentKeyLimiter("model-170", VERSION_COLUMN, max_keys=segment_max_keys, upload_cadence=UPLOAD_CADENCE)
+model_171_version_limiter = SegmentKeyLimiter("model-171", VERSION_COLUMN, max_keys=segment_max_keys, upload_cadence=UPLOAD_CADENCE)
 
-
-def refusal_boolean_udf(text: Union[pd.DataFrame, Dict[str, List[Any]]]) -> Any:
-    # print(f">>> Refusal boolean UDF {text}")
-    if isinstance(text, pd.DataFrame):
-        return text[REFUSAL_METRIC_COLUMN].apply(_convert_score_to_int)  # type: ignore
-    else:
-        return [_convert_score_to_int(score) for score in text[REFUSAL_METRIC_COLUMN]]
+model_170_segment_def = SegmentationPartition(name=LIMITED_VERSION_COLUMN, mapper=ColumnMapperFunction(col_names=[LIMITED_VERSION_COLUMN]))
+model_171_segment_def = SegmentationPartition(
+    name=f"{LIMITED_VERSION_COLUMN},{MAPPED_REFUSAL_METRIC_COLUMN}",
+    mapper=ColumnMapperFunction(col_names=[LIMITED_VERSION_COLUMN, MAPPED_REFUSAL_METRIC_COLUMN]),
+)
 
 
 whylogs_config: Dict[str, DatasetOptions] = {
@@ -48,39 +46,35 @@ whylogs_config: Dict[str, DatasetOptions] = {
     # DOCSUB_START example_segmented_schema_additional_data
     "model-170": DatasetOptions(
         dataset_cadence=DatasetCadence.HOURLY,
-        whylabs_upload_cadence=DatasetUploadCadence(
-            interval=5,
-            granularity=DatasetUploadCadenceGranularity.MINUTE,
-        ),
-        schema=DatasetSchema(
+        whylabs_upload_cadence=UPLOAD_CADENCE,
+        schema=UdfSchema(
             segments={model_170_segment_def.name: model_170_segment_def},
-            resolvers=DeclarativeResolver(
-                [
-                    # This applies to all columns and provides the baseline whylogs metrics, like quantiles,
-                    # averages, and other statistics. Its there by default normally but we have to include it
-                    # here because we're touching the resolvers.
-                    *NO_FI_RESOLVER,
-                    # Include the Frequent Items metric on the "version" column so that we can see
-                    # the raw version values in the WhyLabs UI. This is normally disabled so string values aren't
-                    # sent to WhyLabs.
-                    ResolverSpec(
-                        column_name=VERSION_COLUMN,
-                        metrics=[MetricSpec(StandardMetric.frequent_items.value)],
-                    ),
-                ]
-            ),
+            resolvers=[
+                # This applies to all columns and provides the baseline whylogs metrics, like quantiles,
+                # averages, and other statistics. Its there by default normally but we have to include it
+                # here because we're touching the resolvers.
+                *NO_FI_RESOLVER,
+                # Include the Frequent Items metric on the "version" column so that we can see
+                # the raw version values in the WhyLabs UI. This is normally disabled so string values aren't
+                # sent to WhyLabs.
+                ResolverSpec(
+                    column_name=VERSION_COLUMN,
+                    metrics=[MetricSpec(StandardMetric.frequent_items.value)],
+                ),
+            ],
+            # The segments are made from the limited copy of the version column, so the number of them is tracked
+            udf_specs=[
+                vectorized_udf_spec(column_names=[VERSION_COLUMN], udfs={LIMITED_VERSION_COLUMN: model_170_version_limiter}),
+            ],
         ),
     ),
     # DOCSUB_END
     # DOCSUB_START example_segmented_schema_langkit_metric
     "model-171": DatasetOptions(
         dataset_cadence=DatasetCadence.HOURLY,
-        whylabs_upload_cadence=DatasetUploadCadence(
-            interval=5,
-            granularity=DatasetUploadCadenceGranularity.MINUTE,
-        ),
+        whylabs_upload_cadence=UPLOAD_CADENCE,
         schema=UdfSchema(
-            # This dataset is going to segment on two columns at once, the "version" column and the
+            # This dataset is going to segment on two columns at once, the (limited) "version" column and the
             # "response.refusal.is_refusal" column. The version column has to be supplied via the additional_data
             # parameter in the API request. The refusal metric is generated as part of the normal llm validation
             # process because we configured it in the model.171.yaml file.
@@ -97,14 +91,15 @@ whylogs_config: Dict[str, DatasetOptions] = {
                 ),
             ],
             udf_specs=[
-                UdfSpec(
+                vectorized_udf_spec(
                     column_names=[REFUSAL_METRIC_COLUMN],
                     # We're going to use a whylogs UDf to generate a new column based on the refusal metric. Segment's work best
                     # with columns that are constrainted to a set of possible values and our refusal metric is a float, so we're
                     # mapping it into a 0/1 column by rounding the refusal metric value and then we'll include that new mapped column
-                    # in the segment definition.
-                    udfs={MAPPED_REFUSAL_METRIC_COLUMN: refusal_boolean_udf},
-                )
+                    # in the segment definition. The udf is vectorized, so it rounds the whole column at once instead of row by row.
+                    udfs={MAPPED_REFUSAL_METRIC_COLUMN: round_to_int(REFUSAL_METRIC_COLUMN)},
+                ),
+                vectorized_udf_spec(column_names=[VERSION_COLUMN], udfs={LIMITED_VERSION_COLUMN: model_171_version_limiter}),
             ],
         ),
     ),
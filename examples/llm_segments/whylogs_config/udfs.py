@@ -0,0 +1,223 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Set, Union
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+from whylogs_container_types import DatasetUploadCadence, DatasetUploadCadenceGranularity
+
+from whylogs.experimental.core.udf_schema import UdfSpec
+
+logger = logging.getLogger(__name__)
+
+# A vectorized UDF gets a numpy array for each of its input columns and returns an array with one value per row.
+VectorizedUdf = Callable[[Mapping[str, npt.NDArray[Any]]], npt.NDArray[Any]]
+WhylogsUdf = Callable[[Union[pd.DataFrame, Dict[str, List[Any]]]], Any]
+
+
+def vectorized(udf: VectorizedUdf, column_names: Sequence[str]) -> WhylogsUdf:
+    """
+    Adapt a vectorized UDF to the interface whylogs expects. whylogs calls UDFs with either a DataFrame, when a batch is
+    logged, or a dict of single value lists, when a single row is logged. Both are converted to arrays, so the UDF is
+    called once per batch instead of once per row.
+    """
+
+    def udf_adapter(data: Union[pd.DataFrame, Dict[str, List[Any]]]) -> Any:
+        if isinstance(data, pd.DataFrame):
+            result = udf({name: data[name].to_numpy() for name in column_names})
+            # Keep the index so whylogs lines the new column up with the rows that it came from
+            return pd.Series(result, index=data.index)
+        else:
+            result = udf({name: np.asarray(data[name]) for name in column_names})
+            return result.tolist()
+
+    return udf_adapter
+
+
+def vectorized_udf_spec(column_names: List[str], udfs: Dict[str, VectorizedUdf]) -> UdfSpec:
+    """
+    A UdfSpec whose udfs are all vectorized. Each udf gets an array for every one of the `column_names`.
+    """
+    return UdfSpec(column_names=column_names, udfs={name: vectorized(udf, column_names) for name, udf in udfs.items()})
+
+
+def _as_float(values: npt.NDArray[Any]) -> npt.NDArray[np.float64]:
+    # None becomes nan
+    return pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=np.float64)  # pyright: ignore[reportUnknownMemberType]
+
+
+def _with_missing(values: npt.NDArray[Any], missing: npt.NDArray[np.bool_]) -> npt.NDArray[Any]:
+    """
+    Put None back wherever the input was missing, so missing values don't turn into a segment of their own.
+    """
+    if not missing.any():
+        return values
+    with_missing = values.astype(object)
+    with_missing[missing] = None
+    return with_missing
+
+
+def round_to_int(column_name: str) -> VectorizedUdf:
+    """
+    Round a score to the nearest int, e.g. to turn a 0-1 score into a 0/1 segment. Halves round to even, like `round()`.
+    """
+
+    def udf(columns: Mapping[str, npt.NDArray[Any]]) -> npt.NDArray[Any]:
+        values = _as_float(columns[column_name])
+        missing = np.isnan(values)
+        return _with_missing(np.rint(np.where(missing, 0, values)).astype(np.int64), missing)
+
+    return udf
+
+
+def threshold_to_bool(column_name: str, threshold: float, inclusive: bool = True) -> VectorizedUdf:
+    """
+    True when the value is above the threshold, or equal to it if `inclusive`.
+    """
+
+    def udf(columns: Mapping[str, npt.NDArray[Any]]) -> npt.NDArray[Any]:
+        values = _as_float(columns[column_name])
+        above = values >= threshold if inclusive else values > threshold
+        return _with_missing(above, np.isnan(values))
+
+    return udf
+
+
+def bucketize(column_name: str, edges: Sequence[float], labels: Optional[Sequence[str]] = None) -> VectorizedUdf:
+    """
+    Put each value into a bucket between consecutive `edges`. Buckets include their lower edge, and values below the first
+    edge or at or above the last one go into the outer buckets, so there are `len(edges) + 1` of them. They're numbered
+    from 0 unless `labels` are given.
+    """
+    sorted_edges = np.asarray(edges, dtype=np.float64)
+    if np.any(np.diff(sorted_edges) <= 0):
+        raise ValueError(f"Bucket edges must be strictly increasing, got {edges}")
+    if labels is not None and len(labels) != len(edges) + 1:
+        raise ValueError(f"Expected {len(edges) + 1} labels for {len(edges)} edges, got {len(labels)}")
+
+    label_array = np.asarray(labels, dtype=object) if labels is not None else None
+
+    def udf(columns: Mapping[str, npt.NDArray[Any]]) -> npt.NDArray[Any]:
+        values = _as_float(columns[column_name])
+        missing = np.isnan(values)
+        buckets = np.searchsorted(sorted_edges, np.where(missing, 0, values), side="right")
+        return _with_missing(buckets if label_array is None else label_array[buckets], missing)
+
+    return udf
+
+
+_granularity_sec: Dict[DatasetUploadCadenceGranularity, int] = {
+    DatasetUploadCadenceGranularity.MINUTE: 60,
+    DatasetUploadCadenceGranularity.HOUR: 60 * 60,
+    DatasetUploadCadenceGranularity.DAY: 24 * 60 * 60,
+}
+
+
+def upload_window_sec(cadence: DatasetUploadCadence) -> int:
+    return cadence.interval * _granularity_sec[cadence.granularity]
+
+
+class SegmentKeyLimiter:
+    """
+    A vectorized UDF that caps the number of distinct values a segment column can have. Each distinct segment key holds
+    a profile in memory until the next upload, so a client that sends a new `version` with every request would grow the
+    heap without limit. The first `max_keys` distinct values in each upload window pass through and every other value is
+    mapped to `other_key`, so there are at most `max_keys + 1` live segments per window. The folded rows end up in one
+    segment and can't be told apart later, and the first overflow in each window is logged as a warning.
+
+    Windows last as long as the dataset's `upload_cadence`, since that's when the container drops its segment
+    profiles, and start when the limiter is created, along with the container's config. `segment_bytes`, the memory a
+    segment takes up, like the `kb_per_segment` that bench.segment_benchmark measures, turns the live segment count into
+    a memory estimate.
+
+    segment_key_stats() reports limiters by name. Creating a limiter with the name of an existing one replaces it, so
+    reloading the config doesn't fail.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        column_name: str,
+        max_keys: int,
+        upload_cadence: DatasetUploadCadence,
+        other_key: str = "__other__",
+        segment_bytes: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.column_name = column_name
+        self.max_keys = max_keys
+        self.window_sec = upload_window_sec(upload_cadence)
+        self.other_key = other_key
+        self.segment_bytes = segment_bytes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._start = clock()
+        self._window = 0
+        self._admitted: Set[Any] = set()
+        self._overflowed_rows = 0
+        self._peak_live_segments = 0
+
+        with _segment_limiters_lock:
+            _segment_limiters[name] = self
+
+    def _current_window(self) -> int:
+        return int((self._clock() - self._start) // self.window_sec)
+
+    def _live_segments(self) -> int:
+        return len(self._admitted) + (1 if self._overflowed_rows else 0)
+
+    def __call__(self, columns: Mapping[str, npt.NDArray[Any]]) -> npt.NDArray[Any]:
+        values = pd.Series(columns[self.column_name], dtype=object)
+        present = values.notna().to_numpy()
+
+        with self._lock:
+            window = self._current_window()
+            if window != self._window:
+                self._window = window
+                self._admitted = set()
+                self._overflowed_rows = 0
+
+            for key in pd.unique(values[present]).tolist():
+                if key not in self._admitted and len(self._admitted) < self.max_keys:
+                    self._admitted.add(key)
+
+            admitted = values.isin(self._admitted).to_numpy() | ~present
+            overflowed_rows = int((~admitted).sum())
+            if overflowed_rows and not self._overflowed_rows:
+                logger.warning(f"Segment column {self.column_name} of {self.name} has more than {self.max_keys} keys in this upload window")
+            self._overflowed_rows += overflowed_rows
+            self._peak_live_segments = max(self._peak_live_segments, self._live_segments())
+
+        return _with_missing(np.where(admitted, values.to_numpy(), self.other_key), ~present)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Gauges for the current upload window: the segments that are live, the most that have been live in any window,
+        their estimated memory if `segment_bytes` is set, and how many rows were folded into `other_key`.
+        """
+        with self._lock:
+            live_segments = self._live_segments()
+            return {
+                "column": self.column_name,
+                "max_keys": self.max_keys,
+                "live_segments": live_segments,
+                "peak_live_segments": self._peak_live_segments,
+                "estimated_bytes": None if self.segment_bytes is None else live_segments * self.segment_bytes,
+                "overflowed_rows": self._overflowed_rows,
+            }
+
+
+_segment_limiters: Dict[str, SegmentKeyLimiter] = {}
+_segment_limiters_lock = threading.Lock()
+
+
+def segment_key_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Stats for every SegmentKeyLimiter, by name.
+    """
+    with _segment_limiters_lock:
+        limiters = list(_segment_limiters.items())
+    return {name: limiter.stats() for name, limiter in limiters}
@@ -0,0 +1,91 @@
+import io
+from base64 import b64encode
+from typing import Any, Dict, List
+
+import pytest
+from whylogs_container_client.models.status_response import StatusResponse
+
+from tools.profile_export import ProfileHeader, list_profiles, paginate, parse_logger_key, read_profiles, write_profiles
+
+
+def logger_status(views: List[bytes], pending_views: List[bytes]) -> Dict[str, Any]:
+    return {
+        "dataset_timestamps": 1,
+        "dataset_profiles": 1,
+        "segment_caches": 0,
+        "writers": 1,
+        "pending_writables": 0,
+        "views": [b64encode(it).decode() for it in views],
+        "pending_views": [b64encode(it).decode() for it in pending_views],
+    }
+
+
+@pytest.fixture
+def status() -> StatusResponse:
+    return StatusResponse.from_dict(
+        {
+            "version": "2.3.0",
+            "config": {},
+            "whylogs_logger_status": {
+                "org-child2_model-1": logger_status([b"c"], []),
+                "org-child1_model-1": logger_status([b"a1", b"a2"], [b"a3"]),
+                "org-child1_model-2": logger_status([], [b"b"]),
+            },
+        }
+    )
+
+
+def test_parse_logger_key():
+    assert parse_logger_key("org-containerIntegChild1_model-1") == ("org-containerIntegChild1", "model-1")
+    assert parse_logger_key("org-abc_model_with_underscores") == ("org-abc", "model_with_underscores")
+    assert parse_logger_key("model-1") == (None, "model-1")
+
+
+def test_filters(status: StatusResponse):
+    all_profiles = [(it.header.org_id, it.header.dataset_id, it.header.kind, it.decode()) for it in list_profiles(status)]
+    assert all_profiles == [
+        ("org-child1", "model-1", "view", b"a1"),
+        ("org-child1", "model-1", "view", b"a2"),
+        ("org-child1", "model-1", "pending", b"a3"),
+        ("org-child1", "model-2", "pending", b"b"),
+        ("org-child2", "model-1", "view", b"c"),
+    ]
+
+    assert [it.decode() for it in list_profiles(status, dataset_ids=["model-1"], include_pending=False)] == [b"a1", b"a2", b"c"]
+    assert [it.decode() for it in list_profiles(status, org_ids=["org-child2"])] == [b"c"]
+
+
+def test_pages_cover_everything_once(status: StatusResponse):
+    seen: List[bytes] = []
+    token = None
+    pages = 0
+    while True:
+        page = paginate(list_profiles(status), page_size=2, page_token=token)
+        seen.extend(it.decode() for it in page.profiles)
+        pages += 1
+        token = page.next_page_token
+        if token is None:
+            break
+
+    assert pages == 3
+    assert seen == [b"a1", b"a2", b"a3", b"b", b"c"]
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_round_trip(status: StatusResponse, compress: bool):
+    output = io.BytesIO()
+    assert write_profiles(list_profiles(status, org_ids=["org-child1"]), output, compress) == 4
+
+    profiles = list(read_profiles(io.BufferedReader(io.BytesIO(output.getvalue()))))
+
+    assert profiles[0] == (ProfileHeader(org_id="org-child1", dataset_id="model-1", kind="view", index=0), b"a1")
+    assert [payload for _, payload in profiles] == [b"a1", b"a2", b"a3", b"b"]
+    assert profiles[2][0].kind == "pending"
+
+
+def test_truncated_stream(status: StatusResponse):
+    output = io.BytesIO()
+    write_profiles(list_profiles(status), output)
+
+    with pytest.raises(ValueError):
+        list(read_profiles(io.BufferedReader(io.BytesIO(output.getvalue()[:-1]))))
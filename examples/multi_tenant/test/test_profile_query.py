@@ -0,0 +1,77 @@
+from base64 import b64encode
+from typing import Any, Dict, List
+
+import pandas as pd
+import pytest
+from whylogs_container_client.models.status_response import StatusResponse
+
+import whylogs as why
+from tools.profile_query import decoded_size, query, summarize
+
+
+def encoded_view(char_counts: List[int]) -> str:
+    view = why.log(
+        pandas=pd.DataFrame({"prompt.stats.char_count": char_counts, "response.stats.char_count": [1] * len(char_counts)})
+    ).view()
+    return b64encode(view.serialize()).decode()
+
+
+def logger_status(views: List[str], pending_views: List[str]) -> Dict[str, Any]:
+    return {
+        "dataset_timestamps": 1,
+        "dataset_profiles": 1,
+        "segment_caches": 0,
+        "writers": 1,
+        "pending_writables": len(pending_views),
+        "views": views,
+        "pending_views": pending_views,
+    }
+
+
+@pytest.fixture
+def status() -> StatusResponse:
+    return StatusResponse.from_dict(
+        {
+            "version": "2.3.0",
+            "config": {},
+            "whylogs_logger_status": {
+                "org-child1_model-1": logger_status([encoded_view([10, 20])], [encoded_view([5, 50, 7])]),
+                "org-child2_model-1": logger_status([encoded_view([1000])], []),
+            },
+        }
+    )
+
+
+def test_decoded_size():
+    for data in [b"", b"a", b"ab", b"abc", b"abcd"]:
+        assert decoded_size(b64encode(data).decode()) == len(data)
+
+
+def test_summary(status: StatusResponse):
+    summaries = summarize(status)
+    assert [(it.org_id, it.dataset_id, it.views, it.pending_views, it.rows) for it in summaries] == [
+        ("org-child1", "model-1", 1, 1, None),
+        ("org-child2", "model-1", 1, 0, None),
+    ]
+    assert summaries[0].pending_bytes > 0
+    assert summaries[1].pending_bytes == 0
+
+    assert [it.rows for it in summarize(status, count_rows=True)] == [5, 1]
+
+
+def test_query_merges_views(status: StatusResponse):
+    result = query(
+        status, "model-1", columns=["prompt.stats.char_count", "missing"], metrics=["distribution/max", "counts/n"], org_id="org-child1"
+    )
+    assert result == {"prompt.stats.char_count": {"distribution/max": 50.0, "counts/n": 5}}
+
+    without_pending = query(
+        status, "model-1", columns=["prompt.stats.char_count"], metrics=["distribution/max"], org_id="org-child1", include_pending=False
+    )
+    assert without_pending == {"prompt.stats.char_count": {"distribution/max": 20.0}}
+
+    # Without an org, the dataset is merged across orgs
+    assert query(status, "model-1", columns=["prompt.stats.char_count"], metrics=["counts/n"]) == {
+        "prompt.stats.char_count": {"counts/n": 6}
+    }
+    assert query(status, "model-2") == {}
@@ -0,0 +1,200 @@
+"""
+Export the profiles that the container is holding, filtered by org and dataset and one page at a time, as raw protobuf
+instead of the base64 strings that /status returns.
+
+    poetry run python -m tools.profile_export --org org-containerIntegChild1 --dataset model-1 --output profiles.bin
+    poetry run python -m tools.profile_export --page-size 100 --page-token 100 --gzip --output page-2.bin.gz
+
+The output is a sequence of frames, one per profile. Each frame is a 4 byte big endian header length, a json header with
+the org, dataset, kind (view or pending) and index of the profile, an 8 byte big endian payload length and then the
+serialized DatasetProfileView. `read_profiles` reads it back, gzipped or not.
+"""
+
+import argparse
+import gzip
+import json
+import struct
+import sys
+from base64 import b64decode
+from dataclasses import asdict, dataclass
+from typing import BinaryIO, Iterable, Iterator, List, Literal, Optional, Sequence, Tuple
+
+import whylogs_container_client.api.manage.status as Status
+from whylogs_container_client import AuthenticatedClient
+from whylogs_container_client.models.status_response import StatusResponse
+
+ProfileKind = Literal["view", "pending"]
+
+_header_length = struct.Struct(">I")
+_payload_length = struct.Struct(">Q")
+_gzip_magic = b"\x1f\x8b"
+
+
+@dataclass(frozen=True)
+class ProfileHeader:
+    org_id: Optional[str]
+    dataset_id: str
+    kind: ProfileKind
+    index: int
+
+
+@dataclass(frozen=True)
+class ProfileRef:
+    header: ProfileHeader
+    # Still base64 encoded, so nothing is decoded until it's written
+    encoded: str
+
+    def decode(self) -> bytes:
+        return b64decode(self.encoded)
+
+
+@dataclass(frozen=True)
+class Page:
+    profiles: List[ProfileRef]
+    # None on the last page
+    next_page_token: Optional[str]
+
+
+def parse_logger_key(key: str) -> Tuple[Optional[str], str]:
+    """
+    The org and dataset id of a /status logger key. In multi tenant mode the container keys its loggers by
+    `{org_id}_{dataset_id}`, otherwise just by dataset id.
+    """
+    if key.startswith("org-") and "_" in key:
+        org_id, dataset_id = key.split("_", 1)
+        return org_id, dataset_id
+    return None, key
+
+
+def list_profiles(
+    status: StatusResponse,
+    org_ids: Optional[Sequence[str]] = None,
+    dataset_ids: Optional[Sequence[str]] = None,
+    include_pending: bool = True,
+) -> Iterator[ProfileRef]:
+    """
+    Every profile in the status response that matches the filters, in a stable order: by logger key, then views before
+    pending views.
+    """
+    loggers = status.whylogs_logger_status.additional_properties
+    for key in sorted(loggers.keys()):
+        org_id, dataset_id = parse_logger_key(key)
+        if org_ids is not None and org_id not in org_ids:
+            continue
+        if dataset_ids is not None and dataset_id not in dataset_ids:
+            continue
+
+        logger_status = loggers[key]
+        kinds: List[Tuple[ProfileKind, List[str]]] = [("view", logger_status.views)]
+        if include_pending:
+            kinds.append(("pending", logger_status.pending_views))
+
+        for kind, encoded_views in kinds:
+            for index, encoded in enumerate(encoded_views):
+                yield ProfileRef(ProfileHeader(org_id=org_id, dataset_id=dataset_id, kind=kind, index=index), encoded)
+
+
+def paginate(profiles: Iterable[ProfileRef], page_size: int, page_token: Optional[str] = None) -> Page:
+    """
+    One page of profiles. The token is the offset of the page, so pages are only consistent while the container isn't
+    logging or uploading.
+    """
+    if page_size < 1:
+        raise ValueError(f"page_size must be at least 1, got {page_size}")
+
+    offset = int(page_token) if page_token else 0
+    page: List[ProfileRef] = []
+    has_more = False
+    for i, profile in enumerate(profiles):
+        if i < offset:
+            continue
+        if len(page) == page_size:
+            has_more = True
+            break
+        page.append(profile)
+
+    return Page(profiles=page, next_page_token=str(offset + page_size) if has_more else None)
+
+
+def write_profiles(profiles: Iterable[ProfileRef], output: BinaryIO, compress: bool = False) -> int:
+    """
+    Write each profile as a frame, decoding one at a time. Returns the number of profiles written.
+    """
+    stream: BinaryIO = gzip.GzipFile(fileobj=output, mode="wb") if compress else output  # pyright: ignore[reportAssignmentType]
+    count = 0
+    try:
+        for profile in profiles:
+            header = json.dumps(asdict(profile.header)).encode()
+            payload = profile.decode()
+            stream.write(_header_length.pack(len(header)))
+            stream.write(header)
+            stream.write(_payload_length.pack(len(payload)))
+            stream.write(payload)
+            count += 1
+    finally:
+        if compress:
+            stream.close()
+    return count
+
+
+def _read_exactly(stream: BinaryIO, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError(f"Truncated profile stream, expected {size} bytes and got {len(data)}")
+    return data
+
+
+def read_profiles(stream: BinaryIO) -> Iterator[Tuple[ProfileHeader, bytes]]:
+    """
+    Read back what `write_profiles` wrote, one profile at a time. Each payload can be loaded with
+    `DatasetProfileView.deserialize`.
+    """
+    start = stream.peek(2)[:2] if hasattr(stream, "peek") else b""  # pyright: ignore[reportAttributeAccessIssue, reportUnknownMemberType]
+    if start == _gzip_magic:
+        stream = gzip.GzipFile(fileobj=stream, mode="rb")  # pyright: ignore[reportAssignmentType]
+
+    while True:
+        prefix = stream.read(_header_length.size)
+        if not prefix:
+            return
+        (header_size,) = _header_length.unpack(prefix)
+        header = ProfileHeader(**json.loads(_read_exactly(stream, header_size)))
+        (payload_size,) = _payload_length.unpack(_read_exactly(stream, _payload_length.size))
+        yield header, _read_exactly(stream, payload_size)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--token", default="password", help="The container password, or an org's api key in multi tenant mode")
+    parser.add_argument("--org", nargs="+", dest="org_ids", help="Only export these orgs")
+    parser.add_argument("--dataset", nargs="+", dest="dataset_ids", help="Only export these datasets")
+    parser.add_argument("--no-pending", dest="include_pending", action="store_false", help="Skip profiles that haven't been merged yet")
+    parser.add_argument("--page-size", type=int, help="Export this many profiles at most")
+    parser.add_argument("--page-token", help="The next_page_token printed by the previous page")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--output", help="Defaults to stdout")
+    args = parser.parse_args()
+
+    client = AuthenticatedClient(base_url=args.url, token=args.token, prefix="", auth_header_name="X-API-Key")  # pyright: ignore[reportGeneralTypeIssues]
+    response = Status.sync_detailed(client=client)
+    if not isinstance(response.parsed, StatusResponse):
+        raise Exception(f"Failed to get the status. Status code: {response.status_code}. {response.parsed}")
+
+    profiles: Iterable[ProfileRef] = list_profiles(response.parsed, args.org_ids, args.dataset_ids, args.include_pending)
+    next_page_token: Optional[str] = None
+    if args.page_size is not None:
+        page = paginate(profiles, args.page_size, args.page_token)
+        profiles, next_page_token = page.profiles, page.next_page_token
+
+    if args.output:
+        with open(args.output, "wb") as f:
+            count = write_profiles(profiles, f, args.gzip)
+    else:
+        count = write_profiles(profiles, sys.stdout.buffer, args.gzip)
+
+    print(json.dumps({"profiles": count, "next_page_token": next_page_token}), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
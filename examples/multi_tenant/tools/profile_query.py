@@ -0,0 +1,169 @@
+"""
+Summaries and merged queries over the profiles that the container is holding, so probes and dashboards don't have to
+deserialize every profile themselves.
+
+    poetry run python -m tools.profile_query summary
+    poetry run python -m tools.profile_query summary --rows
+    poetry run python -m tools.profile_query query --dataset model-1 --column prompt.stats.char_count --metric distribution/max counts/n
+"""
+
+import argparse
+import json
+from dataclasses import asdict, dataclass
+from functools import reduce
+from typing import Any, Dict, List, Optional, Sequence
+
+import whylogs_container_client.api.manage.status as Status
+from whylogs_container_client import AuthenticatedClient
+from whylogs_container_client.models.status_response import StatusResponse
+
+from whylogs.core.metrics.column_metrics import ColumnCountsMetric
+from whylogs.core.view.dataset_profile_view import DatasetProfileView
+
+from .profile_export import ProfileRef, list_profiles, parse_logger_key
+
+
+@dataclass(frozen=True)
+class DatasetSummary:
+    org_id: Optional[str]
+    dataset_id: str
+    views: int
+    pending_views: int
+    view_bytes: int
+    pending_bytes: int
+    dataset_profiles: int
+    segment_caches: int
+    pending_writables: int
+    # Only counted on request, since it means deserializing every profile
+    rows: Optional[int] = None
+
+
+def decoded_size(encoded: str) -> int:
+    """
+    The size of base64 encoded data, without decoding it.
+    """
+    return len(encoded) * 3 // 4 - (len(encoded) - len(encoded.rstrip("=")))
+
+
+def row_count(view: DatasetProfileView) -> int:
+    """
+    The number of rows a profile has seen, which is the largest count of any of its columns.
+    """
+    counts = [column.get_metric(ColumnCountsMetric.get_namespace()) for column in view.get_columns().values()]
+    return max((int(metric.n.value) for metric in counts if isinstance(metric, ColumnCountsMetric)), default=0)
+
+
+def _deserialize(profile: ProfileRef) -> DatasetProfileView:
+    return DatasetProfileView.deserialize(profile.decode())
+
+
+def summarize(status: StatusResponse, count_rows: bool = False) -> List[DatasetSummary]:
+    """
+    Counts and sizes for every dataset in the status response. Only `count_rows` needs to deserialize the profiles.
+    """
+    summaries: List[DatasetSummary] = []
+    loggers = status.whylogs_logger_status.additional_properties
+    for key in sorted(loggers.keys()):
+        org_id, dataset_id = parse_logger_key(key)
+        logger_status = loggers[key]
+        rows: Optional[int] = None
+        if count_rows:
+            profiles = list_profiles(status, org_ids=[org_id] if org_id else None, dataset_ids=[dataset_id])
+            rows = sum(row_count(_deserialize(it)) for it in profiles if it.header.org_id == org_id)
+
+        summaries.append(
+            DatasetSummary(
+                org_id=org_id,
+                dataset_id=dataset_id,
+                views=len(logger_status.views),
+                pending_views=len(logger_status.pending_views),
+                view_bytes=sum(decoded_size(it) for it in logger_status.views),
+                pending_bytes=sum(decoded_size(it) for it in logger_status.pending_views),
+                dataset_profiles=logger_status.dataset_profiles,
+                segment_caches=logger_status.segment_caches,
+                pending_writables=logger_status.pending_writables,
+                rows=rows,
+            )
+        )
+    return summaries
+
+
+def merged_view(
+    status: StatusResponse, dataset_id: str, org_id: Optional[str] = None, include_pending: bool = True
+) -> Optional[DatasetProfileView]:
+    """
+    All of a dataset's profiles merged into one, or None if it doesn't have any. Without an `org_id` the dataset's
+    profiles from every org are merged.
+    """
+    views = [
+        _deserialize(it)
+        for it in list_profiles(status, org_ids=[org_id] if org_id else None, dataset_ids=[dataset_id], include_pending=include_pending)
+    ]
+    if not views:
+        return None
+    return reduce(lambda merged, view: merged.merge(view), views)
+
+
+def query(
+    status: StatusResponse,
+    dataset_id: str,
+    columns: Optional[Sequence[str]] = None,
+    metrics: Optional[Sequence[str]] = None,
+    org_id: Optional[str] = None,
+    include_pending: bool = True,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Metric values from the dataset's merged profile, by column and then metric, e.g. `{"prompt.stats.char_count":
+    {"distribution/max": 120.0}}`. `columns` and `metrics` default to all of them. Columns and metrics that the profile
+    doesn't have are left out.
+    """
+    view = merged_view(status, dataset_id, org_id, include_pending)
+    if view is None:
+        return {}
+
+    df = view.to_pandas()
+    selected_columns = [it for it in columns if it in df.index] if columns is not None else df.index.tolist()
+    selected_metrics = [it for it in metrics if it in df.columns] if metrics is not None else df.columns.tolist()
+    selected = df.loc[selected_columns, selected_metrics]  # pyright: ignore[reportUnknownMemberType]
+
+    return {
+        column: {metric: None if _is_missing(value) else value for metric, value in row.items()}  # pyright: ignore[reportUnknownVariableType]
+        for column, row in selected.to_dict(orient="index").items()  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
+    }
+
+
+def _is_missing(value: Any) -> bool:
+    return isinstance(value, float) and value != value
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--token", default="password", help="The container password, or an org's api key in multi tenant mode")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    summary_parser = commands.add_parser("summary", help="Counts and sizes for every dataset")
+    summary_parser.add_argument("--rows", action="store_true", help="Also count rows, which deserializes every profile")
+
+    query_parser = commands.add_parser("query", help="Metrics from a dataset's merged profile")
+    query_parser.add_argument("--dataset", required=True)
+    query_parser.add_argument("--org")
+    query_parser.add_argument("--column", nargs="+", dest="columns")
+    query_parser.add_argument("--metric", nargs="+", dest="metrics", help="e.g. distribution/max counts/n")
+    query_parser.add_argument("--no-pending", dest="include_pending", action="store_false")
+    args = parser.parse_args()
+
+    client = AuthenticatedClient(base_url=args.url, token=args.token, prefix="", auth_header_name="X-API-Key")  # pyright: ignore[reportGeneralTypeIssues]
+    response = Status.sync_detailed(client=client)
+    if not isinstance(response.parsed, StatusResponse):
+        raise Exception(f"Failed to get the status. Status code: {response.status_code}. {response.parsed}")
+
+    if args.command == "summary":
+        print(json.dumps([asdict(it) for it in summarize(response.parsed, args.rows)], indent=2))
+    else:
+        result = query(response.parsed, args.dataset, args.columns, args.metrics, args.org, args.include_pending)
+        print(json.dumps(result, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()